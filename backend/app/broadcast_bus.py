@@ -0,0 +1,202 @@
+"""
+=======================================================================
+broadcast_bus.py - Διανομή Αλλαγών σε ΟΛΑ τα API Processes (Redis Pub/Sub)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Κάθε αλλαγή θέσης που πρέπει να φτάσει στους browsers περνά από εδώ.
+    - WS_BROADCAST_BUS=local: απευθείας στον websocket_broadcaster του
+      ίδιου process (ένας uvicorn worker - όπως πριν)
+    - WS_BROADCAST_BUS=redis: δημοσιεύεται στο Redis κανάλι "spots:updates"
+      και ΚΑΘΕ API worker (σε οποιοδήποτε host) τη στέλνει στους δικούς
+      του WebSocket clients
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Οι WebSocket συνδέσεις ζουν στη μνήμη του worker που τις δέχτηκε.
+    Με πολλούς uvicorn workers (ή INGEST_MODE=external, όπου τα μηνύματα
+    τα επεξεργάζεται άλλο process) μόνο οι clients του process που
+    επεξεργάστηκε το MQTT μήνυμα έβλεπαν την αλλαγή.
+
+ΕΝΑ PUBLISH ΑΝΑ ΟΜΑΔΑ:
+    Οι αλλαγές που δημοσιεύονται στον ίδιο "γύρο" του event loop (π.χ.
+    όλες οι αλλαγές ενός apply_status_transitions) μαζεύονται και
+    στέλνονται με ΕΝΑ PUBLISH. Κάθε αλλαγή κουβαλά και ό,τι χρειάζεται
+    για τη δρομολόγηση (συντεταγμένες, κανάλια), ώστε ο worker που τη
+    λαμβάνει να μη χρειάζεται το δικό του μητρώο θέσεων.
+
+ΑΡΙΘΜΟΣ ΣΕΙΡΑΣ (seq):
+    Εδώ κάθε αλλαγή παίρνει τον αύξοντα αριθμό "seq" που χρησιμοποιούν οι
+    clients για να συνεχίσουν μετά από επανασύνδεση (βλ. websocket_broadcaster.py).
+    - local: απλός μετρητής του process
+    - redis: INCRBY στο "spots:updates:seq" μία φορά ανά PUBLISH, ώστε όλοι
+      οι workers να βλέπουν την ΙΔΙΑ αρίθμηση. INCRBY και PUBLISH γίνονται
+      σε ΕΝΑ Lua script: το Redis εκτελεί τα scripts ένα-ένα, άρα με πολλούς
+      publishers τα μηνύματα φτάνουν με τη σειρά των seq (αλλιώς ένα
+      μικρότερο seq θα μπορούσε να φτάσει μετά από μεγαλύτερο και να χαθεί
+      για τους clients, που κρατούν μόνο το μεγαλύτερο)
+
+ΣΗΜΕΙΩΣΗ:
+    Το Redis pub/sub είναι "fire and forget": ένας worker που ήταν
+    αποσυνδεδεμένος από το Redis χάνει ό,τι δημοσιεύτηκε στο μεταξύ.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py και parking_repository.py (publish_spot_status),
+    websocket_broadcaster.py, main.py (run), config.py
+=======================================================================
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.database import redis_client
+from app.websocket_broadcaster import spot_channels, websocket_broadcaster
+
+logger = logging.getLogger(__name__)
+
+# Το Redis κανάλι όπου δημοσιεύονται οι ομάδες αλλαγών
+BUS_CHANNEL = "spots:updates"
+# Ο κοινός μετρητής seq (mode=redis)
+SEQ_KEY = "spots:updates:seq"
+
+# Ατομικό "δέσμευσε seq και δημοσίευσε" (ARGV[1] = κανάλι, ARGV[2] = πλήθος,
+# ARGV[3] = οι αλλαγές σε JSON). Το μήνυμα κουβαλά το τελευταίο seq της
+# ομάδας - η αλλαγή i παίρνει last - πλήθος + 1 + i.
+_PUBLISH_SCRIPT = """
+local last = redis.call('INCRBY', KEYS[1], ARGV[2])
+redis.call('PUBLISH', ARGV[1], '{"last":' .. last .. ',"items":' .. ARGV[3] .. '}')
+return last
+"""
+
+
+class BroadcastBus:
+    """
+    Δημοσιεύει αλλαγές θέσεων (τοπικά ή μέσω Redis pub/sub) και, σε
+    κάθε API worker, τις παραδίδει στον τοπικό websocket_broadcaster.
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        """ΠΑΡΑΜΕΤΡΟΙ: mode - "local" ή "redis" (None = WS_BROADCAST_BUS)"""
+        self.mode = settings.WS_BROADCAST_BUS if mode is None else mode
+
+        # Αλλαγές που περιμένουν το επόμενο PUBLISH (μόνο mode=redis)
+        self._outgoing: List[Dict] = []
+        self._flush_scheduled = False
+        self._publishing: Set[asyncio.Task] = set()
+
+        # Μετρητής seq (μόνο mode=local - στο redis τον κρατά το Redis)
+        self._seq = 0
+        self._publish_script = redis_client.register_script(_PUBLISH_SCRIPT) if self.mode == "redis" else None
+
+        # Μετρικές
+        self.published_batches = 0   # PUBLISH που έγιναν
+        self.published_updates = 0   # Αλλαγές σε αυτά
+        self.received_batches = 0    # Ομάδες που λάβαμε από το Redis
+        self.publish_failures = 0
+
+    def publish(self, update: Dict, location: Optional[Tuple[float, float]] = None,
+                channels: Iterable[str] = ()):
+        """
+        ΤΙ ΚΑΝΕΙ: Στέλνει μια αλλαγή θέσης στους browsers (όλων των workers).
+        ΠΑΡΑΜΕΤΡΟΙ: ίδιες με το WebSocketBroadcaster.publish()
+        ΣΗΜΕΙΩΣΗ: Δεν περιμένει το Redis - το PUBLISH γίνεται στο παρασκήνιο.
+        """
+        if self.mode != "redis":
+            self._seq += 1
+            update["seq"] = self._seq
+            websocket_broadcaster.publish(update, location, channels)
+            return
+        self._outgoing.append({
+            "update": update,
+            "location": list(location) if location else None,
+            "channels": list(channels),
+        })
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._start_flush)
+
+    def publish_spot_status(self, spot_id: int, status: str, city: Optional[str], area: Optional[str] = None,
+                            location: Optional[Tuple[float, float]] = None, timestamp: Optional[str] = None):
+        """
+        ΤΙ ΚΑΝΕΙ: Η αλλαγή κατάστασης μιας θέσης στη μορφή που περιμένουν οι
+                   browsers - ΙΔΙΑ για ΚΑΘΕ πηγή (αισθητήρες, κρατήσεις, admin).
+        ΠΑΡΑΜΕΤΡΟΙ:
+            spot_id, status, city, area: η θέση και η νέα της κατάσταση
+            location: (lat, lng) για τα viewports (None = άγνωστη)
+            timestamp: ISO χρόνος αλλαγής (None = τώρα)
+        """
+        update = {
+            "spot_id": spot_id,          # Ποια θέση άλλαξε
+            "status": status,            # Νέα κατάσταση
+            "city": city,                # Πόλη
+            "timestamp": timestamp or datetime.now().isoformat(),  # Πότε συνέβη
+        }
+        self.publish(update, location=location, channels=spot_channels(city, area))
+
+    def _start_flush(self):
+        """ΤΙ ΚΑΝΕΙ: Στο τέλος του τρέχοντος γύρου: ΕΝΑ PUBLISH για όλες τις αλλαγές."""
+        self._flush_scheduled = False
+        batch, self._outgoing = self._outgoing, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._publish_batch(batch), name="broadcast_bus_publish")
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _publish_batch(self, batch: List[Dict]):
+        try:
+            # len(batch) συνεχόμενα seq και PUBLISH σε ΕΝΑ ατομικό βήμα
+            await self._publish_script(
+                keys=[SEQ_KEY], args=[BUS_CHANNEL, len(batch), json.dumps(batch, separators=(",", ":"))]
+            )
+            self.published_batches += 1
+            self.published_updates += len(batch)
+        except Exception as e:
+            self.publish_failures += 1
+            logger.error(f"Failed to publish {len(batch)} spot updates to Redis: {e}")
+
+    async def run(self):
+        """
+        ΤΙ ΚΑΝΕΙ: (μόνο mode=redis) Ακούει το κανάλι "spots:updates" και
+                   δίνει κάθε αλλαγή στον τοπικό websocket_broadcaster.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py ως supervised task σε κάθε API worker.
+        """
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(BUS_CHANNEL)
+            logger.info(f"Relaying spot updates from Redis channel {BUS_CHANNEL}")
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    payload = json.loads(message["data"])
+                    batch, last = payload["items"], int(payload["last"])
+                except (TypeError, ValueError, KeyError):
+                    logger.warning("Ignoring malformed broadcast bus message")
+                    continue
+                self.received_batches += 1
+                for offset, item in enumerate(batch):
+                    item["update"]["seq"] = last - len(batch) + 1 + offset
+                    location = item.get("location")
+                    websocket_broadcaster.publish(
+                        item["update"], tuple(location) if location else None, item.get("channels") or ()
+                    )
+        finally:
+            await pubsub.reset()
+
+    def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        return {
+            "mode": self.mode,
+            "published_batches": self.published_batches,
+            "published_updates": self.published_updates,
+            "received_batches": self.received_batches,
+            "publish_failures": self.publish_failures,
+        }
+
+
+# Ένα instance ανά process (API worker ή ingest worker)
+broadcast_bus = BroadcastBus()
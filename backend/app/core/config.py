@@ -8,6 +8,8 @@ config.py - Ρυθμίσεις Ασφαλείας της Εφαρμογής
     την εφαρμογή. Κυρίως χρησιμοποιείται για τα JWT tokens, δηλαδή
     τα "ψηφιακά εισιτήρια" που αποδεικνύουν ότι ένας χρήστης είναι
     συνδεδεμένος.
+    Κρατάει επίσης τις ρυθμίσεις της ροής δεδομένων αισθητήρων
+    (MQTT ingestion), π.χ. πότε γίνεται η ομαδική αποθήκευση.
 
 ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
     Κεντρικό σημείο για να αλλάζουμε ρυθμίσεις χωρίς να ψάχνουμε
@@ -16,9 +18,11 @@ config.py - Ρυθμίσεις Ασφαλείας της Εφαρμογής
 ΠΟΤΕ ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ:
     - Στο security.py: για να δημιουργεί και να επαληθεύει JWT tokens
     - Στο deps.py: για να διαβάζει τo SECRET_KEY
+    - Στο spot_batch_writer.py: για τα όρια του adaptive flush
+    - Στο mqtt_consumer.py / ingest_worker.py: σύνδεση MQTT, τρόπος ingestion
 
 ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
-    security.py, deps.py
+    security.py, deps.py, spot_batch_writer.py, mqtt_consumer.py
 =======================================================================
 """
 
@@ -54,6 +58,171 @@ class Settings:
     # Δηλαδή ο χρήστης παραμένει συνδεδεμένος για μία εβδομάδα.
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 1 εβδομάδα
 
+    # -------------------------------------------------------------------
+    # ΡΥΘΜΙΣΕΙΣ ΟΜΑΔΙΚΗΣ ΑΠΟΘΗΚΕΥΣΗΣ (ADAPTIVE FLUSH)
+    # -------------------------------------------------------------------
+    # Οι εκκρεμείς αλλαγές (pending updates) αποθηκεύονται στη βάση/Redis
+    # όταν ισχύσει ΟΠΟΙΟ από τα δύο συμβεί πρώτο:
+    # - Μαζεύτηκαν MQTT_BATCH_MAX_SIZE διαφορετικές θέσεις (υψηλό φορτίο)
+    # - Πέρασαν MQTT_BATCH_MAX_DELAY_MS ms από την ΠΡΩΤΗ εκκρεμή αλλαγή
+    #   (χαμηλό φορτίο - δεν περιμένουμε άσκοπα)
+    MQTT_BATCH_MAX_SIZE: int = int(os.getenv("MQTT_BATCH_MAX_SIZE", "500"))
+    MQTT_BATCH_MAX_DELAY_MS: int = int(os.getenv("MQTT_BATCH_MAX_DELAY_MS", "1000"))
+
+    # SHUTDOWN_DRAIN_TIMEOUT_S: κατά τον τερματισμό, πόσο περιμένουμε να
+    # επεξεργαστεί η ουρά μηνυμάτων και να αποθηκευτούν οι εκκρεμείς αλλαγές.
+    # Με ομαλό τερματισμό μπορούμε να έχουμε μεγαλύτερο MQTT_BATCH_MAX_DELAY_MS
+    # χωρίς να χάνουμε δεδομένα σε κάθε deploy.
+    SHUTDOWN_DRAIN_TIMEOUT_S: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT_S", "10"))
+
+    # INGEST_JOURNAL_DIR: φάκελος για το journal των εκκρεμών αλλαγών ("" = χωρίς).
+    # Ένας φάκελος ΑΝΑ process. Με journal μπορούμε να ανεβάσουμε με ασφάλεια
+    # τα MQTT_BATCH_MAX_SIZE / MQTT_BATCH_MAX_DELAY_MS.
+    INGEST_JOURNAL_DIR: str = os.getenv("INGEST_JOURNAL_DIR", "")
+    # Μέγιστο διάστημα (ms) ανάμεσα σε δύο fsync του journal
+    INGEST_JOURNAL_FSYNC_MS: int = int(os.getenv("INGEST_JOURNAL_FSYNC_MS", "100"))
+
+    # -------------------------------------------------------------------
+    # ΡΥΘΜΙΣΕΙΣ ΣΥΝΔΕΣΗΣ MQTT ΚΑΙ ΟΡΙΖΟΝΤΙΑΣ ΚΛΙΜΑΚΩΣΗΣ
+    # -------------------------------------------------------------------
+    # Διεύθυνση του Mosquitto broker ("mosquitto" = όνομα service στο docker-compose)
+    MQTT_HOST: str = os.getenv("MQTT_HOST", "mosquitto")
+    MQTT_PORT: int = int(os.getenv("MQTT_PORT", "1883"))
+
+    # MQTT_CLIENT: ποια βιβλιοθήκη λαμβάνει τα μηνύματα
+    # - "paho": network thread + call_soon_threadsafe ανά μήνυμα (προεπιλογή)
+    # - "aiomqtt": μέσα στο event loop, με ομαδικό "άδειασμα" έως
+    #   MQTT_NATIVE_DRAIN_MAX μηνυμάτων τη φορά (βλ. mqtt_native_client.py)
+    MQTT_CLIENT: str = os.getenv("MQTT_CLIENT", "paho")
+    MQTT_NATIVE_DRAIN_MAX: int = int(os.getenv("MQTT_NATIVE_DRAIN_MAX", "500"))
+    # Αναμονή (s) πριν από νέα προσπάθεια σύνδεσης του aiomqtt client
+    MQTT_RECONNECT_DELAY_S: float = float(os.getenv("MQTT_RECONNECT_DELAY_S", "5"))
+
+    # INGEST_MODE: ποιος επεξεργάζεται τα μηνύματα των αισθητήρων
+    # - "embedded": το ίδιο το API process (uvicorn) - για 1 worker / development
+    # - "external": ΜΟΝΟ τα ξεχωριστά ingestion processes (python -m app.ingest_worker).
+    #   Έτσι πολλοί uvicorn workers ΔΕΝ επεξεργάζονται το ίδιο μήνυμα N φορές.
+    INGEST_MODE: str = os.getenv("INGEST_MODE", "embedded")
+
+    # MQTT_SHARED_GROUP: αν οριστεί, η εγγραφή γίνεται ως MQTT v5 shared subscription
+    # ("$share/<group>/parking/<city>/+/status"). Ο broker μοιράζει τα μηνύματα
+    # ανάμεσα στα processes της ομάδας - κάθε μήνυμα πάει σε ΕΝΑ μόνο process.
+    MQTT_SHARED_GROUP: str = os.getenv("MQTT_SHARED_GROUP", "")
+
+    # MQTT_QOS: QoS των εγγραφών. 1 = "τουλάχιστον μία φορά" (ο broker ξαναστέλνει
+    # ό,τι δεν επιβεβαιώθηκε - δεν χάνονται μηνύματα υπό πίεση, αλλά έρχονται
+    # διπλότυπα). 0 = "το πολύ μία φορά" (ό,τι χαθεί, χάθηκε).
+    MQTT_QOS: int = int(os.getenv("MQTT_QOS", "1"))
+    # MQTT_DEDUPE_WINDOW: πόσα πρόσφατα μηνύματα θυμόμαστε για να αναγνωρίζουμε
+    # τις επαναποστολές του QoS 1 (0 = χωρίς έλεγχο διπλοτύπων)
+    # MQTT_DEDUPE_TTL_S: για πόσα δευτερόλεπτα ένα ίδιο μήνυμα (topic + payload)
+    # θεωρείται επαναποστολή
+    MQTT_DEDUPE_WINDOW: int = int(os.getenv("MQTT_DEDUPE_WINDOW", "10000"))
+    MQTT_DEDUPE_TTL_S: float = float(os.getenv("MQTT_DEDUPE_TTL_S", "60"))
+    # MQTT_CLIENT_ID: σταθερό client id → ο broker κρατά τη συνεδρία (persistent
+    # session) και ξαναστέλνει τα QoS 1 μηνύματα που χάθηκαν σε αποσύνδεση ή
+    # επανεκκίνηση. Πρέπει να είναι ΜΟΝΑΔΙΚΟ ανά process.
+    # Κενό = τυχαίο id, clean session (ό,τι στάλθηκε όσο ήμασταν εκτός, χάνεται)
+    # MQTT_SESSION_EXPIRY_S: (MQTT v5) πόσο κρατά ο broker τη συνεδρία μετά την αποσύνδεση
+    MQTT_CLIENT_ID: str = os.getenv("MQTT_CLIENT_ID", "")
+    MQTT_SESSION_EXPIRY_S: int = int(os.getenv("MQTT_SESSION_EXPIRY_S", "3600"))
+
+    # SENSOR_DEBOUNCE_MS: μια νέα κατάσταση αισθητήρα εφαρμόζεται μόνο αν
+    # μείνει σταθερή τόσα ms (0 = απενεργοποιημένο). Η "Maintenance" εξαιρείται.
+    SENSOR_DEBOUNCE_MS: int = int(os.getenv("SENSOR_DEBOUNCE_MS", "0"))
+
+    # SENSOR_MAX_CLOCK_SKEW_MS: "ts" αισθητήρα πιο μπροστά από το ρολόι μας
+    # από αυτό το όριο θεωρείται λάθος ρολόι και αγνοείται (αλλιώς ένα
+    # μελλοντικό ts θα έκανε "παλιά" όλα τα επόμενα μηνύματα της θέσης)
+    SENSOR_MAX_CLOCK_SKEW_MS: int = int(os.getenv("SENSOR_MAX_CLOCK_SKEW_MS", "300000"))
+
+    # SENSOR_STALE_AFTER_S: αισθητήρας που δεν έστειλε τίποτα τόσα δευτερόλεπτα
+    # θεωρείται "σιωπηλός" και η θέση του γίνεται SENSOR_STALE_STATUS
+    # (0 = ανενεργό - default, ενεργοποιείται ρητά π.χ. με 900)
+    # SENSOR_STALE_SWEEP_S: κάθε πόσα δευτερόλεπτα ψάχνουμε για σιωπηλούς αισθητήρες
+    SENSOR_STALE_AFTER_S: int = int(os.getenv("SENSOR_STALE_AFTER_S", "0"))
+    SENSOR_STALE_STATUS: str = os.getenv("SENSOR_STALE_STATUS", "Maintenance")
+    SENSOR_STALE_SWEEP_S: int = int(os.getenv("SENSOR_STALE_SWEEP_S", "10"))
+
+    # SPOT_REGISTRY_REFRESH_S: κάθε πόσα δευτερόλεπτα ο consumer ξαναφορτώνει
+    # το μητρώο γνωστών θέσεων από τη βάση (0 = μόνο κατά την εκκίνηση)
+    SPOT_REGISTRY_REFRESH_S: int = int(os.getenv("SPOT_REGISTRY_REFRESH_S", "60"))
+
+    # -------------------------------------------------------------------
+    # REDIS STREAMS BUFFER (ανάμεσα σε λήψη MQTT και αποθήκευση)
+    # -------------------------------------------------------------------
+    # INGEST_BUFFER: πού μπαίνουν τα έγκυρα μηνύματα πριν την αποθήκευση
+    # - "memory": στο pending dict του process (χάνεται σε crash)
+    # - "redis_stream": σε Redis Stream - τα διαβάζουν persistence workers
+    #   μέσω consumer group (XREADGROUP/XACK) και συνεχίζουν μετά από crash
+    INGEST_BUFFER: str = os.getenv("INGEST_BUFFER", "memory")
+    INGEST_STREAM_KEY: str = os.getenv("INGEST_STREAM_KEY", "sensor:events")
+    INGEST_STREAM_GROUP: str = os.getenv("INGEST_STREAM_GROUP", "persisters")
+    # Μέγιστο (περίπου) μήκος του stream - τα παλαιότερα events κόβονται (MAXLEN ~)
+    INGEST_STREAM_MAXLEN: int = int(os.getenv("INGEST_STREAM_MAXLEN", "1000000"))
+    # Μετά από πόσα ms ένα event που διάβασε worker χωρίς XACK θεωρείται
+    # "ορφανό" (ο worker έπεσε) και το αναλαμβάνει άλλος (XAUTOCLAIM)
+    INGEST_STREAM_CLAIM_IDLE_MS: int = int(os.getenv("INGEST_STREAM_CLAIM_IDLE_MS", "60000"))
+
+    # -------------------------------------------------------------------
+    # HTTP BULK INGEST (POST /api/ingest/events)
+    # -------------------------------------------------------------------
+    # Μέγιστο μέγεθος σώματος ενός request (bytes) - μεγαλύτερα → 413
+    INGEST_HTTP_MAX_BYTES: int = int(os.getenv("INGEST_HTTP_MAX_BYTES", str(16 * 1024 * 1024)))
+    # Πόσα events περνούν στη ροή επεξεργασίας κάθε φορά (ώστε ένα τεράστιο
+    # request να μην "παγώνει" το event loop για τους υπόλοιπους)
+    INGEST_HTTP_CHUNK_SIZE: int = int(os.getenv("INGEST_HTTP_CHUNK_SIZE", "1000"))
+
+    # --- WebSocket broadcast (websocket_broadcaster.py) ---
+    # WS_SEND_QUEUE_SIZE: πόσα μηνύματα περιμένουν το πολύ για κάθε client.
+    # Αν γεμίσει, ο client είναι πολύ αργός και αποσυνδέεται (ξανασυνδέεται
+    # και φορτώνει από την αρχή) αντί να καθυστερεί όλους τους άλλους.
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    # WS_SEND_TIMEOUT_S: μέγιστος χρόνος για την αποστολή ενός μηνύματος
+    WS_SEND_TIMEOUT_S: float = float(os.getenv("WS_SEND_TIMEOUT_S", "5"))
+    # WS_BATCH_WINDOW_MS: οι αλλαγές αυτού του παραθύρου στέλνονται μαζί σε
+    # ΕΝΑ frame "spot_updates" ανά client (0 = κάθε αλλαγή αμέσως, "spot_update")
+    WS_BATCH_WINDOW_MS: int = int(os.getenv("WS_BATCH_WINDOW_MS", "100"))
+    # WS_BROADCAST_BUS: πώς φτάνουν οι αλλαγές στους WebSocket clients
+    # - "local": μόνο στους clients του ίδιου process (ένας uvicorn worker)
+    # - "redis": μέσω Redis pub/sub σε ΟΛΟΥΣ τους API workers (πολλοί workers,
+    #   INGEST_MODE=external) - βλ. broadcast_bus.py
+    WS_BROADCAST_BUS: str = os.getenv("WS_BROADCAST_BUS", "local")
+    # WS_REPLAY_BUFFER_SIZE: πόσες τελευταίες αλλαγές (με τον αριθμό "seq"
+    # τους) κρατιούνται ώστε ένας client που ξανασυνδέθηκε να λάβει μόνο όσες
+    # έχασε - με μεγαλύτερο κενό ξαναφορτώνει όλη την κατάσταση
+    WS_REPLAY_BUFFER_SIZE: int = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "10000"))
+    # WS_PING_INTERVAL_S: κάθε πόσο στέλνεται {"type": "ping"} σε όλους τους clients
+    # WS_PING_TIMEOUT_S: client που δεν έστειλε τίποτα (π.χ. "pong") για τόσο
+    # χρόνο θεωρείται νεκρός και η σύνδεση κλείνει
+    WS_PING_INTERVAL_S: float = float(os.getenv("WS_PING_INTERVAL_S", "20"))
+    WS_PING_TIMEOUT_S: float = float(os.getenv("WS_PING_TIMEOUT_S", "60"))
+    # Όρια συνδέσεων ανά process (0 = χωρίς όριο): συνολικά, ανά IP και ανά
+    # χρήστη (ο χρήστης αναγνωρίζεται από το ?token=<JWT> του /ws).
+    # Ανά IP: ανενεργό εξ ορισμού - πίσω από proxy/NAT όλοι οι θεατές έχουν
+    # την ίδια διεύθυνση. Αν ενεργοποιηθεί πίσω από proxy, ο uvicorn πρέπει να
+    # τρέχει με --proxy-headers --forwarded-allow-ips=<proxy> (X-Forwarded-For)
+    WS_MAX_CONNECTIONS: int = int(os.getenv("WS_MAX_CONNECTIONS", "50000"))
+    WS_MAX_CONNECTIONS_PER_IP: int = int(os.getenv("WS_MAX_CONNECTIONS_PER_IP", "0"))
+    WS_MAX_CONNECTIONS_PER_USER: int = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "10"))
+    # WS_GRID_CELL_DEG: μέγεθος κελιού (μοίρες) του ευρετηρίου viewports -
+    # κάθε αλλαγή στέλνεται μόνο σε clients που "βλέπουν" τη θέση
+    # WS_VIEWPORT_MAX_CELLS: viewport που καλύπτει περισσότερα κελιά (μικρό
+    # zoom) ελέγχεται απευθείας αντί να μπει σε όλα αυτά τα κελιά
+    WS_GRID_CELL_DEG: float = float(os.getenv("WS_GRID_CELL_DEG", "0.02"))
+    WS_VIEWPORT_MAX_CELLS: int = int(os.getenv("WS_VIEWPORT_MAX_CELLS", "400"))
+
+    # -------------------------------------------------------------------
+    # ΛΗΞΗ ΚΡΑΤΗΣΕΩΝ (reservation_expiry.py)
+    # -------------------------------------------------------------------
+    # Κάθε πόσα δευτερόλεπτα ελέγχεται το Redis ZSET "reservations:expiry"
+    RESERVATION_EXPIRY_POLL_S: float = float(os.getenv("RESERVATION_EXPIRY_POLL_S", "1"))
+    # Πόσες κρατήσεις που έληξαν επεξεργάζονται μαζί (ένα query / commit)
+    RESERVATION_EXPIRY_BATCH_SIZE: int = int(os.getenv("RESERVATION_EXPIRY_BATCH_SIZE", "500"))
+    # Αν ο worker που "πήρε" μια λήξη πέσει πριν την ολοκληρώσει, μετά από
+    # τόσα δευτερόλεπτα την ξαναπαίρνει κάποιος άλλος
+    RESERVATION_EXPIRY_LEASE_S: int = int(os.getenv("RESERVATION_EXPIRY_LEASE_S", "60"))
+
 # Δημιουργούμε ένα μοναδικό αντίγραφο (instance) των ρυθμίσεων
 # που θα χρησιμοποιεί ολόκληρη η εφαρμογή.
 settings = Settings()
@@ -28,8 +28,8 @@ security.py - Κρυπτογράφηση Κωδικών και Δημιουργ
 """
 
 from datetime import datetime, timedelta, timezone
-from typing import Any, Union
-from jose import jwt  # Βιβλιοθήκη για δημιουργία/επαλήθευση JWT tokens
+from typing import Any, Optional, Union
+from jose import jwt, JWTError  # Βιβλιοθήκη για δημιουργία/επαλήθευση JWT tokens
 from passlib.context import CryptContext  # Βιβλιοθήκη για κρυπτογράφηση κωδικών
 from app.core.config import settings  # Οι ρυθμίσεις μας (SECRET_KEY, ALGORITHM κλπ.)
 
@@ -82,6 +82,23 @@ def create_access_token(subject: Union[str, Any], expires_delta: timedelta = Non
     return encoded_jwt
 
 
+def decode_access_token_subject(token: Optional[str]) -> Optional[str]:
+    """
+    ΤΙ ΚΑΝΕΙ: Επαληθεύει ένα JWT token και επιστρέφει το "sub" (user id),
+               ΧΩΡΙΣ αναζήτηση στη βάση.
+    ΕΠΙΣΤΡΕΦΕΙ: Το user id ως string, ή None αν το token λείπει/είναι άκυρο.
+    ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: main.py (/ws) για το όριο συνδέσεων ανά χρήστη.
+    """
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    subject = payload.get("sub")
+    return str(subject) if subject is not None else None
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     ΤΙ ΚΑΝΕΙ: Ελέγχει αν ο κωδικός που έδωσε ο χρήστης είναι σωστός.
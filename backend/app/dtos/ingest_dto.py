@@ -0,0 +1,32 @@
+"""
+=======================================================================
+ingest_dto.py - Σχήματα Δεδομένων για Μαζική Λήψη Events Αισθητήρων
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Ορίζει την απάντηση του POST /api/ingest/events.
+    Το ΣΩΜΑ του request δεν είναι JSON (είναι NDJSON ή binary), οπότε
+    δεν έχει Pydantic σχήμα - το αποκωδικοποιεί το sensor_payloads.py.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    ingest_router.py
+=======================================================================
+"""
+
+from pydantic import BaseModel
+from typing import List
+
+
+# --- Σχήμα Απάντησης Μαζικής Λήψης ---
+class IngestResponse(BaseModel):
+    """
+    ΤΙ ΚΑΝΕΙ: Συνοψίζει τι έγινε με τα events ενός bulk request.
+    ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: POST /api/ingest/events
+
+    "accepted" σημαίνει ότι το event πέρασε την επαλήθευση και μπήκε στη
+    ροή επεξεργασίας (no-op / debounce φίλτρα, batch αποθήκευση).
+    """
+    received: int                 # Πόσα events βρέθηκαν στο σώμα
+    accepted: int                 # Πόσα πέρασαν την επαλήθευση
+    rejected: int                 # Άκυρη δομή, άγνωστη πόλη ή κατάσταση
+    errors: List[str] = []        # Τα πρώτα μηνύματα σφάλματος (για debugging)
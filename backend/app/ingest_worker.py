@@ -0,0 +1,81 @@
+"""
+=======================================================================
+ingest_worker.py - Ξεχωριστό Process Λήψης Δεδομένων Αισθητήρων
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Είναι ένα δεύτερο "entry point" (εκτός από το app.main), που τρέχει
+    ΜΟΝΟ τον MQTT consumer - χωρίς HTTP server.
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Αν ο MQTT consumer τρέχει μέσα σε κάθε uvicorn worker, τότε με N
+    workers κάθε μήνυμα αισθητήρα επεξεργάζεται N φορές. Επίσης ένα
+    μόνο process έχει όριο στο πόσα μηνύματα/sec αντέχει.
+
+    Με INGEST_MODE=external το API ΔΕΝ ξεκινά consumer, και τρέχουμε
+    όσα ingestion processes χρειαζόμαστε. Με MQTT_SHARED_GROUP όλα
+    εγγράφονται ως MQTT v5 shared subscription ("$share/<group>/...")
+    και ο broker μοιράζει τα μηνύματα ανάμεσά τους: κάθε μήνυμα
+    επεξεργάζεται από ΕΝΑ μόνο process.
+
+    Κάθε process έχει το δικό του MQTTConsumer και άρα τις δικές του
+    εκκρεμείς αλλαγές (pending updates) - δεν μοιράζονται global dicts.
+
+ΠΩΣ ΕΚΚΙΝΕΙ:
+    INGEST_MODE=external MQTT_SHARED_GROUP=ingest python -m app.ingest_worker
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (η επεξεργασία), config.py (ρυθμίσεις)
+=======================================================================
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+from app.core.config import settings
+from app.mqtt_consumer import get_consumer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("app.ingest_worker")
+
+
+async def run_worker():
+    """
+    ΤΙ ΚΑΝΕΙ: Εκκινεί έναν MQTTConsumer και τρέχει μέχρι SIGINT/SIGTERM.
+    ΣΤΟ ΤΕΛΟΣ: Σταματά τη λήψη και αποθηκεύει ό,τι εκκρεμεί (graceful drain).
+    """
+    # Μοναδικό client id ανά process (ο broker απορρίπτει διπλότυπα ids).
+    # Με MQTT_CLIENT_ID (σταθερό ανά worker) ο broker κρατά τη συνεδρία του
+    client_id = settings.MQTT_CLIENT_ID or f"smart-parking-ingest-{socket.gethostname()}-{os.getpid()}"
+    consumer = get_consumer(client_id=client_id)
+
+    # Περιμένουμε σήμα τερματισμού (π.χ. docker stop → SIGTERM)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass  # Windows: δεν υποστηρίζεται - σταματάμε με Ctrl+C
+
+    await consumer.load_known_spots()
+    if not await consumer.recover_journal():
+        # Χωρίς replay το journal δεν είναι ασφαλές - ο orchestrator ας ξαναδοκιμάσει
+        raise SystemExit("Update journal replay failed; refusing to start ingestion")
+    await consumer.start()
+    logger.info(
+        f"Ingest worker {client_id} running "
+        f"(shared_group={consumer.shared_group or '-'}, broker={settings.MQTT_HOST}:{settings.MQTT_PORT})"
+    )
+
+    await stop_event.wait()
+    logger.info("Ingest worker stopping...")
+    report = await consumer.stop()
+    logger.info(f"Ingest worker drained: {report}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
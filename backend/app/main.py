@@ -27,17 +27,29 @@ main.py - Κεντρικό Αρχείο Εκκίνησης της Εφαρμογ
 =======================================================================
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+from app.core.config import settings
 from app.database import init_db
 from app import models
 from app.routers.user_router import router as user_router
 from app.routers.parking_router import router as parking_router
 from app.routers.spot_status_log_router import router as spot_status_log_router
 from app.routers.reservation_router import router as reservation_router
-from app.mqtt_consumer import start_mqtt_consumer, add_websocket_client, remove_websocket_client
+from app.routers.ingest_router import router as ingest_router
+from app.task_supervisor import background_tasks
+from app.mqtt_consumer import get_consumer, start_mqtt_consumer
+from app.websocket_broadcaster import websocket_broadcaster, LIMIT_CLOSE_CODE
+from app.broadcast_bus import broadcast_bus
+from app.reservation_expiry import reservation_expiry
+from app.viewport_index import parse_bbox
+from app.sse_stream import SSEClient, event_stream
+from app.core.security import decode_access_token_subject
 from app.database import get_session, redis_client
+from typing import List, Optional
+import json
 import logging
 
 # Logger για αυτό το module - εμφανίζει μηνύματα με prefix "app.main"
@@ -57,7 +69,7 @@ async def lifespan(app: FastAPI):
     """
     ΤΙ ΚΑΝΕΙ: Διαχειρίζεται τον κύκλο ζωής της εφαρμογής.
     ΕΚΚΙΝΗΣΗ (πριν yield): Βάση δεδομένων → Redis cache → MQTT consumer
-    ΤΕΡΜΑΤΙΣΜΟΣ (μετά yield): Καθαρισμός πόρων (logging)
+    ΤΕΡΜΑΤΙΣΜΟΣ (μετά yield): Ομαλό άδειασμα MQTT consumer (ουρά + εκκρεμείς αλλαγές)
 
     ΣΗΜΑΝΤΙΚΟ: Αν κάποιο βήμα αποτύχει, η εφαρμογή συνεχίζει
     (try/except) αλλά καταγράφει το σφάλμα. Δεν θέλουμε να
@@ -68,6 +80,10 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
 
+    # Ο consumer του process (δημιουργείται εδώ, όχι στο import) - χρειάζεται
+    # και με INGEST_MODE=external για το HTTP bulk ingest
+    mqtt_consumer = get_consumer()
+
     # --- ΒΗΜΑ 2: Προφόρτωση θέσεων στο Redis cache ---
     # Φορτώνουμε όλες τις θέσεις από PostgreSQL → Redis
     # Έτσι τα πρώτα requests θα βρουν δεδομένα στο cache (γρήγορη απόκριση)
@@ -75,29 +91,76 @@ async def lifespan(app: FastAPI):
     try:
         from app.repositories.parking_repository import ParkingRepository
         repo = ParkingRepository(session)
-        await repo.preload_spots_to_cache()  # Φόρτωση στο Redis
+        spots = await repo.preload_spots_to_cache()  # Φόρτωση στο Redis
         logger.info("Redis cache preload successful")
+        # Οι γνωστές θέσεις φιλτράρουν άγνωστα spot ids και η τελευταία
+        # γνωστή κατάσταση κάθε θέσης φιλτράρει τα no-op μηνύματα
+        mqtt_consumer.seed_known_spots(spots)
     except Exception as e:
         # Αν το Redis δεν είναι διαθέσιμο, η εφαρμογή συνεχίζει χωρίς cache
         logger.error(f"Failed to preload Redis cache: {e}")
     finally:
         await session.close()  # ΠΑΝΤΑ κλείνουμε τη σύνδεση
 
+    # --- ΒΗΜΑ 2β: Αλλαγές που είχαν μείνει στο journal (crash πριν το flush) ---
+    # Ξεχωριστό βήμα: γίνεται ΠΑΝΤΑ, ακόμα κι αν απέτυχε η προφόρτωση.
+    # Αν αποτύχει, η λήψη μένει κλειστή - αλλιώς το πρώτο flush θα
+    # "προσπερνούσε" αλλαγές που δεν αποθηκεύτηκαν ποτέ.
+    journal_recovered = await mqtt_consumer.recover_journal()
+
     # --- ΒΗΜΑ 3: Εκκίνηση MQTT Consumer ---
     # Ξεκινά να "ακούει" μηνύματα από τους αισθητήρες parking
     # Αν αποτύχει (π.χ. ο Mosquitto broker δεν τρέχει), συνεχίζουμε
+    # Με INGEST_MODE=external τα μηνύματα τα επεξεργάζονται ξεχωριστά
+    # processes (python -m app.ingest_worker) - όχι το API.
+    if not journal_recovered:
+        logger.error("MQTT consumer not started: update journal replay failed")
+    elif settings.INGEST_MODE == "embedded":
+        try:
+            await start_mqtt_consumer()
+            logger.info("MQTT consumer started successfully")
+        except Exception as e:
+            logger.error(f"Failed to start MQTT consumer: {e}")
+    else:
+        logger.info(f"MQTT consumer not started in API process (INGEST_MODE={settings.INGEST_MODE})")
+
+    # --- ΒΗΜΑ 4: Λήψη αλλαγών από άλλα processes (Redis pub/sub) ---
+    # Κάθε API worker στέλνει στους ΔΙΚΟΥΣ του WebSocket clients τις αλλαγές
+    # που δημοσίευσε οποιοσδήποτε consumer (σε οποιοδήποτε process/host)
+    if broadcast_bus.mode == "redis":
+        background_tasks.spawn("broadcast_bus", broadcast_bus.run)
+
+    # --- ΒΗΜΑ 5: Heartbeat των WebSocket συνδέσεων (ping + κλείσιμο νεκρών) ---
+    background_tasks.spawn("ws_heartbeat", lambda: websocket_broadcaster.run_heartbeat(
+        heartbeat=lambda: background_tasks.beat("ws_heartbeat")))
+
+    # --- ΒΗΜΑ 6: Λήξη κρατήσεων (Redis ZSET "reservations:expiry") ---
+    # Πρώτα ξαναπρογραμματίζονται λήξεις θέσεων "Reserved" που λείπουν
+    # (π.χ. κρατήσεις πριν από restart) και μετά ξεκινά ο βρόχος λήξεων
     try:
-        await start_mqtt_consumer()
-        logger.info("MQTT consumer started successfully")
+        recovered = await reservation_expiry.recover()
+        if recovered:
+            logger.info(f"Rescheduled {recovered} reservation expiries")
     except Exception as e:
-        logger.error(f"Failed to start MQTT consumer: {e}")
+        logger.error(f"Failed to recover reservation expiries: {e}")
+    background_tasks.spawn("reservation_expiry", lambda: reservation_expiry.run(
+        heartbeat=lambda: background_tasks.beat("reservation_expiry")))
 
     # yield: Η εφαρμογή τρέχει εδώ - όταν τελειώσει, συνεχίζει παρακάτω
     yield
 
     # --- ΤΕΡΜΑΤΙΣΜΟΣ ---
-    # Εδώ θα μπαίναν ενέργειες καθαρισμού (π.χ. κλείσιμο συνδέσεων)
+    # Ομαλό "άδειασμα" του consumer: σταματά η λήψη, επεξεργάζονται τα
+    # μηνύματα της ουράς και αποθηκεύονται οι εκκρεμείς αλλαγές (με προθεσμία
+    # SHUTDOWN_DRAIN_TIMEOUT_S). Τρέχει και με INGEST_MODE=external, γιατί
+    # το HTTP bulk ingest χρησιμοποιεί την ίδια ροή αποθήκευσης.
     logger.info("Shutting down...")
+    report = await mqtt_consumer.stop()
+    logger.info(f"Ingestion drained on shutdown: {report}")
+    # Ακύρωση των υπόλοιπων background tasks (π.χ. βρόχος λήξεων κρατήσεων)
+    await background_tasks.shutdown()
+    # Τέλος των writers των WebSocket συνδέσεων
+    await websocket_broadcaster.shutdown()
 
 
 # =======================================================================
@@ -139,15 +202,84 @@ app.add_middleware(
 #
 # ΠΩΣ ΛΕΙΤΟΥΡΓΕΙ:
 # 1. Frontend ανοίγει σύνδεση: new WebSocket("ws://localhost:8000/ws")
-# 2. Server αποδέχεται τη σύνδεση και προσθέτει τον client στη λίστα
+# 2. Server αποδέχεται τη σύνδεση και την καταχωρεί στον broadcaster
+#    (δική της ουρά μηνυμάτων + writer task - βλ. websocket_broadcaster.py)
 # 3. Όταν ένας αισθητήρας αλλάξει κατάσταση (MQTT), το backend
-#    στέλνει μήνυμα σε ΟΛΟΥΣ τους συνδεδεμένους clients ταυτόχρονα
+#    βάζει το μήνυμα στις ουρές ΟΛΩΝ των συνδεδεμένων clients
 # 4. Ο χάρτης ενημερώνεται ΑΜΕΣΩΣ χωρίς ο χρήστης να κάνει refresh
 #
+# VIEWPORT: ο client μπορεί να στείλει το ορατό τμήμα του χάρτη του
+#   {"type": "viewport", "swLat": .., "swLng": .., "neLat": .., "neLng": ..}
+# και από εκεί και πέρα λαμβάνει μόνο αλλαγές θέσεων μέσα σε αυτό.
+#   {"type": "viewport", "all": true} → αφαίρεση του viewport
+#
+# ΚΑΝΑΛΙΑ: φθηνότερη εναλλακτική - αλλαγές μόνο μιας πόλης/περιοχής
+#   {"type": "subscribe", "channels": ["city:Larissa", "area:Athens/Kolonaki"]}
+#   {"type": "unsubscribe", "channels": ["city:Larissa"]}
+# Client χωρίς viewport και χωρίς κανάλια λαμβάνει ΟΛΕΣ τις αλλαγές.
+#
 # ΔΙΑΦΟΡΑ HTTP vs WebSocket:
 # HTTP:      Client → Request → Server → Response → Τέλος
 # WebSocket: Client ↔ Ανοιχτή σύνδεση ↔ Server (συνεχής επικοινωνία)
 
+def handle_client_message(connection, data: str) -> bool:
+    """
+    ΤΙ ΚΑΝΕΙ: Εκτελεί τις εντολές που στέλνει ο client ("viewport",
+               "subscribe", "unsubscribe", "resume", "pong").
+    ΕΠΙΣΤΡΕΦΕΙ: True αν το μήνυμα ήταν εντολή, False για απλό κείμενο (echo).
+    """
+    try:
+        command = json.loads(data)
+    except ValueError:
+        return False
+    if not isinstance(command, dict):
+        return False
+    kind = command.get("type")
+
+    if kind == "pong":
+        # Απάντηση στο ping - η σύνδεση σημειώθηκε ήδη ζωντανή (touch)
+        return True
+
+    if kind == "viewport":
+        if command.get("all"):
+            websocket_broadcaster.set_viewport(connection, None)
+            websocket_broadcaster.send(connection, {"type": "viewport_ack", "all": True})
+            return True
+        bbox = parse_bbox(command)
+        if bbox is None:
+            websocket_broadcaster.send(connection, {"type": "error", "message": "invalid viewport"})
+            return True
+        websocket_broadcaster.set_viewport(connection, bbox)
+        websocket_broadcaster.send(connection, {
+            "type": "viewport_ack",
+            "swLat": bbox.sw_lat, "swLng": bbox.sw_lng, "neLat": bbox.ne_lat, "neLng": bbox.ne_lng,
+        })
+        return True
+
+    if kind in ("subscribe", "unsubscribe"):
+        channels = command.get("channels")
+        if not isinstance(channels, list):
+            websocket_broadcaster.send(connection, {"type": "error", "message": "channels must be a list"})
+            return True
+        if kind == "unsubscribe":
+            websocket_broadcaster.unsubscribe(connection, [c for c in channels if isinstance(c, str)])
+        elif not websocket_broadcaster.subscribe(connection, channels):
+            websocket_broadcaster.send(connection, {"type": "error", "message": "invalid channels"})
+            return True
+        websocket_broadcaster.send(connection, {"type": "subscribed", "channels": sorted(connection.channels)})
+        return True
+
+    if kind == "resume":
+        seq = command.get("seq")
+        if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+            websocket_broadcaster.send(connection, {"type": "error", "message": "invalid seq"})
+            return True
+        websocket_broadcaster.resume(connection, seq)
+        return True
+
+    return False
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -155,11 +287,21 @@ async def websocket_endpoint(websocket: WebSocket):
     ΠΑΡΑΜΕΤΡΟΙ: websocket - το αντικείμενο σύνδεσης (δίνεται αυτόματα από FastAPI)
     ΕΠΙΣΤΡΕΦΕΙ: Δεν επιστρέφει - τρέχει συνεχώς μέχρι αποσύνδεση
     """
+    # Όρια συνδέσεων (συνολικά / ανά IP / ανά χρήστη) - ΠΡΙΝ το handshake.
+    # Ο χρήστης (προαιρετικά) από το ?token=<JWT>
+    ip = websocket.client.host if websocket.client else None
+    user = decode_access_token_subject(websocket.query_params.get("token"))
+    reason = websocket_broadcaster.admit(ip, user)
+    if reason:
+        logger.warning(f"Rejecting WebSocket client {websocket.client}: {reason}")
+        await websocket.close(code=LIMIT_CLOSE_CODE)
+        return
+
     # Αποδεχόμαστε τη σύνδεση (handshake)
     await websocket.accept()
 
-    # Προσθέτουμε τον client στη λίστα για να λαμβάνει updates
-    add_websocket_client(websocket)
+    # Καταχωρούμε τον client για να λαμβάνει updates
+    connection = websocket_broadcaster.register(websocket, ip, user)
     logger.info(f"WebSocket client connected: {websocket.client}")
 
     try:
@@ -167,8 +309,12 @@ async def websocket_endpoint(websocket: WebSocket):
         # Αυτό κρατά τη σύνδεση ζωντανή (δεν χρειάζεται ο client να στέλνει κάτι)
         while True:
             data = await websocket.receive_text()  # Αναμένουμε μήνυμα
+            websocket_broadcaster.touch(connection)
+            if handle_client_message(connection, data):
+                continue
             # Echo: στέλνουμε πίσω ό,τι λάβαμε (για debugging/ping)
-            await websocket.send_json({"type": "echo", "message": data})
+            # Μέσω της ουράς του client - μόνο ο writer γράφει στο socket
+            websocket_broadcaster.send(connection, {"type": "echo", "message": data})
 
     except WebSocketDisconnect:
         # Ο client έκλεισε τη σύνδεση (π.χ. έκλεισε τον browser)
@@ -177,8 +323,67 @@ async def websocket_endpoint(websocket: WebSocket):
         # Απροσδόκητο σφάλμα (π.χ. δίκτυο)
         logger.error(f"WebSocket error: {e}")
     finally:
-        # ΠΑΝΤΑ αφαιρούμε τον client από τη λίστα (αποσυνδέθηκε)
-        remove_websocket_client(websocket)
+        # ΠΑΝΤΑ αφαιρούμε τον client (αποσυνδέθηκε) και σταματάμε τον writer του
+        await websocket_broadcaster.unregister(websocket)
+
+
+# =======================================================================
+# SSE ENDPOINT: Οι ίδιες ενημερώσεις για clients χωρίς WebSocket
+# =======================================================================
+@app.get("/sse")
+async def sse_endpoint(
+    request: Request,
+    city: Optional[List[str]] = Query(None),
+    area: Optional[List[str]] = Query(None),
+    swLat: Optional[float] = None,
+    swLng: Optional[float] = None,
+    neLat: Optional[float] = None,
+    neLng: Optional[float] = None,
+    token: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    ΤΙ ΚΑΝΕΙ: Server-Sent Events με τα ίδια μηνύματα με το /ws (βλ. sse_stream.py).
+    ΠΑΡΑΜΕΤΡΟΙ:
+        city: πόλεις (π.χ. ?city=Athens&city=Larissa) - κανάλια "city:..."
+        area: περιοχές ως "<πόλη>/<περιοχή>" - κανάλια "area:..."
+        swLat/swLng/neLat/neLng: ορατό τμήμα χάρτη (και τα 4 ή κανένα)
+        token: (προαιρετικό) JWT - για το όριο συνδέσεων ανά χρήστη
+        Last-Event-ID (header): το τελευταίο seq - στέλνεται αυτόματα από
+                                το EventSource μετά από επανασύνδεση
+    ΕΠΙΣΤΡΕΦΕΙ: text/event-stream (χωρίς φίλτρα: όλες οι αλλαγές)
+    """
+    bbox = None
+    corners = {"swLat": swLat, "swLng": swLng, "neLat": neLat, "neLng": neLng}
+    if any(value is not None for value in corners.values()):
+        bbox = parse_bbox(corners)
+        if bbox is None:
+            raise HTTPException(status_code=400, detail="invalid viewport")
+    channels = [f"city:{c}" for c in city or []] + [f"area:{a}" for a in area or []]
+
+    ip = request.client.host if request.client else None
+    user = decode_access_token_subject(token)
+    reason = websocket_broadcaster.admit(ip, user)
+    if reason:
+        raise HTTPException(status_code=429, detail=reason)
+
+    sink = SSEClient(request.client)
+    connection = websocket_broadcaster.register(sink, ip, user, writer=False)
+    sink.connection = connection
+    if channels and not websocket_broadcaster.subscribe(connection, channels):
+        await websocket_broadcaster.unregister(sink)
+        raise HTTPException(status_code=400, detail="invalid channels")
+    if bbox is not None:
+        websocket_broadcaster.set_viewport(connection, bbox)
+    if last_event_id and last_event_id.isdigit():
+        websocket_broadcaster.resume(connection, int(last_event_id))
+
+    return StreamingResponse(
+        event_stream(sink),
+        media_type="text/event-stream",
+        # Χωρίς cache και χωρίς buffering σε nginx - κάθε event φεύγει αμέσως
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # =======================================================================
@@ -193,6 +398,7 @@ app.include_router(user_router, prefix="/api")           # /api/users/...
 app.include_router(parking_router, prefix="/api")        # /api/parking/...
 app.include_router(spot_status_log_router, prefix="/api") # /api/logs/...
 app.include_router(reservation_router, prefix="/api")    # /api/reservations/...
+app.include_router(ingest_router, prefix="/api")         # /api/ingest/...
 
 
 # =======================================================================
@@ -206,3 +412,40 @@ async def root():
     ΕΠΙΣΤΡΕΦΕΙ: Μήνυμα επιβεβαίωσης.
     """
     return {"message": "Smart Parking Backend Running!"}
+
+
+# =======================================================================
+# ENDPOINT: Υγεία Background Tasks
+# =======================================================================
+@app.get("/health")
+async def health():
+    """
+    ΤΙ ΚΑΝΕΙ: Αναφέρει αν τα background tasks του process τρέχουν, πόσες
+               φορές ξαναξεκίνησαν, πότε έκαναν τελευταία πρόοδο και αν οι
+               εκκρεμείς αλλαγές αργούν να αποθηκευτούν.
+    ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: Από docker/load balancer health checks.
+    ΕΠΙΣΤΡΕΦΕΙ: 200 αν όλα είναι εντάξει, 503 αν κάτι δεν λειτουργεί.
+    """
+    ingestion = get_consumer().health()
+    app_tasks = background_tasks.health()
+    healthy = ingestion["healthy"] and app_tasks["healthy"]
+    body = {"status": "ok" if healthy else "degraded", "ingestion": ingestion, "app": app_tasks}
+    return JSONResponse(status_code=200 if healthy else 503, content=body)
+
+
+# =======================================================================
+# ENDPOINT: Μετρικές Ροής Δεδομένων Αισθητήρων
+# =======================================================================
+@app.get("/metrics/ingestion")
+async def ingestion_metrics():
+    """
+    ΤΙ ΚΑΝΕΙ: Επιστρέφει μετρικές του MQTT consumer αυτού του process.
+    ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: Για παρακολούθηση/ρύθμιση του adaptive flush
+                     (μέγεθος batch, καθυστέρηση, διάρκεια αποθήκευσης).
+    ΕΠΙΣΤΡΕΦΕΙ: dictionary με τις μετρικές (και των WebSocket clients).
+    """
+    stats = get_consumer().get_stats()
+    stats["websocket"] = websocket_broadcaster.stats()
+    stats["broadcast_bus"] = broadcast_bus.stats()
+    stats["reservation_expiry"] = await reservation_expiry.stats()
+    return stats
@@ -0,0 +1,95 @@
+"""
+=======================================================================
+message_dedupe.py - Αναγνώριση Διπλότυπων MQTT Μηνυμάτων (QoS 1)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Με QoS 1 ο broker ξαναστέλνει κάθε μήνυμα που δεν επιβεβαιώθηκε
+    (π.χ. μετά από αποσύνδεση). Χωρίς έλεγχο, κάθε επαναποστολή θα γινόταν
+    νέα εγγραφή στο SpotStatusLog και νέα θέση στο batch.
+
+    Κρατάμε ένα "παράθυρο" με τα κλειδιά των τελευταίων N μηνυμάτων που
+    είδαμε μέσα στα τελευταία MQTT_DEDUPE_TTL_S δευτερόλεπτα και απορρίπτουμε
+    όσα έχουμε ήδη δει, ΠΡΙΝ γίνει οποιαδήποτε εγγραφή.
+
+ΚΛΕΙΔΙ ΜΗΝΥΜΑΤΟΣ:
+    (topic, payload) - ΟΧΙ το message id: είναι 16 bit, ξαναχρησιμοποιείται
+    μετά από 65535 μηνύματα και δεν είναι ίδιο σε μια επαναποστολή μετά από
+    νέα σύνδεση.
+
+ΜΟΝΟ ΜΗΝΥΜΑΤΑ ΜΕ ΤΑΥΤΟΤΗΤΑ (ts ή seq):
+    Ένα ίδιο payload είναι σίγουρα επανάληψη μόνο αν κουβαλά ts/seq. Ένα
+    σκέτο "Occupied" μπορεί να είναι ΝΕΟ γεγονός (Occupied → Available →
+    Occupied) - αυτά δεν ελέγχονται εδώ (βλ. is_redelivery). Μια πραγματική
+    επανάληψη τους είναι ίδια κατάσταση με την τελευταία γνωστή και την
+    απορρίπτει το spot_state.py ως no-op, όπως και κάθε ίδιο ή μικρότερο seq.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py, config.py (MQTT_QOS, MQTT_DEDUPE_WINDOW)
+=======================================================================
+"""
+
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Sequence
+
+from app.core.config import settings
+from app.sensor_payloads import SensorReading
+
+
+class DuplicateFilter:
+    """
+    Σύνολο με σταθερό μέγιστο μέγεθος και διάρκεια: θυμάται τα τελευταία
+    `capacity` κλειδιά για `ttl_s` δευτερόλεπτα και ξεχνά πρώτα το παλαιότερο.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, ttl_s: Optional[float] = None):
+        """
+        ΠΑΡΑΜΕΤΡΟΙ:
+            capacity: μέγεθος παραθύρου (0 = ανενεργό, None = από config.py)
+            ttl_s: πόσο θυμόμαστε ένα κλειδί (None = MQTT_DEDUPE_TTL_S)
+        """
+        self.capacity = max(0, settings.MQTT_DEDUPE_WINDOW if capacity is None else capacity)
+        self.ttl = settings.MQTT_DEDUPE_TTL_S if ttl_s is None else ttl_s
+        # Κλειδί → πότε το πρωτοείδαμε (με σειρά εμφάνισης - τα παλαιότερα μπροστά)
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+
+        # duplicates: πόσα μηνύματα απορρίφθηκαν ως διπλότυπα
+        self.duplicates = 0
+
+    def seen(self, key: Hashable) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Ελέγχει αν το κλειδί εμφανίστηκε μέσα στο παράθυρο (και
+                   μέσα στο TTL) και το καταγράφει.
+        ΕΠΙΣΤΡΕΦΕΙ: True (και αυξάνει τον μετρητή) αν είναι διπλότυπο.
+        """
+        if not self.capacity:
+            return False
+        now = time.monotonic()
+        # Τα ληγμένα είναι πάντα μπροστά (σειρά εμφάνισης)
+        while self._seen:
+            oldest, first_seen = next(iter(self._seen.items()))
+            if now - first_seen <= self.ttl:
+                break
+            del self._seen[oldest]
+        if key in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen[key] = now
+        if len(self._seen) > self.capacity:
+            self._seen.popitem(last=False)  # Φεύγει το παλαιότερο
+        return False
+
+    def is_redelivery(self, topic: str, payload: bytes, readings: Sequence[SensorReading]) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Ελέγχει αν ένα αποκωδικοποιημένο μήνυμα είναι επαναποστολή.
+        ΠΑΡΑΜΕΤΡΟΙ: readings - οι μετρήσεις του μηνύματος
+        ΕΠΙΣΤΡΕΦΕΙ: True μόνο αν ΟΛΕΣ οι μετρήσεις έχουν ts ή seq και το ίδιο
+                    (topic, payload) φάνηκε μέσα στο παράθυρο.
+        """
+        if not readings or any(r.timestamp is None and r.seq is None for r in readings):
+            return False
+        return self.seen((topic, hash(payload)))
+
+    def __len__(self) -> int:
+        return len(self._seen)
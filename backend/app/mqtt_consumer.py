@@ -20,21 +20,26 @@ mqtt_consumer.py - Λήψη Real-time Δεδομένων από Αισθητήρ
 ΡΟΗΛ ΔΕΔΟΜΕΝΩΝ:
     1. Αισθητήρας ανιχνεύει αλλαγή → δημοσιεύει στο topic:
        "parking/<city>/<spot_id>/status" με payload "Occupied"/"Available"
+       (ή gateway → "parking/<city>/batch" με πολλές θέσεις μαζί)
     2. MQTT Consumer (αυτό) λαμβάνει το μήνυμα
     3. Το μήνυμα μπαίνει σε "ουρά" (queue) για ασύγχρονη επεξεργασία
     4. Καταγράφεται αμέσως στο SpotStatusLog (ιστορικό)
     5. Μπαίνει σε "pending_updates" για ομαδική αποθήκευση
     6. ΑΜΕΣΩΣ ειδοποιούνται οι WebSocket clients (browser)
-    7. Κάθε 5 δευτερόλεπτα: αποθήκευση στη βάση + Redis (batch)
+    7. Όταν μαζευτούν N θέσεις Ή περάσουν T ms από την πρώτη εκκρεμή
+       αλλαγή: αποθήκευση στη βάση + Redis (batch, adaptive flush)
+
+    Με INGEST_BUFFER=redis_stream τα βήματα 4-5 και 7 γίνονται από
+    persistence workers που διαβάζουν από Redis Stream (sensor_event_stream.py).
 
 ΓΙΑΤΙ BATCH ΑΠΟΘΗΚΕΥΣΗ:
     Αν έχουμε 1000 αισθητήρες που στέλνουν μηνύματα κάθε δευτερόλεπτο,
     1000 αποθηκεύσεις/sec στη βάση θα "έπεφτε" το σύστημα.
-    Αντί αυτού, μαζεύουμε τις αλλαγές 5 δευτερολέπτων και τις
-    αποθηκεύουμε μαζί (πολύ πιο αποδοτικό).
+    Αντί αυτού, μαζεύουμε τις αλλαγές και τις αποθηκεύουμε μαζί
+    (πολύ πιο αποδοτικό) - βλ. spot_batch_writer.py.
 
 ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
-    main.py (εκκίνηση), parking_repository.py (αποθήκευση),
+    main.py (εκκίνηση), spot_batch_writer.py (αποθήκευση),
     spot_status_log_repository.py (ιστορικό), WebSocket clients (frontend)
 =======================================================================
 """
@@ -42,37 +47,42 @@ mqtt_consumer.py - Λήψη Real-time Δεδομένων από Αισθητήρ
 import asyncio
 import json
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from paho.mqtt.client import Client as MqttClient  # Βιβλιοθήκη MQTT client
+from paho.mqtt.client import Client as MqttClient, MQTTv311, MQTTv5, MQTT_CLEAN_START_FIRST_ONLY  # Βιβλιοθήκη MQTT client
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 
+from app.core.config import settings
 from app.database import get_session, redis_client
-from app.repositories.parking_repository import ParkingRepository
 from app.repositories.spot_status_log_repository import SpotStatusLogRepository
 from app.constants import VALID_SPOT_STATUSES, VALID_CITIES  # Έγκυρες τιμές
+from app.spot_batch_writer import SpotBatchWriter  # Ομαδική αποθήκευση (adaptive flush)
+from app.update_journal import UpdateJournal  # Journal εκκρεμών αλλαγών (ανάκτηση μετά από crash)
+from app.sensor_event_stream import SensorEventStream, StreamPersistenceWorker
+from app.spot_state import SpotStateTracker  # Τελευταία γνωστή κατάσταση (no-op φίλτρο)
+from app.sensor_debounce import SpotDebouncer  # Debounce για αισθητήρες που "τρεμοπαίζουν"
+from app.message_dedupe import DuplicateFilter  # Επαναποστολές QoS 1
+from app.spot_registry import SpotRegistry  # Γνωστές θέσεις (spot_id → πόλη)
+from app.sensor_liveness import SensorLivenessMonitor  # Σιωπηλοί αισθητήρες (heartbeats)
+from app.sensor_payloads import SensorReading, parse_batch_payload, parse_seq, parse_timestamp  # Payloads αισθητήρων
+from app.repositories.parking_repository import ParkingRepository
+from app.mqtt_native_client import NativeMessagePump  # MQTT_CLIENT=aiomqtt
+from app.task_supervisor import TaskSupervisor  # Επίβλεψη background tasks
+from app.broadcast_bus import broadcast_bus  # Αποστολή σε WebSocket clients (όλων των workers)
 
 # Logger για καταγραφή συμβάντων
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("app.mqtt_consumer")
 
-
-# =======================================================================
-# GLOBAL ΜΕΤΑΒΛΗΤΕΣ
-# =======================================================================
-
-# pending_updates: Dictionary με τις εκκρεμείς αλλαγές προς αποθήκευση
-# Κλειδί: spot_id (int), Τιμή: {"status": ..., "city": ..., "timestamp": ...}
-# Μαζεύονται εδώ και αποθηκεύονται ομαδικά κάθε 5 δευτερόλεπτα
-pending_updates: Dict[int, Dict] = {}
-
-# batch_lock: "Κλείδωμα" που αποτρέπει ταυτόχρονη πρόσβαση στο pending_updates
-# Χρειάζεται γιατί τόσο ο MQTT thread όσο και ο batch task το τροποποιούν
-batch_lock = asyncio.Lock()
-
-# websocket_clients: Λίστα με τους συνδεδεμένους WebSocket clients (browsers)
-# Κάθε φορά που έρχεται MQTT μήνυμα, το στέλνουμε σε ΟΛΟΥΣ
-websocket_clients: List = []
+# Redis κανάλι όπου δημοσιεύονται θέσεις που άλλαξαν εκτός MQTT (admin,
+# κρατήσεις): ΚΑΘΕ consumer (και τα ingestion processes) "ξεχνά" την
+# τελευταία κατάσταση αισθητήρα τους (payload: "12,57,301")
+STATE_INVALIDATE_CHANNEL = "spots:state:invalidate"
 
 
 # =======================================================================
@@ -87,14 +97,47 @@ class MQTTConsumer:
     - Η βιβλιοθήκη paho-mqtt τρέχει σε ΞΕΧΩΡΙΣΤΟ thread (network thread)
     - Τα asyncio coroutines τρέχουν στο ΚΥΡΙΟ event loop
     - Χρησιμοποιούμε asyncio.Queue για ασφαλή επικοινωνία μεταξύ τους
+
+    ΟΡΙΑ ΤΟΥ QoS 1 (ΠΟΤΕ ΧΑΝΟΝΤΑΙ ΜΗΝΥΜΑΤΑ):
+    - Ο client επιβεβαιώνει (PUBACK) ένα μήνυμα μόλις μπει στην ουρά της
+      μνήμης, όχι όταν αποθηκευτεί: ένα crash χάνει ό,τι ήταν στην ουρά.
+    - Χωρίς MQTT_CLIENT_ID ο client έχει τυχαίο id και clean session: ό,τι
+      στάλθηκε όσο ήμασταν αποσυνδεδεμένοι ΔΕΝ ξαναστέλνεται.
+    Δηλαδή, στην πράξη, "το πολύ μία φορά" γύρω από αποσυνδέσεις/crash.
+    Με MQTT_CLIENT_ID (σταθερό, μοναδικό ανά process) ο broker κρατά τη
+    συνεδρία (clean_session=False / v5: clean_start=False) και ξαναστέλνει
+    τα ανεπιβεβαίωτα μετά από επανασύνδεση ή επανεκκίνηση.
     """
 
-    def __init__(self):
+    def __init__(self, client_id: str = "", shared_group: Optional[str] = None):
         """
         ΤΙ ΚΑΝΕΙ: Αρχικοποίηση MQTT client και ουράς μηνυμάτων.
+        ΠΑΡΑΜΕΤΡΟΙ:
+            client_id: μοναδικό όνομα client στον broker ("" = MQTT_CLIENT_ID ή τυχαίο)
+            shared_group: ομάδα MQTT v5 shared subscription (None = από config,
+                          "" = απλή εγγραφή όπου κάθε process λαμβάνει τα πάντα)
+
+        ΣΗΜΑΝΤΙΚΟ: Όλη η κατάσταση (ουρά, εκκρεμείς αλλαγές) ζει ΜΕΣΑ στο
+        instance - κάθε process έχει τη δική του, χωρίς global dicts.
         """
+        self.client_id = client_id or settings.MQTT_CLIENT_ID
+        self.shared_group = settings.MQTT_SHARED_GROUP if shared_group is None else shared_group
+
+        # persistent_session: ο broker κρατά τις εγγραφές και τα ανεπιβεβαίωτα
+        # μηνύματα ανάμεσα σε συνδέσεις - μόνο με το σταθερό MQTT_CLIENT_ID
+        # (ένα id ανά process id θα άφηνε "ορφανές" συνεδρίες στον broker)
+        self.persistent_session = (settings.MQTT_QOS > 0 and bool(settings.MQTT_CLIENT_ID)
+                                   and self.client_id == settings.MQTT_CLIENT_ID)
+
         # Δημιουργούμε MQTT client (χρησιμοποιεί paho-mqtt βιβλιοθήκη)
-        self.client = MqttClient()
+        # Τα shared subscriptions είναι χαρακτηριστικό του MQTT v5
+        self.protocol = MQTTv5 if self.shared_group else MQTTv311
+        if self.protocol == MQTTv311:
+            self.client = MqttClient(client_id=self.client_id, clean_session=not self.persistent_session,
+                                     protocol=self.protocol)
+        else:
+            # MQTT v5: η συνεδρία ορίζεται στη σύνδεση (βλ. session_options)
+            self.client = MqttClient(client_id=self.client_id, protocol=self.protocol)
 
         # message_queue: Ασφαλής ουρά μεταξύ του MQTT thread και asyncio
         # Ο MQTT thread βάζει μηνύματα (put), το asyncio τα παίρνει (get)
@@ -103,6 +146,74 @@ class MQTTConsumer:
         # loop: Το asyncio event loop - χρειάζεται για thread-safe επικοινωνία
         self.loop: Optional[asyncio.AbstractEventLoop] = None
 
+        # batch_writer: Κρατάει τις εκκρεμείς αλλαγές (pending updates) και
+        # τις αποθηκεύει ομαδικά (adaptive flush: N θέσεις Ή T ms)
+        # Με INGEST_JOURNAL_DIR οι εκκρεμείς αλλαγές γράφονται και σε τοπικό
+        # journal, ώστε να μη χάνονται σε crash (βλ. update_journal.py)
+        journal = None
+        if settings.INGEST_JOURNAL_DIR and settings.INGEST_BUFFER != "redis_stream":
+            journal = UpdateJournal(settings.INGEST_JOURNAL_DIR)
+        self.batch_writer = SpotBatchWriter(journal=journal)
+
+        # spot_state: τελευταία γνωστή κατάσταση ανά θέση - μηνύματα που
+        # επαναλαμβάνουν την ίδια κατάσταση αγνοούνται (no-op suppression)
+        self.spot_state = SpotStateTracker()
+
+        # spot_registry: ποιες θέσεις υπάρχουν και σε ποια πόλη - μηνύματα για
+        # άγνωστες θέσεις απορρίπτονται πριν από οποιαδήποτε εργασία στη βάση
+        self.spot_registry = SpotRegistry()
+
+        # debouncer: μια νέα κατάσταση εφαρμόζεται μόνο αφού μείνει σταθερή
+        # για SENSOR_DEBOUNCE_MS (φιλτράρει τους αισθητήρες που "τρεμοπαίζουν")
+        self.debouncer = SpotDebouncer()
+
+        # liveness: πότε στάλθηκε το τελευταίο μήνυμα κάθε αισθητήρα - όσοι
+        # σιωπούν > SENSOR_STALE_AFTER_S γίνονται SENSOR_STALE_STATUS
+        self.liveness = SensorLivenessMonitor()
+
+        # _pipeline_started: αν τρέχουν ήδη τα tasks debounce/batch (ensure_pipeline)
+        self._pipeline_started = False
+
+        # native_pump: ο asyncio-native client (μόνο με MQTT_CLIENT=aiomqtt)
+        self.native_pump: Optional[NativeMessagePump] = None
+
+        # tasks: επιβλέπει τα background tasks - τα ξαναξεκινά αν "σκάσουν",
+        # κρατά heartbeats για το /health και τα ακυρώνει στον τερματισμό
+        self.tasks = TaskSupervisor("mqtt_consumer")
+
+        # accepting: False μόλις ξεκινήσει ο τερματισμός (stop) - νέα
+        # δεδομένα (π.χ. HTTP bulk ingest) δεν γίνονται πλέον δεκτά
+        self.accepting = True
+
+        # duplicates: θυμάται τα πρόσφατα μηνύματα ώστε οι επαναποστολές του
+        # QoS 1 να απορρίπτονται πριν φτάσουν στο log/batch
+        self.duplicates = DuplicateFilter()
+
+        # Με INGEST_BUFFER=redis_stream τα έγκυρα μηνύματα γράφονται σε Redis
+        # Stream αντί για το pending dict, και τα αποθηκεύει ο stream_persister
+        # (μέλος του consumer group - μαζί με τυχόν python -m app.persist_worker)
+        self.event_stream: Optional[SensorEventStream] = None
+        self.stream_persister: Optional[StreamPersistenceWorker] = None
+        if settings.INGEST_BUFFER == "redis_stream":
+            self.event_stream = SensorEventStream()
+            self.stream_persister = StreamPersistenceWorker(
+                self.client_id or f"consumer-{socket.gethostname()}-{os.getpid()}", self.event_stream
+            )
+
+    def session_options(self) -> Dict:
+        """
+        ΤΙ ΚΑΝΕΙ: Οι παράμετροι σύνδεσης για τη συνεδρία στον broker
+                   (ίδιες για το paho connect() και τον aiomqtt Client).
+        ΕΠΙΣΤΡΕΦΕΙ: {"clean_start": ..., "properties": ...}
+        ΣΗΜΕΙΩΣΗ: Στο MQTT v3.1.1 η συνεδρία ορίζεται με clean_session στον
+                  client - εδώ αφορά μόνο το MQTT v5 (clean_start + expiry).
+        """
+        if self.protocol != MQTTv5 or not self.persistent_session:
+            return {"clean_start": MQTT_CLEAN_START_FIRST_ONLY, "properties": None}
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = settings.MQTT_SESSION_EXPIRY_S
+        return {"clean_start": False, "properties": properties}
+
     async def start(self):
         """
         ΤΙ ΚΑΝΕΙ: Εκκινεί τον MQTT consumer:
@@ -116,21 +227,32 @@ class MQTTConsumer:
         # Χρειάζεται για να στέλνουμε μηνύματα από το MQTT thread
         self.loop = asyncio.get_running_loop()
 
+        # MQTT_CLIENT=aiomqtt: ο client τρέχει ΜΕΣΑ στο event loop - χωρίς
+        # paho network thread και χωρίς call_soon_threadsafe ανά μήνυμα
+        if settings.MQTT_CLIENT == "aiomqtt":
+            self.native_pump = NativeMessagePump(self)
+            self.tasks.spawn("native_client", self.native_pump.run)
+            self._start_background_tasks()
+            logger.info("MQTT consumer started (asyncio-native client)")
+            return
+
         # --- Callback: Συμβαίνει όταν συνδεθούμε στον broker ---
-        def on_connect(client, userdata, flags, rc):
+        def on_connect(client, userdata, flags, rc, properties=None):
             """
             ΤΙ ΚΑΝΕΙ: Εκτελείται αυτόματα όταν συνδεθούμε στον MQTT broker.
             ΠΑΡΑΜΕΤΡΟΙ: rc=0 σημαίνει επιτυχία, rc!=0 σημαίνει σφάλμα
+                        (properties: μόνο στο MQTT v5)
             """
             if rc == 0:
                 logger.info("Connected to MQTT broker")
                 # Εγγραφόμαστε σε topics για κάθε πόλη
                 # '+' = wildcard: οποιοδήποτε spot_id
                 # Παράδειγμα: "parking/Athens/+/status" → λαμβάνει όλες τις Αθήνα
-                for city in VALID_CITIES:
-                    topic = f"parking/{city}/+/status"
-                    client.subscribe(topic)
-                    logger.info(f"Subscribed to {topic}")
+                # + "parking/Athens/batch" για gateways με πολλές θέσεις
+                # QoS 1: ο broker ξαναστέλνει ό,τι δεν επιβεβαιώσαμε (βλ. message_dedupe.py)
+                for topic in self.subscription_topics():
+                    client.subscribe(topic, qos=settings.MQTT_QOS)
+                    logger.info(f"Subscribed to {topic} (qos={settings.MQTT_QOS})")
             else:
                 logger.error(f"Failed to connect, return code {rc}")
 
@@ -160,23 +282,233 @@ class MQTTConsumer:
 
         try:
             # Σύνδεση στον Mosquitto broker
-            # "mosquitto": όνομα service στο docker-compose.yml
-            # 1883: η standard πόρτα MQTT
+            # MQTT_HOST: "mosquitto" = όνομα service στο docker-compose.yml
+            # MQTT_PORT: 1883 = η standard πόρτα MQTT
             # 60: keepalive σε δευτερόλεπτα (ping κάθε 60s για να μείνει η σύνδεση)
-            self.client.connect("mosquitto", 1883, 60)
+            self.client.connect(settings.MQTT_HOST, settings.MQTT_PORT, 60, **self.session_options())
 
             # Εκκίνηση paho network thread (τρέχει ξεχωριστά από asyncio)
             self.client.loop_start()
             logger.info("MQTT consumer started")
 
-            # Εκκίνηση δύο background asyncio tasks:
+            # Εκκίνηση background asyncio tasks:
             # 1. process_queue: επεξεργάζεται μηνύματα από την ουρά
-            # 2. batch_update_task: αποθηκεύει αλλαγές κάθε 5 δευτερόλεπτα
-            asyncio.create_task(self.process_queue())
-            asyncio.create_task(self.batch_update_task())
+            # 2. batch_update_task: αποθηκεύει αλλαγές (adaptive flush)
+            #    (ή, με Redis Stream buffer, ο stream persister)
+            self.tasks.spawn("process_queue", self.process_queue)
+            self._start_background_tasks()
         except Exception as e:
             logger.error(f"Failed to start MQTT consumer: {e}")
 
+    def _start_background_tasks(self):
+        """ΤΙ ΚΑΝΕΙ: Tasks κοινά και στους δύο MQTT clients (αποθήκευση, μητρώο)."""
+        self.ensure_pipeline()
+        if settings.SPOT_REGISTRY_REFRESH_S > 0:
+            self.tasks.spawn("registry_refresh", self.refresh_registry_task)
+        self.tasks.spawn("state_invalidation", self.state_invalidation_task)
+
+    async def state_invalidation_task(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Ακούει το STATE_INVALIDATE_CHANNEL και "ξεχνά" την τελευταία
+                   κατάσταση των θέσεων που άλλαξαν εκτός MQTT.
+        ΓΙΑΤΙ: Με INGEST_MODE=external οι αλλαγές admin/κρατήσεων γίνονται σε
+               ΑΛΛΟ process - χωρίς αυτό, το επόμενο "Occupied" του αισθητήρα
+               θα απορριπτόταν ως no-op και ο χάρτης θα έμενε λάθος.
+        """
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(STATE_INVALIDATE_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                for part in str(message["data"]).split(","):
+                    try:
+                        self.spot_state.forget(int(part))
+                    except ValueError:
+                        continue
+        finally:
+            await pubsub.reset()
+
+    def ensure_pipeline(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Εκκινεί (μία φορά) τα background tasks που εφαρμόζουν τις
+                   αλλαγές: debounce και batch αποθήκευση / stream persister.
+        ΓΙΑΤΙ ΞΕΧΩΡΙΣΤΑ ΑΠΟ start(): Το HTTP bulk ingest (ingest_router.py)
+               χρειάζεται την ίδια ροή ακόμα κι όταν το API δεν τρέχει MQTT
+               consumer (INGEST_MODE=external).
+        """
+        if self._pipeline_started:
+            return
+        self._pipeline_started = True
+        if self.debouncer.enabled:
+            self.tasks.spawn("debounce", lambda: self.debouncer.run(self.apply_status_transition))
+        if self.stream_persister:
+            self.tasks.spawn("stream_persister", self.stream_persister.run)
+        else:
+            self.tasks.spawn("batch_update", self.batch_update_task)
+        if self.liveness.enabled:
+            self.tasks.spawn("liveness", lambda: self.liveness.run(
+                self.mark_silent_sensors, heartbeat=lambda: self.tasks.beat("liveness")))
+
+    def seed_known_spots(self, spots: List):
+        """
+        ΤΙ ΚΑΝΕΙ: Γεμίζει το μητρώο γνωστών θέσεων (spot_id → πόλη) και τον
+                   χάρτη τελευταίας γνωστής κατάστασης.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py με τις θέσεις της προφόρτωσης του Redis cache.
+        """
+        self.spot_registry.load(spots)
+        self.spot_state.seed({spot.id: spot.status for spot in spots})
+        logger.info(f"Seeded registry and last-known status for {len(spots)} spots")
+
+    async def load_known_spots(self, seed_statuses: bool = True):
+        """
+        ΤΙ ΚΑΝΕΙ: Διαβάζει όλες τις θέσεις από τη βάση και γεμίζει το μητρώο
+                   (και, προαιρετικά, την τελευταία γνωστή κατάσταση).
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: ingest_worker.py (εκεί δεν γίνεται προφόρτωση cache)
+                      και από το περιοδικό refresh του μητρώου.
+        """
+        session = await get_session()
+        try:
+            spots = await ParkingRepository(session).get_all_spots()
+            if seed_statuses:
+                self.seed_known_spots(spots)
+            else:
+                self.spot_registry.load(spots)
+        except Exception as e:
+            logger.error(f"Failed to load known spots: {e}")
+        finally:
+            await session.close()
+
+    async def recover_journal(self) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Αποθηκεύει τις αλλαγές που είχαν μείνει στο journal από
+                   προηγούμενη εκτέλεση (crash πριν το flush).
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py / ingest_worker.py, ΠΡΙΝ ξεκινήσει η λήψη.
+        ΕΠΙΣΤΡΕΦΕΙ: False αν απέτυχε - τότε η λήψη μένει κλειστή
+                    (accepting=False) και ο καλών δεν ξεκινά τον consumer.
+        """
+        try:
+            recovered = await self.batch_writer.recover()
+        except Exception as e:
+            logger.error(f"Failed to replay update journal - ingestion stays closed: {e}")
+            self.accepting = False
+            return False
+        for spot_id, status in recovered:
+            self.spot_state.remember(spot_id, status)
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} spot updates from journal")
+        return True
+
+    async def refresh_registry_task(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Ξαναφορτώνει περιοδικά το μητρώο γνωστών θέσεων.
+        ΓΙΑΤΙ: Ένα ξεχωριστό ingestion process δεν "βλέπει" τις θέσεις που
+               δημιουργεί/διαγράφει ο admin μέσω του API.
+        """
+        while True:
+            await asyncio.sleep(settings.SPOT_REGISTRY_REFRESH_S)
+            await self.load_known_spots(seed_statuses=False)
+
+    def subscription_topics(self) -> List[str]:
+        """
+        ΤΙ ΚΑΝΕΙ: Όλα τα topics εγγραφής: για κάθε πόλη οι μεμονωμένοι
+                   αισθητήρες ('+' = οποιοδήποτε spot_id) και το batch topic.
+        """
+        return [
+            self._subscription_topic(pattern)
+            for city in VALID_CITIES
+            for pattern in (f"parking/{city}/+/status", f"parking/{city}/batch")
+        ]
+
+    def _subscription_topic(self, topic: str) -> str:
+        """
+        ΤΙ ΚΑΝΕΙ: Επιστρέφει το topic εγγραφής, ως shared subscription αν
+                   έχει οριστεί ομάδα.
+        ΠΑΡΑΔΕΙΓΜΑ: "parking/Athens/+/status" → "$share/ingest/parking/Athens/+/status"
+        ΓΙΑΤΙ: Με shared subscription ο broker στέλνει κάθε μήνυμα σε ΕΝΑ
+               μόνο μέλος της ομάδας (load balancing ανάμεσα στα processes).
+        """
+        if self.shared_group:
+            return f"$share/{self.shared_group}/{topic}"
+        return topic
+
+    async def stop(self, timeout: Optional[float] = None) -> Dict:
+        """
+        ΤΙ ΚΑΝΕΙ: Ομαλός τερματισμός (graceful drain) με προθεσμία:
+            1. Σταματά τη λήψη (paho network thread, νέα HTTP ingest)
+            2. Επεξεργάζεται ό,τι έχει ήδη μπει στην ουρά μηνυμάτων
+            3. Εφαρμόζει τις υποψήφιες καταστάσεις του debounce
+            4. Αποθηκεύει τις εκκρεμείς αλλαγές (ή ολοκληρώνει το τρέχον
+               batch του stream persister - τα υπόλοιπα μένουν στο stream)
+            5. Ακυρώνει τα background tasks (και κλείνει το journal)
+        ΠΑΡΑΜΕΤΡΟΙ: timeout - συνολική προθεσμία σε s (None = SHUTDOWN_DRAIN_TIMEOUT_S)
+        ΕΠΙΣΤΡΕΦΕΙ: Αναφορά με το τι επεξεργάστηκε, τι αποθηκεύτηκε και τι χάθηκε.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py (lifespan) και ingest_worker.py.
+        """
+        deadline = time.monotonic() + (settings.SHUTDOWN_DRAIN_TIMEOUT_S if timeout is None else timeout)
+        report = {"queued_processed": 0, "queued_dropped": 0, "debounced_applied": 0,
+                  "flushed": 0, "pending_dropped": 0, "timed_out": False}
+
+        def remaining() -> float:
+            return max(0.0, deadline - time.monotonic())
+
+        # --- 1. Τέλος λήψης: δεν μπαίνουν νέα μηνύματα στην ουρά ---
+        self.accepting = False
+        await self.tasks.cancel("native_client")
+        try:
+            self.client.loop_stop()
+            self.client.disconnect()
+        except Exception as e:
+            logger.error(f"Failed to stop MQTT client: {e}")
+
+        # --- 2. Άδειασμα ουράς: το process_queue συνεχίζει μέχρι να αδειάσει ---
+        queued = self.message_queue.qsize()
+        if queued and self.tasks.is_running("process_queue"):
+            try:
+                await asyncio.wait_for(self.message_queue.join(), timeout=remaining())
+            except asyncio.TimeoutError:
+                report["timed_out"] = True
+        report["queued_dropped"] = self.message_queue.qsize()
+        report["queued_processed"] = queued - report["queued_dropped"]
+
+        # --- 3. Debounce: η τελευταία γνώση του αισθητήρα δεν πρέπει να χαθεί ---
+        await self.tasks.cancel("debounce")
+        drained = self.debouncer.drain()
+        if drained:
+            await self.apply_status_transitions([SensorReading(*item) for item in drained])
+            report["debounced_applied"] = len(drained)
+
+        # --- 4. Αποθήκευση εκκρεμών αλλαγών ---
+        if self.stream_persister:
+            self.stream_persister.stop()
+            supervised = self.tasks.tasks.get("stream_persister")
+            task = supervised.task if supervised else None
+            if task:
+                try:
+                    await asyncio.wait_for(asyncio.shield(task), timeout=remaining())
+                except asyncio.TimeoutError:
+                    report["timed_out"] = True
+                except Exception as e:
+                    logger.error(f"Stream persister failed during shutdown: {e}")
+        else:
+            try:
+                report["flushed"] = await asyncio.wait_for(self.batch_writer.flush("shutdown"), timeout=remaining())
+            except asyncio.TimeoutError:
+                report["timed_out"] = True
+            except Exception as e:
+                logger.error(f"Final flush failed: {e}")
+            report["pending_dropped"] = self.batch_writer.pending_count()
+
+        # --- 5. Ακύρωση όλων των background tasks ---
+        await self.tasks.shutdown()
+
+        # Ό,τι δεν αποθηκεύτηκε μένει στο journal για την επόμενη εκκίνηση
+        if self.batch_writer.journal:
+            self.batch_writer.journal.close()
+
+        logger.info(f"MQTT consumer stopped: {report}")
+        return report
+
     async def process_queue(self):
         """
         ΤΙ ΚΑΝΕΙ: Διαβάζει συνεχώς μηνύματα από την ουρά και τα επεξεργάζεται.
@@ -189,6 +521,7 @@ class MQTTConsumer:
             msg = await self.message_queue.get()
             try:
                 await self.process_mqtt_message(msg)
+                self.tasks.beat("process_queue")
             finally:
                 # Σηματοδοτούμε ότι τελειώσαμε με αυτό το μήνυμα
                 # (σημαντικό για σωστή λειτουργία της Queue)
@@ -200,208 +533,332 @@ class MQTTConsumer:
         ΠΑΡΑΜΕΤΡΟΙ: msg - το MQTT μήνυμα με topic και payload
 
         ΒΗΜΑΤΑ ΕΠΕΞΕΡΓΑΣΙΑΣ:
+        1-3. Αποκωδικοποίηση και επαλήθευση (readings_from_message)
+        4. Φίλτρα no-op / debounce (handle_readings)
+        5. Καταγραφή, batch και ειδοποίηση WebSocket (apply_status_transitions)
+        """
+        try:
+            readings = self.readings_from_message(msg)
+            if readings:
+                await self.handle_readings(readings)
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+
+    def readings_from_message(self, msg) -> List[SensorReading]:
+        """
+        ΤΙ ΚΑΝΕΙ: Μετατρέπει ένα MQTT μήνυμα σε ΕΓΚΥΡΕΣ μετρήσεις αισθητήρων.
+        ΠΑΡΑΜΕΤΡΟΙ: msg - MQTT μήνυμα (paho ή aiomqtt - ίδια πεδία)
+        ΕΠΙΣΤΡΕΦΕΙ: Λίστα SensorReading (κενή αν το μήνυμα απορρίφθηκε).
+
+        ΒΗΜΑΤΑ:
         1. Αποκωδικοποίηση topic → city + spot_id
         2. Αποκωδικοποίηση payload → status
         3. Επαλήθευση ότι city και status είναι έγκυρα
-        4. Άμεση καταγραφή στο SpotStatusLog (ιστορικό)
-        5. Προσθήκη στην ουρά batch updates
-        6. Άμεση ειδοποίηση WebSocket clients
+        4. Απόρριψη διπλότυπων παραδόσεων (QoS 1) - μόνο για μετρήσεις με ts/seq
 
         FORMAT TOPIC: parking/<City>/<SpotId>/status
         Παράδειγμα:   parking/Athens/42/status  με payload "Occupied"
+        ΕΠΙΣΗΣ:       parking/<City>/batch - πολλές θέσεις σε ένα μήνυμα
+                      (βλ. batch_readings)
+        """
+        # str(): το aiomqtt δίνει αντικείμενο Topic, το paho σκέτο string
+        topic = str(msg.topic)
+        readings = self._decode_message(topic, msg.payload)
+
+        # Διπλότυπο QoS 1 (επαναποστολή από τον broker): το αγνοούμε πριν
+        # από οποιαδήποτε εγγραφή. Κλειδί topic + payload (όχι mid: 16 bit,
+        # ξαναχρησιμοποιείται) και μόνο αν το payload έχει ts/seq - ένα σκέτο
+        # "Occupied" μπορεί να είναι νέο γεγονός (βλ. message_dedupe.py)
+        if msg.qos > 0 and self.duplicates.is_redelivery(topic, msg.payload, readings):
+            logger.debug(f"Dropped duplicate delivery of {topic} (mid={msg.mid})")
+            return []
+        return readings
+
+    def _decode_message(self, topic: str, payload: bytes) -> List[SensorReading]:
+        """ΤΙ ΚΑΝΕΙ: Topic + payload → έγκυρες μετρήσεις (βήματα 1-3 του readings_from_message)."""
+        # Διαχωρισμός topic: "parking/Athens/42/status" → ["parking", "Athens", "42", "status"]
+        parts = topic.split("/")
+
+        # Topic πολλών θέσεων από gateway: parking/<City>/batch
+        if len(parts) == 3 and parts[0] == "parking" and parts[2] == "batch":
+            return self.batch_readings(parts[1], payload)
+
+        # Ελέγχουμε ότι το topic έχει τη σωστή δομή
+        if not (len(parts) == 4 and parts[0] == "parking" and parts[3] == "status"):
+            return []
+
+        # Αποκωδικοποίηση bytes → string (UTF-8)
+        payload_raw = payload.decode("utf-8", errors="replace")
+        logger.info(f"Received: {topic} -> {payload_raw}")
+
+        city = parts[1]   # π.χ. "Athens"
+
+        # Μετατροπή spot_id σε αριθμό
+        try:
+            spot_id = int(parts[2])  # π.χ. "42" → 42
+        except ValueError:
+            # Αν το spot_id δεν είναι αριθμός, αγνοούμε το μήνυμα
+            logger.warning(f"Invalid spot id in topic: {parts[2]}")
+            return []
+
+        # Το payload μπορεί να είναι:
+        # - Απλό string: "Occupied" ή "Available"
+        # - JSON: {"status": "Occupied", ...}
+        #   (προαιρετικά με "ts" και "seq" από τον αισθητήρα)
+        status = payload_raw.strip()
+        timestamp, seq = None, None
+        if status.startswith("{"):
+            # Προσπαθούμε να το αναλύσουμε ως JSON
+            try:
+                parsed = json.loads(status)
+                # Παίρνουμε το πεδίο "status" από το JSON
+                status = (parsed.get("status") or "").strip() or status
+                timestamp = parse_timestamp(parsed.get("ts"))
+                seq = parse_seq(parsed.get("seq"))
+            except Exception:
+                pass  # Αν αποτύχει, κρατάμε το αρχικό string
+
+        # Επαλήθευση: η πόλη πρέπει να είναι στη λίστα VALID_CITIES
+        if city not in VALID_CITIES:
+            logger.warning(f"Unsupported city: {city}")
+            return []
+
+        # Επαλήθευση: η κατάσταση πρέπει να είναι έγκυρη
+        # (π.χ. "Available", "Occupied", "Reserved")
+        if status not in VALID_SPOT_STATUSES:
+            logger.warning(f"Invalid status: {status}")
+            return []
+
+        return [SensorReading(spot_id, status, city, timestamp, seq)]
+
+    def batch_readings(self, city: str, payload: bytes) -> List[SensorReading]:
         """
+        ΤΙ ΚΑΝΕΙ: Αποκωδικοποιεί ένα μήνυμα gateway με ΠΟΛΛΕΣ θέσεις.
+        ΠΑΡΑΜΕΤΡΟΙ:
+            city: η πόλη από το topic parking/<City>/batch
+            payload: JSON πίνακας ή packed binary (βλ. sensor_payloads.py)
+        ΕΠΙΣΤΡΕΦΕΙ: Τις έγκυρες μετρήσεις (άκυρες κατάστασεις παραλείπονται).
+
+        ΓΙΑΤΙ: Ένα gateway 200 θέσεων στέλνει 1 μήνυμα αντί για 200 -
+               λιγότερο φορτίο στον broker και λιγότερο Python overhead.
+        """
+        if city not in VALID_CITIES:
+            logger.warning(f"Unsupported city: {city}")
+            return []
         try:
-            topic = msg.topic
-            # Αποκωδικοποίηση bytes → string (UTF-8)
-            payload_raw = msg.payload.decode("utf-8", errors="replace")
-            logger.info(f"Received: {topic} -> {payload_raw}")
+            readings = parse_batch_payload(payload, city)
+        except Exception as e:
+            logger.warning(f"Invalid batch payload for {city}: {e}")
+            return []
 
-            # Διαχωρισμός topic: "parking/Athens/42/status" → ["parking", "Athens", "42", "status"]
-            parts = topic.split("/")
+        logger.info(f"Received batch: {city} -> {len(readings)} readings")
+        valid = [r for r in readings if r.status in VALID_SPOT_STATUSES]
+        if len(valid) != len(readings):
+            logger.warning(f"Dropped {len(readings) - len(valid)} invalid readings in {city} batch")
+        return valid
 
-            # Ελέγχουμε ότι το topic έχει τη σωστή δομή
-            if len(parts) == 4 and parts[0] == "parking" and parts[3] == "status":
-                city = parts[1]   # π.χ. "Athens"
+    async def ingest_readings(self, readings: List[SensorReading]) -> Tuple[int, int]:
+        """
+        ΤΙ ΚΑΝΕΙ: Επαληθεύει (πόλη, κατάσταση) μετρήσεις από εξωτερική πηγή
+                   (HTTP bulk ingest) και τις περνά στην ίδια ροή με τα MQTT
+                   μηνύματα (handle_readings).
+        ΕΠΙΣΤΡΕΦΕΙ: (πόσες έγιναν δεκτές, πόσες απορρίφθηκαν)
+        """
+        valid = [r for r in readings if r.city in VALID_CITIES and r.status in VALID_SPOT_STATUSES]
+        await self.handle_readings(valid)
+        return len(valid), len(readings) - len(valid)
 
-                # Μετατροπή spot_id σε αριθμό
-                try:
-                    spot_id = int(parts[2])  # π.χ. "42" → 42
-                except ValueError:
-                    # Αν το spot_id δεν είναι αριθμός, αγνοούμε το μήνυμα
-                    logger.warning(f"Invalid spot id in topic: {parts[2]}")
-                    return
-
-                # Το payload μπορεί να είναι:
-                # - Απλό string: "Occupied" ή "Available"
-                # - JSON: {"status": "Occupied", ...}
-                status = payload_raw.strip()
-                if status.startswith("{"):
-                    # Προσπαθούμε να το αναλύσουμε ως JSON
-                    try:
-                        parsed = json.loads(status)
-                        # Παίρνουμε το πεδίο "status" από το JSON
-                        status = (parsed.get("status") or "").strip() or status
-                    except Exception:
-                        pass  # Αν αποτύχει, κρατάμε το αρχικό string
-
-                # Επαλήθευση: η πόλη πρέπει να είναι στη λίστα VALID_CITIES
-                if city not in VALID_CITIES:
-                    logger.warning(f"Unsupported city: {city}")
-                    return
-
-                # Επαλήθευση: η κατάσταση πρέπει να είναι έγκυρη
-                # (π.χ. "Available", "Occupied", "Reserved")
-                if status not in VALID_SPOT_STATUSES:
-                    logger.warning(f"Invalid status: {status}")
-                    return
-
-                # --- Άμεση καταγραφή στο SpotStatusLog ---
+    async def handle_readings(self, readings: List[SensorReading]):
+        """
+        ΤΙ ΚΑΝΕΙ: Περνά ΕΓΚΥΡΕΣ μετρήσεις αισθητήρων από τα φίλτρα και
+                   εφαρμόζει όσες είναι πραγματικές αλλαγές.
+        ΠΑΡΑΜΕΤΡΟΙ: readings - ήδη επαληθευμένες (πόλη, κατάσταση)
+
+        ΦΙΛΤΡΑ:
+        0. Άγνωστη θέση ή θέση άλλης πόλης → απορρίπτεται (χωρίς βάση)
+           (όλα τα υπόλοιπα μετράνε ως heartbeat του αισθητήρα)
+        1. Καθυστερημένα: seq/ts παλαιότερο από το watermark της θέσης → απορρίπτεται
+        2. No-op: ίδια κατάσταση με την τελευταία γνωστή → αγνοείται
+           (και ακυρώνεται τυχόν υποψήφια αλλαγή - ο αισθητήρας "γύρισε πίσω")
+        3. Debounce: η νέα κατάσταση εφαρμόζεται μόνο αν μείνει σταθερή
+           για SENSOR_DEBOUNCE_MS (εκτός από "Maintenance")
+        """
+        to_apply: List[SensorReading] = []
+        max_ts = datetime.now() + timedelta(milliseconds=settings.SENSOR_MAX_CLOCK_SKEW_MS)
+        for reading in readings:
+            # --- Μητρώο θέσεων: υπάρχει η θέση και ανήκει σε αυτή την πόλη; ---
+            if not self.spot_registry.accepts(reading.spot_id, reading.city):
+                logger.warning(f"Rejected reading for unknown spot {reading.spot_id} in {reading.city}")
+                continue
+
+            # Heartbeat: ΚΑΘΕ μήνυμα (ακόμα και no-op) δείχνει ότι ο αισθητήρας ζει
+            self.liveness.touch(reading.spot_id)
+
+            # Ρολόι αισθητήρα πολύ μπροστά: αγνοούμε το ts (χρόνος λήψης)
+            if reading.timestamp is not None and reading.timestamp > max_ts:
+                logger.warning(f"Ignoring future timestamp {reading.timestamp} from spot {reading.spot_id}")
+                reading = reading._replace(timestamp=None)
+
+            # --- Καθυστερημένο μήνυμα: υπάρχει ήδη νεότερο για τη θέση ---
+            if self.spot_state.is_stale(reading.spot_id, reading.timestamp, reading.seq):
+                logger.debug(f"Rejected out-of-order reading for spot {reading.spot_id}")
+                continue
+
+            # --- No-op φίλτρο: ίδια κατάσταση με την τελευταία γνωστή ---
+            # Δεν γράφουμε log, δεν μπαίνει στο batch, δεν κάνουμε broadcast
+            if self.spot_state.is_noop(reading.spot_id, reading.status):
+                self.debouncer.cancel(reading.spot_id)
+                logger.debug(f"Suppressed unchanged status for spot {reading.spot_id}: {reading.status}")
+                continue
+
+            # --- Debounce: περιμένουμε να σταθεροποιηθεί η κατάσταση ---
+            # Αν δεν εφαρμοστεί τώρα, θα την εφαρμόσει ο debounce task αργότερα
+            if not self.debouncer.offer(reading.spot_id, reading.status, reading.city):
+                continue
+
+            # Την "θυμόμαστε" ήδη εδώ, ώστε μια επανάληψη της ίδιας θέσης
+            # μέσα στην ίδια ομάδα μετρήσεων να θεωρηθεί no-op
+            self.spot_state.remember(reading.spot_id, reading.status)
+            to_apply.append(reading)
+
+        await self.apply_status_transitions(to_apply)
+
+    async def mark_silent_sensors(self, spot_ids: List[int]):
+        """
+        ΤΙ ΚΑΝΕΙ: Γυρίζει σε SENSOR_STALE_STATUS τις θέσεις των οποίων ο
+                   αισθητήρας σιωπά (βλ. sensor_liveness.py).
+        ΠΑΡΑΜΕΤΡΟΙ: spot_ids - οι θέσεις που βρήκε σιωπηλές το sweep
+        ΣΗΜΕΙΩΣΗ: Θέσεις που διαγράφηκαν ή είναι ήδη σε αυτή την κατάσταση
+                  παραλείπονται. Εφαρμόζεται αμέσως (χωρίς debounce).
+        """
+        status = self.liveness.status
+        readings = []
+        for spot_id in spot_ids:
+            if self.spot_registry.loaded and spot_id not in self.spot_registry.cities:
+                continue
+            if self.spot_state.last_status.get(spot_id) == status:
+                continue
+            # Μια υποψήφια κατάσταση του debounce είναι πια παλιά πληροφορία
+            self.debouncer.cancel(spot_id)
+            readings.append(SensorReading(spot_id, status, self.spot_registry.cities.get(spot_id)))
+        if readings:
+            logger.warning(f"Marking {len(readings)} spots as {status}: sensors stopped reporting")
+        await self.apply_status_transitions(readings)
+
+    async def apply_status_transition(self, spot_id: int, status: str, city: str):
+        """
+        ΤΙ ΚΑΝΕΙ: Εφαρμόζει ΜΙΑ επιβεβαιωμένη αλλαγή (βλ. apply_status_transitions).
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: τον debounce task.
+        """
+        await self.apply_status_transitions([SensorReading(spot_id, status, city)])
+
+    async def apply_status_transitions(self, readings: List[SensorReading]):
+        """
+        ΤΙ ΚΑΝΕΙ: Εφαρμόζει επιβεβαιωμένες αλλαγές κατάστασης θέσεων:
+            1. Καταγραφή στο SpotStatusLog (ιστορικό) - ΕΝΑ commit για όλες
+            2. Προσθήκη στις εκκρεμείς αλλαγές (batch)
+            3. Άμεση ειδοποίηση WebSocket clients
+        """
+        if not readings:
+            return
+        try:
+            for reading in readings:
+                self.spot_state.remember(reading.spot_id, reading.status)
+
+            # --- Redis Stream buffer: γράφουμε μόνο τα events ---
+            # Το ιστορικό και η αποθήκευση γίνονται από τους persistence
+            # workers (XREADGROUP), ώστε η λήψη να μην περιμένει τη βάση
+            if self.event_stream:
+                for reading in readings:
+                    await self.event_stream.append(
+                        reading.spot_id, reading.status, reading.city,
+                        reading.timestamp or datetime.now(),
+                    )
+            else:
+                # --- Καταγραφή στο SpotStatusLog ---
                 # Κάθε αλλαγή κατάστασης καταγράφεται για ιστορικό/στατιστικά
                 session = await get_session()
                 try:
                     log_repo = SpotStatusLogRepository(session)
-                    await log_repo.create_log(spot_id, status)
+                    await log_repo.create_logs([(r.spot_id, r.status, r.timestamp) for r in readings])
                 except Exception as e:
                     logger.error(f"Error logging status change: {e}")
                 finally:
                     await session.close()
 
                 # --- Προσθήκη στις εκκρεμείς αλλαγές για batch αποθήκευση ---
-                # async with batch_lock: αποτρέπει ταυτόχρονη τροποποίηση
-                async with batch_lock:
-                    pending_updates[spot_id] = {
-                        "status": status,
-                        "city": city,
-                        "timestamp": datetime.now(),
-                    }
                 # Αν ο ίδιος spot_id εμφανιστεί ξανά πριν το batch,
                 # αντικαθιστούμε την παλιά τιμή (κρατάμε μόνο την πιο πρόσφατη)
+                for reading in readings:
+                    await self.batch_writer.add(reading.spot_id, reading.status, reading.city, reading.timestamp)
 
-                # --- Άμεση ειδοποίηση WebSocket clients ---
-                # Ενημερώνουμε τον χάρτη ΑΜΕΣΩΣ χωρίς να περιμένουμε το batch
-                await self.broadcast_to_websockets(spot_id, status, city)
+            # --- Άμεση ειδοποίηση WebSocket clients ---
+            # Ενημερώνουμε τον χάρτη ΑΜΕΣΩΣ χωρίς να περιμένουμε το batch
+            # (μόνο ουρές - η αποστολή γίνεται από τους writers του broadcaster)
+            for reading in readings:
+                self.broadcast_to_websockets(reading.spot_id, reading.status, reading.city)
 
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
+            logger.error(f"Error applying {len(readings)} status transitions: {e}")
 
     async def batch_update_task(self):
         """
-        ΤΙ ΚΑΝΕΙ: Κάθε 5 δευτερόλεπτα αποθηκεύει τις εκκρεμείς αλλαγές
-                   στη βάση PostgreSQL ΚΑΙ στο Redis cache.
+        ΤΙ ΚΑΝΕΙ: Αποθηκεύει τις εκκρεμείς αλλαγές στη βάση PostgreSQL
+                   ΚΑΙ στο Redis cache με adaptive flush.
         ΛΕΙΤΟΥΡΓΕΙ: Σε ατέρμονο βρόχο για όλη τη διάρκεια της εφαρμογής.
 
         ΓΙΑΤΙ BATCH:
         Αντί να αποθηκεύουμε κάθε μήνυμα ΑΜΕΣΩΣ (1 query/μήνυμα),
-        μαζεύουμε τις αλλαγές 5 δευτερολέπτων και τις αποθηκεύουμε μαζί.
-        Αυτό μειώνει δραστικά το load στη βάση δεδομένων.
+        μαζεύουμε τις αλλαγές και τις αποθηκεύουμε μαζί.
 
-        REDIS ΕΝΗΜΕΡΩΣΗ:
-        Για κάθε αλλαγή:
-        1. Ενημέρωση του hash spot:{id} με τα νέα δεδομένα
-        2. Προσθήκη στο set spots:by_status:{new_status}
-        3. Αφαίρεση από το set spots:by_status:{old_status} (αν άλλαξε)
-        4. GEO upsert: ενημέρωση τοποθεσίας στο spots:geo:{new_status}
-        5. GEO removal: αφαίρεση από spots:geo:{old_status} (αν άλλαξε)
+        ΠΟΤΕ ΓΙΝΕΤΑΙ ΤΟ FLUSH:
+        Όταν μαζευτούν N θέσεις Ή περάσουν T ms από την πρώτη εκκρεμή
+        αλλαγή (ό,τι έρθει πρώτο) - βλ. spot_batch_writer.py.
         """
-        while True:
-            try:
-                # Περιμένουμε 5 δευτερόλεπτα πριν την επόμενη αποθήκευση
-                await asyncio.sleep(5)
-
-                # Παίρνουμε και αδειάζουμε τις εκκρεμείς αλλαγές (atomic)
-                async with batch_lock:
-                    if not pending_updates:
-                        continue  # Δεν υπάρχουν αλλαγές - παραλείπουμε
-                    updates_to_process = pending_updates.copy()
-                    pending_updates.clear()
+        await self.batch_writer.run(heartbeat=lambda: self.tasks.beat("batch_update"))
 
-                # Ανοίγουμε σύνδεση με τη βάση για τις αποθηκεύσεις
-                session = await get_session()
-                try:
-                    parking_repo = ParkingRepository(session)
-
-                    # Επεξεργαζόμαστε κάθε αλλαγή
-                    for spot_id, update_data in updates_to_process.items():
-                        try:
-                            # Παίρνουμε την τρέχουσα κατάσταση (για σύγκριση)
-                            current_spot = await parking_repo.get_spot_by_id(spot_id)
-                            old_status = current_spot.status if current_spot else None
-
-                            # Ενημέρωση στη βάση PostgreSQL
-                            updated_spot = await parking_repo.update_spot(
-                                spot_id, status=update_data["status"]
-                            )
-                            if not updated_spot:
-                                logger.warning(f"Spot {spot_id} not found")
-                                continue
-
-                            new_status = update_data["status"]
-                            # Ελέγχουμε αν η κατάσταση πράγματι άλλαξε
-                            # (αποφεύγουμε άσκοπες Redis λειτουργίες)
-                            status_changed = (
-                                old_status is not None and new_status != old_status
-                            )
-
-                            # --- Redis: Ενημέρωση hash με πλήρη δεδομένα ---
-                            # hset: ορίζει πολλαπλά πεδία σε ένα hash αντικείμενο
-                            # Το key είναι "spot:{spot_id}", π.χ. "spot:42"
-                            await redis_client.hset(
-                                f"spot:{spot_id}",
-                                mapping={
-                                    "id": str(spot_id),
-                                    "latitude": "" if updated_spot.latitude is None else str(updated_spot.latitude),
-                                    "longitude": "" if updated_spot.longitude is None else str(updated_spot.longitude),
-                                    "location": updated_spot.location,
-                                    "status": new_status,
-                                    "last_updated": (
-                                        updated_spot.last_updated.isoformat()
-                                        if updated_spot.last_updated else ""
-                                    ),
-                                },
-                            )
-
-                            # --- Redis: Ενημέρωση Sets κατάστασης ---
-                            # Προσθέτουμε σε νέο status set
-                            await redis_client.sadd(f"spots:by_status:{new_status}", spot_id)
-                            if status_changed:
-                                # Αφαιρούμε από παλιό status set
-                                await redis_client.srem(f"spots:by_status:{old_status}", spot_id)
-
-                            # --- Redis GEO: Ενημέρωση γεωγραφικής θέσης ---
-                            # Χρειάζεται για τις GEOSEARCH queries στο viewport
-                            if updated_spot.longitude is not None and updated_spot.latitude is not None:
-                                lon = float(updated_spot.longitude)
-                                lat = float(updated_spot.latitude)
-
-                                # GEOADD: Προσθέτει/ενημερώνει συντεταγμένες
-                                # Format: GEOADD key longitude latitude member
-                                await redis_client.execute_command(
-                                    "GEOADD", f"spots:geo:{new_status}", lon, lat, f"spot_{spot_id}"
-                                )
-
-                                if status_changed:
-                                    # ZREM: Αφαιρεί από το παλιό geo set
-                                    # Τα GEO sets είναι εσωτερικά Sorted Sets στο Redis
-                                    await redis_client.execute_command(
-                                        "ZREM", f"spots:geo:{old_status}", f"spot_{spot_id}"
-                                    )
-                            else:
-                                logger.warning(f"Spot {spot_id} missing coordinates; skipping GEO")
-
-                            logger.info(
-                                f"Updated spot {spot_id} in DB; cache upserted "
-                                f"(status_changed={status_changed}, status={new_status})"
-                            )
-
-                        except Exception as e:
-                            logger.error(f"Error updating spot {spot_id}: {e}")
-                finally:
-                    await session.close()  # ΠΑΝΤΑ κλείνουμε τη σύνδεση
-
-            except Exception as e:
-                logger.error(f"Error in batch update task: {e}")
+    def health(self) -> Dict:
+        """
+        ΤΙ ΚΑΝΕΙ: Κατάσταση υγείας για το /health endpoint: ποια tasks τρέχουν,
+                   πόσες φορές ξαναξεκίνησαν, και αν οι εκκρεμείς αλλαγές
+                   περιμένουν ύποπτα πολύ (ο flusher "κόλλησε" ή αποτυγχάνει).
+        """
+        report = self.tasks.health()
+        writer = self.stream_persister.batch_writer if self.stream_persister else self.batch_writer
+        oldest = writer.oldest_pending_age()
+        overdue = oldest is not None and oldest > max(10 * writer.max_delay, 30.0)
+        report.update({
+            "oldest_pending_s": round(oldest, 3) if oldest is not None else None,
+            "last_flush_at": writer.last_flush_at,
+            "flush_overdue": overdue,
+        })
+        report["healthy"] = report["healthy"] and not overdue
+        return report
+
+    def get_stats(self) -> Dict:
+        """
+        ΤΙ ΚΑΝΕΙ: Επιστρέφει μετρικές της ροής δεδομένων (για το /metrics endpoint).
+        ΕΠΙΣΤΡΕΦΕΙ: dictionary με μέγεθος ουράς, εκκρεμείς αλλαγές και στατιστικά flush.
+        """
+        return {
+            "queue_size": self.message_queue.qsize(),
+            "mqtt_client": "aiomqtt" if self.native_pump else "paho",
+            "native_client": self.native_pump.stats() if self.native_pump else None,
+            "buffer": "redis_stream" if self.event_stream else "memory",
+            "suppressed_noop_messages": self.spot_state.suppressed,
+            "stale_messages": self.spot_state.stale,
+            "duplicate_messages": self.duplicates.duplicates,
+            "registry": self.spot_registry.stats(),
+            "debounce": self.debouncer.stats(),
+            "liveness": self.liveness.stats(),
+            "pending_updates": self.batch_writer.pending_count(),
+            "batch_max_size": self.batch_writer.max_batch_size,
+            "batch_max_delay_ms": int(self.batch_writer.max_delay * 1000),
+            "flush": (self.stream_persister.batch_writer if self.stream_persister
+                      else self.batch_writer).stats.snapshot(),
+        }
 
-    async def broadcast_to_websockets(self, spot_id: int, status: str, city: str):
+    def broadcast_to_websockets(self, spot_id: int, status: str, city: str):
         """
         ΤΙ ΚΑΝΕΙ: Στέλνει άμεση ειδοποίηση σε ΟΛΟΥΣ τους συνδεδεμένους browsers.
         ΠΑΡΑΜΕΤΡΟΙ:
@@ -410,70 +867,78 @@ class MQTTConsumer:
             city:    σε ποια πόλη βρίσκεται η θέση
         ΑΠΟΤΕΛΕΣΜΑ: Ο χάρτης στον browser αλλάζει χρώμα ΑΜΕΣΩΣ.
 
-        ΑΣΦΑΛΕΙΑ:
-        Αν ένας client αποσυνδεθεί (π.χ. έκλεισε τον browser), η αποστολή
-        θα αποτύχει. Σε αυτή την περίπτωση, δεν τον προσθέτουμε ξανά
-        στη λίστα (αφαιρείται αυτόματα).
-        """
-        if not websocket_clients:
-            return  # Κανείς δεν είναι συνδεδεμένος - δεν κάνουμε τίποτα
-
-        # Δημιουργούμε το μήνυμα που θα σταλεί στον browser
-        message = {
-            "type": "spot_update",      # Τύπος μηνύματος (το frontend το ελέγχει)
-            "spot_id": spot_id,          # Ποια θέση αλλαξε
-            "status": status,            # Νέα κατάσταση
-            "city": city,                # Πόλη
-            "timestamp": datetime.now().isoformat(),  # Πότε συνέβη
-        }
-
-        # Στέλνουμε σε κάθε connected client
-        # Κρατάμε μόνο αυτούς που ΔΕΝ αποσυνδέθηκαν
-        connected_clients = []
-        for client in websocket_clients:
-            try:
-                await client.send_json(message)
-                connected_clients.append(client)  # Επιτυχία: κρατάμε τον client
-            except Exception as e:
-                # Αποσύνδεση: αφαιρούμε τον client σιωπηλά
-                logger.debug(f"Removed disconnected WebSocket client: {e}")
-
-        # Αντικαθιστούμε τη λίστα με μόνο τους ενεργούς clients
-        websocket_clients.clear()
-        websocket_clients.extend(connected_clients)
+        ΧΩΡΙΣ ΑΝΑΜΟΝΗ:
+        Το μήνυμα μπαίνει μόνο στην ουρά κάθε client (websocket_broadcaster.py).
+        Ένας αργός client δεν καθυστερεί τους άλλους ούτε το process_queue -
+        αν μείνει πολύ πίσω, αποσυνδέεται. Clients που έστειλαν viewport
+        λαμβάνουν μόνο θέσεις μέσα σε αυτό (συντεταγμένες από το spot_registry),
+        και clients γραμμένοι σε κανάλια μόνο τα "city:<city>" / "area:<city>/<area>".
+        Με WS_BROADCAST_BUS=redis η αλλαγή φτάνει στους clients ΟΛΩΝ των API
+        workers (και από ξεχωριστό ingest worker) - βλ. broadcast_bus.py.
+        """
+        # Ο broadcaster κωδικοποιεί την αλλαγή μία φορά και τη βάζει σε
+        # frame "spot_updates" (ή "spot_update")
+        broadcast_bus.publish_spot_status(
+            spot_id, status, city,
+            area=self.spot_registry.areas.get(spot_id),
+            location=self.spot_registry.location(spot_id),
+        )
 
 
 # =======================================================================
-# GLOBAL INSTANCE ΚΑΙ ΒΟΗΘΗΤΙΚΕΣ ΣΥΝΑΡΤΗΣΕΙΣ
+# Ο CONSUMER ΤΟΥ PROCESS ΚΑΙ ΒΟΗΘΗΤΙΚΕΣ ΣΥΝΑΡΤΗΣΕΙΣ
 # =======================================================================
 
-# Δημιουργούμε ένα μόνο instance του MQTTConsumer για ολόκληρη την εφαρμογή
-# (Singleton pattern - μια μόνο σύνδεση MQTT)
-mqtt_consumer = MQTTConsumer()
+# Ένα instance ανά process (μια σύνδεση MQTT, ένα journal), που δημιουργείται
+# ΟΤΑΝ ζητηθεί - όχι στο import: το import του module δεν ανοίγει client ή
+# αρχεία (π.χ. το ingest_worker.py φτιάχνει τον δικό του με άλλο client id)
+_consumer: Optional[MQTTConsumer] = None
 
 
-async def start_mqtt_consumer():
+def get_consumer(client_id: str = "") -> MQTTConsumer:
     """
-    ΤΙ ΚΑΝΕΙ: Εκκινεί τον global MQTT consumer.
-    ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py κατά την εκκίνηση της εφαρμογής.
+    ΤΙ ΚΑΝΕΙ: Επιστρέφει τον consumer του process (τον δημιουργεί την πρώτη φορά).
+    ΠΑΡΑΜΕΤΡΟΙ: client_id - χρησιμοποιείται μόνο στη δημιουργία
+    ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py (lifespan), ingest_worker.py, ingest_router.py
     """
-    await mqtt_consumer.start()
+    global _consumer
+    if _consumer is None:
+        _consumer = MQTTConsumer(client_id=client_id)
+    return _consumer
 
 
-def add_websocket_client(websocket):
+async def forget_spot_state(spot_ids: Iterable[int]):
+    """
+    ΤΙ ΚΑΝΕΙ: Η κατάσταση θέσεων άλλαξε εκτός MQTT (admin, κράτηση, λήξη):
+               το επόμενο μήνυμα αισθητήρα τους ΔΕΝ πρέπει να θεωρηθεί no-op.
+               Ενημερώνει τον consumer αυτού του process ΚΑΙ, μέσω Redis
+               (STATE_INVALIDATE_CHANNEL), όλους τους υπόλοιπους.
+    ΚΑΛΕΙΤΑΙ ΑΠΟ: parking_service.py, reservation_service.py, reservation_expiry.py
     """
-    ΤΙ ΚΑΝΕΙ: Προσθέτει νέο WebSocket client στη λίστα broadcast.
-    ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py όταν συνδέεται νέος browser.
-    ΠΑΡΑΜΕΤΡΟΙ: websocket - το αντικείμενο σύνδεσης
+    spot_ids = list(spot_ids)
+    if not spot_ids:
+        return
+    if _consumer is not None:
+        for spot_id in spot_ids:
+            _consumer.spot_state.forget(spot_id)
+    try:
+        await redis_client.publish(STATE_INVALIDATE_CHANNEL, ",".join(str(spot_id) for spot_id in spot_ids))
+    except Exception as e:
+        logger.error(f"Failed to publish spot state invalidation for {spot_ids}: {e}")
+
+
+def current_consumer() -> Optional[MQTTConsumer]:
     """
-    websocket_clients.append(websocket)
+    ΤΙ ΚΑΝΕΙ: Ο consumer του process, ΑΝ έχει δημιουργηθεί (αλλιώς None).
+    ΚΑΛΕΙΤΑΙ ΑΠΟ: όσους απλώς ενημερώνουν την κατάστασή του (services) -
+                  δεν πρέπει να τον δημιουργήσουν οι ίδιοι.
+    """
+    return _consumer
 
 
-def remove_websocket_client(websocket):
+async def start_mqtt_consumer():
     """
-    ΤΙ ΚΑΝΕΙ: Αφαιρεί WebSocket client όταν αποσυνδεθεί.
-    ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py όταν κλείσει ο browser.
-    ΠΑΡΑΜΕΤΡΟΙ: websocket - το αντικείμενο σύνδεσης προς αφαίρεση
+    ΤΙ ΚΑΝΕΙ: Εκκινεί τον MQTT consumer του process.
+    ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py κατά την εκκίνηση της εφαρμογής.
     """
-    if websocket in websocket_clients:
-        websocket_clients.remove(websocket)
+    await get_consumer().start()
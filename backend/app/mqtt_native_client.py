@@ -0,0 +1,136 @@
+"""
+=======================================================================
+mqtt_native_client.py - MQTT Client Μέσα στο asyncio Event Loop (aiomqtt)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Εναλλακτικός τρόπος λήψης MQTT μηνυμάτων για τον MQTTConsumer
+    (ενεργοποιείται με MQTT_CLIENT=aiomqtt).
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Με το paho, τα μηνύματα φτάνουν σε ΞΕΧΩΡΙΣΤΟ thread και για ΚΑΘΕ
+    μήνυμα κάνουμε loop.call_soon_threadsafe(...) → αλλαγή thread και
+    "ξύπνημα" του event loop ανά μήνυμα.
+
+    Το aiomqtt διαβάζει το socket ΜΕΣΑ στο event loop (χωρίς thread).
+    Επιπλέον, όταν έχουν μαζευτεί πολλά μηνύματα, τα "αδειάζουμε" όλα
+    μαζί (μέχρι MQTT_NATIVE_DRAIN_MAX) και τα περνάμε ως ΜΙΑ ομάδα στο
+    handle_readings → ένα commit στο SpotStatusLog για όλη την ομάδα.
+
+    Η σύγκριση με το paho γίνεται με το scripts/mqtt_client_benchmark.py.
+
+ΕΞΑΡΤΗΣΗ:
+    Το aiomqtt (1.x, συμβατό με paho-mqtt 1.6) φορτώνεται ΜΟΝΟ όταν
+    επιλεγεί αυτός ο τρόπος - ο προεπιλεγμένος δεν το χρειάζεται.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (readings_from_message, handle_readings), config.py
+=======================================================================
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NativeMessagePump:
+    """
+    Συνδέεται στον broker με aiomqtt, λαμβάνει μηνύματα μέσα στο event
+    loop και τα δίνει σε ομάδες στον MQTTConsumer. Ξανασυνδέεται αυτόματα.
+    """
+
+    def __init__(self, consumer):
+        """ΠΑΡΑΜΕΤΡΟΙ: consumer - ο MQTTConsumer που επεξεργάζεται τα μηνύματα"""
+        self.consumer = consumer
+
+        # Η ουρά του aiomqtt (την "πιάνουμε" για να την αδειάζουμε ομαδικά)
+        self._queue: Optional[asyncio.Queue] = None
+
+        # Μετρικές
+        self.messages = 0      # Μηνύματα που λάβαμε
+        self.batches = 0       # Ομάδες που δόθηκαν στο handle_readings
+        self.reconnects = 0    # Επανασυνδέσεις μετά από σφάλμα
+
+    def _queue_class(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Επιστρέφει κλάση ουράς για το client.messages(), που
+                   κρατά αναφορά στο instance της ώστε να κάνουμε get_nowait().
+        """
+        pump = self
+
+        class _CapturedQueue(asyncio.Queue):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                pump._queue = self
+
+        return _CapturedQueue
+
+    def _drain(self, first) -> List:
+        """ΤΙ ΚΑΝΕΙ: Το πρώτο μήνυμα + όσα ήδη περιμένουν (χωρίς αναμονή)."""
+        batch = [first]
+        while self._queue is not None and len(batch) < settings.MQTT_NATIVE_DRAIN_MAX:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def run(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Ατέρμονος βρόχος: σύνδεση → εγγραφή → λήψη σε ομάδες.
+        ΣΕ ΣΦΑΛΜΑ ΣΥΝΔΕΣΗΣ: περιμένει λίγο και ξανασυνδέεται.
+        """
+        try:
+            import aiomqtt  # Προαιρετική εξάρτηση - μόνο για MQTT_CLIENT=aiomqtt
+        except ImportError:
+            logger.error("MQTT_CLIENT=aiomqtt requires the 'aiomqtt' package (pip install aiomqtt)")
+            return
+
+        consumer = self.consumer
+        protocol = aiomqtt.ProtocolVersion.V5 if consumer.shared_group else aiomqtt.ProtocolVersion.V311
+        while True:
+            try:
+                async with aiomqtt.Client(
+                    settings.MQTT_HOST, settings.MQTT_PORT,
+                    client_id=consumer.client_id or None, protocol=protocol, keepalive=60,
+                    clean_session=None if consumer.shared_group else not consumer.persistent_session,
+                    **consumer.session_options(),
+                ) as client:
+                    logger.info("Connected to MQTT broker (aiomqtt)")
+                    async with client.messages(queue_class=self._queue_class()) as messages:
+                        for topic in consumer.subscription_topics():
+                            await client.subscribe(topic, qos=settings.MQTT_QOS)
+                            logger.info(f"Subscribed to {topic} (qos={settings.MQTT_QOS})")
+
+                        async for first in messages:
+                            batch = self._drain(first)
+                            self.messages += len(batch)
+                            self.batches += 1
+                            readings = []
+                            for msg in batch:
+                                try:
+                                    readings.extend(consumer.readings_from_message(msg))
+                                except Exception as e:
+                                    logger.error(f"Error processing message: {e}")
+                            if readings:
+                                await consumer.handle_readings(readings)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.reconnects += 1
+                logger.error(f"MQTT (aiomqtt) connection error: {e}; reconnecting")
+                await asyncio.sleep(settings.MQTT_RECONNECT_DELAY_S)
+
+    def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        return {
+            "messages": self.messages,
+            "batches": self.batches,
+            "avg_batch": round(self.messages / self.batches, 2) if self.batches else 0,
+            "reconnects": self.reconnects,
+        }
@@ -0,0 +1,49 @@
+"""
+=======================================================================
+persist_worker.py - Ξεχωριστό Process Αποθήκευσης από Redis Stream
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Entry point για persistence workers όταν INGEST_BUFFER=redis_stream.
+    Διαβάζει events αισθητήρων από το Redis Stream (consumer group)
+    και τα αποθηκεύει στη βάση + Redis cache.
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Κάθε MQTT consumer συμμετέχει ήδη στο consumer group. Αν η βάση δεν
+    προλαβαίνει, τρέχουμε επιπλέον workers από εδώ - κλιμακώνουμε την
+    αποθήκευση ΑΝΕΞΑΡΤΗΤΑ από τη λήψη MQTT.
+
+ΠΩΣ ΕΚΚΙΝΕΙ:
+    INGEST_BUFFER=redis_stream python -m app.persist_worker
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    sensor_event_stream.py (η λογική του worker)
+=======================================================================
+"""
+
+import asyncio
+import logging
+import os
+import socket
+
+from app.sensor_event_stream import StreamPersistenceWorker
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("app.persist_worker")
+
+
+async def run_worker():
+    """
+    ΤΙ ΚΑΝΕΙ: Τρέχει έναν StreamPersistenceWorker με μοναδικό όνομα.
+    ΣΗΜΕΙΩΣΗ: Ό,τι δεν πρόλαβε να κάνει XACK πριν τον τερματισμό
+              το αναλαμβάνει άλλος worker (XAUTOCLAIM) - δεν χάνεται.
+    """
+    consumer_name = f"persist-{socket.gethostname()}-{os.getpid()}"
+    await StreamPersistenceWorker(consumer_name).run()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        logger.info("Persist worker stopped")
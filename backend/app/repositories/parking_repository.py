@@ -39,6 +39,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, insert, update, delete
 from app.models import ParkingSpot, PaidParking
 from app.database import redis_client
+from app.broadcast_bus import broadcast_bus
 
 logger = logging.getLogger(__name__)
 
@@ -136,6 +137,19 @@ class ParkingRepository:
         """
         return await self.db.get(ParkingSpot, spot_id)
 
+    async def get_spots_by_ids(self, spot_ids: List[int]) -> Dict[int, ParkingSpot]:
+        """
+        ΤΙ ΚΑΝΕΙ: Φέρνει πολλές θέσεις με ΕΝΑ query (WHERE id IN (...)).
+        ΠΑΡΑΜΕΤΡΟΙ: spot_ids - λίστα με τα ids
+        ΕΠΙΣΤΡΕΦΕΙ: {spot_id: ParkingSpot} - όσα ids δεν υπάρχουν λείπουν.
+        ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: Από την ομαδική αποθήκευση του MQTT consumer,
+                         αντί για ένα get_spot_by_id ανά θέση.
+        """
+        if not spot_ids:
+            return {}
+        res = await self.db.execute(select(ParkingSpot).where(ParkingSpot.id.in_(spot_ids)))
+        return {spot.id: spot for spot in res.scalars().all()}
+
     async def create_spot(
         self,
         location: str,
@@ -400,9 +414,12 @@ class ParkingRepository:
 
         return spots, True  # True = επιτυχής ανάγνωση από cache
 
-    async def preload_spots_to_cache(self) -> None:
+    async def preload_spots_to_cache(self) -> List[ParkingSpot]:
         """
         ΤΙ ΚΑΝΕΙ: Φορτώνει ΟΛΑ τα spots από τη βάση στο Redis κατά startup.
+        ΕΠΙΣΤΡΕΦΕΙ: Τις θέσεις που φορτώθηκαν - για να "σπείρει" ο MQTT consumer
+                    την τελευταία γνωστή κατάσταση και το μητρώο γνωστών θέσεων
+                    χωρίς δεύτερο query.
 
         ΓΙΑΤΙ ΧΡΕΙΑΖΕΤΑΙ:
         Αν το Redis είναι άδειο (π.χ. μετά από restart), τα πρώτα requests
@@ -465,6 +482,7 @@ class ParkingRepository:
                 logger.error(f"Error preloading spot {spot.id}: {e}")
 
         logger.info(f"Cache preload complete: {len(all_spots)} spots indexed.")
+        return all_spots
 
     async def upsert_paid_price(self, spot_id: int, price_per_hour: float) -> None:
         """
@@ -598,7 +616,8 @@ class ParkingRepository:
         - Όταν λήγει κράτηση ("Available")
         - Από admin για χειροκίνητη αλλαγή
 
-        Ενημερώνει ΑΥΤΟΜΑΤΑ και το Redis (hash + status sets + GEO index).
+        Ενημερώνει ΑΥΤΟΜΑΤΑ και το Redis (hash + status sets + GEO index)
+        και στέλνει την αλλαγή στους live clients (/ws, /sse) όπως οι αισθητήρες.
         """
         spot = await self.db.get(ParkingSpot, spot_id)
         if not spot:
@@ -639,4 +658,63 @@ class ParkingRepository:
         except Exception as e:
             logger.error(f"Failed to update Redis for spot {spot_id}: {e}")
 
+        # Οι browsers βλέπουν την κράτηση/λήξη αμέσως - χωρίς polling
+        if old_status != new_status:
+            self.publish_status_change(spot)
+
         return spot
+
+    async def release_reserved_spots(self, spot_ids: List[int], new_status: str = "Available") -> List[ParkingSpot]:
+        """
+        ΤΙ ΚΑΝΕΙ: Όπως το update_spot_status, αλλά για ΠΟΛΛΕΣ θέσεις μαζί και
+                   ΜΟΝΟ όσες είναι ακόμα "Reserved": ένα commit, ένα Redis pipeline.
+        ΠΑΡΑΜΕΤΡΟΙ:
+            spot_ids: οι θέσεις των κρατήσεων που έληξαν
+            new_status: η νέα κατάσταση (default "Available")
+        ΕΠΙΣΤΡΕΦΕΙ: Τις θέσεις που άλλαξαν.
+        ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: reservation_expiry.py
+        """
+        spots = await self.get_spots_by_ids(spot_ids)
+        released = [spot for spot in spots.values() if spot.status == "Reserved"]
+        if not released:
+            return []
+
+        now = datetime.utcnow()
+        for spot in released:
+            spot.status = new_status
+            spot.last_updated = now
+        await self.db.commit()
+
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for spot in released:
+                    pipe.hset(f"spot:{spot.id}", mapping={"status": new_status, "last_updated": now.isoformat()})
+                    pipe.srem("spots:by_status:Reserved", spot.id)
+                    pipe.sadd(f"spots:by_status:{new_status}", spot.id)
+                    pipe.zrem("spots:geo:Reserved", f"spot_{spot.id}")
+                    if spot.longitude is not None and spot.latitude is not None:
+                        pipe.execute_command(
+                            "GEOADD", f"spots:geo:{new_status}",
+                            float(spot.longitude), float(spot.latitude), f"spot_{spot.id}",
+                        )
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to update Redis for {len(released)} released spots: {e}")
+
+        for spot in released:
+            self.publish_status_change(spot)
+        return released
+
+    @staticmethod
+    def publish_status_change(spot: ParkingSpot):
+        """
+        ΤΙ ΚΑΝΕΙ: Στέλνει την τρέχουσα κατάσταση μιας θέσης στους live clients
+                   (ίδιο μήνυμα με τις αλλαγές από αισθητήρες - βλ. broadcast_bus.py).
+        """
+        location = None
+        if spot.latitude is not None and spot.longitude is not None:
+            location = (float(spot.latitude), float(spot.longitude))
+        broadcast_bus.publish_spot_status(
+            spot.id, spot.status, spot.city, area=spot.area, location=location,
+            timestamp=spot.last_updated.isoformat() if spot.last_updated else None,
+        )
@@ -23,8 +23,8 @@ reservation_repository.py - Πρόσβαση Δεδομένων Κρατήσεω
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from app.models import Reservation
-from typing import List, Optional
+from app.models import ParkingSpot, Reservation
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from datetime import datetime
 from sqlalchemy.orm import joinedload  # Για να φορτώνει σχέσεις μαζί (JOIN)
 
@@ -167,3 +167,51 @@ class ReservationRepository:
             await self.db.delete(reservation)
             await self.db.commit()
         return reservation
+
+    async def get_spot_ids(self, reservation_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        ΤΙ ΚΑΝΕΙ: Η θέση κάθε κράτησης με ΕΝΑ query (WHERE id IN (...)).
+        ΕΠΙΣΤΡΕΦΕΙ: {reservation_id: spot_id} - όσες δεν υπάρχουν πια λείπουν.
+        ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: reservation_expiry.py (ομαδική λήξη).
+        """
+        reservation_ids = list(reservation_ids)
+        if not reservation_ids:
+            return {}
+        result = await self.db.execute(
+            select(Reservation.id, Reservation.spot_id).where(Reservation.id.in_(reservation_ids))
+        )
+        return {reservation_id: spot_id for reservation_id, spot_id in result.all()}
+
+    async def get_spots_with_active_reservations(self, spot_ids: Iterable[int], now: datetime) -> Set[int]:
+        """
+        ΤΙ ΚΑΝΕΙ: Ποιες από τις θέσεις έχουν ΑΛΛΗ κράτηση που δεν έχει λήξει
+                   (end_time > now ή χωρίς end_time) - αυτές δεν ελευθερώνονται.
+        """
+        spot_ids = list(spot_ids)
+        if not spot_ids:
+            return set()
+        result = await self.db.execute(
+            select(Reservation.spot_id).distinct()
+            .where(Reservation.spot_id.in_(spot_ids))
+            .where((Reservation.end_time > now) | (Reservation.end_time.is_(None)))
+        )
+        return set(result.scalars().all())
+
+    async def get_latest_for_reserved_spots(self) -> List[Tuple[int, datetime]]:
+        """
+        ΤΙ ΚΑΝΕΙ: Για κάθε θέση σε "Reserved", η κράτηση με την πιο αργή λήξη.
+        ΕΠΙΣΤΡΕΦΕΙ: [(reservation_id, end_time), ...]
+        ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ: Στην εκκίνηση, για να ξαναπρογραμματιστούν λήξεις που
+                         δεν υπάρχουν στο Redis (π.χ. κρατήσεις πριν από το restart).
+        """
+        result = await self.db.execute(
+            select(Reservation.id, Reservation.spot_id, Reservation.end_time)
+            .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+            .where(ParkingSpot.status == "Reserved")
+            .where(Reservation.end_time.is_not(None))
+        )
+        latest: Dict[int, Tuple[int, datetime]] = {}
+        for reservation_id, spot_id, end_time in result.all():
+            if spot_id not in latest or end_time > latest[spot_id][1]:
+                latest[spot_id] = (reservation_id, end_time)
+        return list(latest.values())
@@ -7,7 +7,8 @@ Handles database operations for parking spot status history.
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from app.models import SpotStatusLog
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Tuple
 
 class SpotStatusLogRepository:
     def __init__(self, db: AsyncSession):
@@ -34,6 +35,18 @@ class SpotStatusLogRepository:
         await self.db.refresh(log)
         return log
 
+    async def create_logs(self, entries: List[Tuple[int, str, Optional[datetime]]]) -> int:
+        """Insert many (spot_id, status, timestamp) rows with a single commit."""
+        if not entries:
+            return 0
+        self.db.add_all([
+            SpotStatusLog(spot_id=spot_id, status=status, timestamp=timestamp)
+            if timestamp else SpotStatusLog(spot_id=spot_id, status=status)
+            for spot_id, status, timestamp in entries
+        ])
+        await self.db.commit()
+        return len(entries)
+
     async def delete_log(self, log_id: int) -> Optional[SpotStatusLog]:
         log = await self.db.get(SpotStatusLog, log_id)
         if log:
@@ -0,0 +1,206 @@
+"""
+=======================================================================
+reservation_expiry.py - Κεντρική Λήξη Κρατήσεων (Redis Sorted Set)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Κάθε κράτηση γράφεται στο ZSET "reservations:expiry" με score την ώρα
+    λήξης της (end_time). Ένας βρόχος (run) κάθε RESERVATION_EXPIRY_POLL_S
+    παίρνει όσες έληξαν, σε ομάδες των RESERVATION_EXPIRY_BATCH_SIZE, και
+    επαναφέρει τις θέσεις τους σε "Available" (ένα commit ανά ομάδα).
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Πριν, κάθε κράτηση ξεκινούσε ένα task που "κοιμόταν" 30 δευτερόλεπτα
+    στο process που δέχτηκε το request:
+    - σε restart/deploy το task χανόταν → η θέση έμενε "Reserved" για πάντα
+    - χιλιάδες ενεργές κρατήσεις = χιλιάδες tasks στη μνήμη
+    - αγνοούσε το πραγματικό end_time της κράτησης
+    Το ZSET ζει στο Redis: επιβιώνει από restarts και οι ληγμένες είναι
+    απλά ένα εύρος (ZRANGEBYSCORE -inf τώρα) → κόστος ανάλογο με όσες
+    έληξαν, όχι με όλες τις ενεργές.
+
+ΠΟΛΛΑ PROCESSES (ΔΙΕΚΔΙΚΗΣΗ ΜΕ LEASE):
+    Ο βρόχος τρέχει σε κάθε API worker. Ένα ατομικό Lua script παίρνει τις
+    ληγμένες και μεταθέτει το score τους RESERVATION_EXPIRY_LEASE_S στο
+    μέλλον - έτσι κάθε κράτηση την επεξεργάζεται ΕΝΑ process. Μόλις
+    τελειώσει, αφαιρείται από το ZSET. Αν το process πέσει στο μεταξύ, μετά
+    το lease η κράτηση ξαναγίνεται "ληγμένη" και την παίρνει άλλος.
+
+ΑΣΦΑΛΕΙΑ:
+    Μια θέση ελευθερώνεται ΜΟΝΟ αν είναι ακόμα "Reserved" και δεν έχει άλλη
+    κράτηση που δεν έχει λήξει (π.χ. νέα κράτηση μετά από μια ξαναπαραδομένη λήξη).
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    reservation_service.py (schedule/cancel), main.py (recover + run),
+    reservation_repository.py, parking_repository.py, config.py
+=======================================================================
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+from app.database import get_session, redis_client
+from app.mqtt_consumer import forget_spot_state
+from app.repositories.parking_repository import ParkingRepository
+from app.repositories.reservation_repository import ReservationRepository
+
+logger = logging.getLogger(__name__)
+
+# Κλειδί του ZSET: member = reservation id, score = λήξη (epoch s, UTC)
+EXPIRY_KEY = "reservations:expiry"
+
+# Ατομικό "πάρε τις ληγμένες και κράτησέ τες για lease δευτερόλεπτα"
+# (ARGV[1] = τώρα, ARGV[2] = πλήθος, ARGV[3] = τέλος του lease)
+_CLAIM_DUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[1], ARGV[3], id)
+end
+return ids
+"""
+
+# Αφαιρεί όσες επεξεργαστήκαμε - ΜΟΝΟ αν το score είναι ακόμα το lease μας
+# (αν στο μεταξύ άλλαξε το end_time, η νέα λήξη μένει)
+# (ARGV[1] = τέλος του lease, ARGV[2..] = ids)
+_ACK_SCRIPT = """
+local removed = 0
+for i = 2, #ARGV do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score and tonumber(score) == tonumber(ARGV[1]) then
+        removed = removed + redis.call('ZREM', KEYS[1], ARGV[i])
+    end
+end
+return removed
+"""
+
+
+def expiry_score(end_time: datetime) -> float:
+    """ΤΙ ΚΑΝΕΙ: end_time (naive UTC, όπως στη βάση) → epoch δευτερόλεπτα."""
+    if end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo=timezone.utc)
+    return end_time.timestamp()
+
+
+class ReservationExpiryScheduler:
+    """
+    Λήξεις κρατήσεων σε Redis ZSET + περιοδικός βρόχος που τις εκτελεί σε ομάδες.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, lease_s: Optional[int] = None):
+        """
+        ΠΑΡΑΜΕΤΡΟΙ:
+            batch_size: κρατήσεις ανά ομάδα (None = RESERVATION_EXPIRY_BATCH_SIZE)
+            lease_s: διάρκεια διεκδίκησης (None = RESERVATION_EXPIRY_LEASE_S)
+        """
+        self.batch_size = settings.RESERVATION_EXPIRY_BATCH_SIZE if batch_size is None else batch_size
+        self.lease_s = settings.RESERVATION_EXPIRY_LEASE_S if lease_s is None else lease_s
+        self._claim_script = redis_client.register_script(_CLAIM_DUE_SCRIPT)
+        self._ack_script = redis_client.register_script(_ACK_SCRIPT)
+
+        # Μετρικές
+        self.expired = 0        # Κρατήσεις που έληξαν (από αυτό το process)
+        self.released = 0       # Θέσεις που επέστρεψαν σε "Available"
+        self.recovered = 0      # Λήξεις που ξαναπρογραμματίστηκαν στην εκκίνηση
+        self.last_run_at: Optional[float] = None
+
+    async def schedule(self, reservation_id: int, end_time: datetime):
+        """
+        ΤΙ ΚΑΝΕΙ: Προγραμματίζει (ή μεταθέτει) τη λήξη μιας κράτησης.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: reservation_service.py (δημιουργία, αλλαγή end_time).
+        """
+        await redis_client.zadd(EXPIRY_KEY, {str(reservation_id): expiry_score(end_time)})
+
+    async def cancel(self, reservation_id: int):
+        """ΤΙ ΚΑΝΕΙ: Ακυρώνει τη λήξη (η κράτηση διαγράφηκε)."""
+        await redis_client.zrem(EXPIRY_KEY, str(reservation_id))
+
+    async def recover(self) -> int:
+        """
+        ΤΙ ΚΑΝΕΙ: Στην εκκίνηση: για κάθε θέση "Reserved" προγραμματίζει τη
+                   λήξη της τελευταίας κράτησής της, αν λείπει από το ZSET
+                   (π.χ. κρατήσεις πριν από αυτή την αλλαγή ή χαμένο Redis).
+        ΕΠΙΣΤΡΕΦΕΙ: Πόσες λήξεις προστέθηκαν.
+        """
+        session = await get_session()
+        try:
+            latest = await ReservationRepository(session).get_latest_for_reserved_spots()
+        finally:
+            await session.close()
+        if not latest:
+            return 0
+        # nx=True: δεν πειράζουμε λήξεις που ήδη υπάρχουν (ή είναι σε lease)
+        added = await redis_client.zadd(
+            EXPIRY_KEY, {str(reservation_id): expiry_score(end_time) for reservation_id, end_time in latest}, nx=True
+        )
+        self.recovered += added
+        return added
+
+    async def expire_due(self) -> int:
+        """
+        ΤΙ ΚΑΝΕΙ: Μία ομάδα: διεκδικεί έως batch_size ληγμένες κρατήσεις,
+                   ελευθερώνει τις θέσεις τους και τις αφαιρεί από το ZSET.
+        ΕΠΙΣΤΡΕΦΕΙ: Πόσες κρατήσεις διεκδικήθηκαν (batch_size = ίσως υπάρχουν κι άλλες).
+        """
+        now = time.time()
+        lease_until = now + self.lease_s
+        ids = await self._claim_script(keys=[EXPIRY_KEY], args=[now, self.batch_size, lease_until])
+        self.last_run_at = now
+        if not ids:
+            return 0
+        reservation_ids = [int(reservation_id) for reservation_id in ids]
+
+        session = await get_session()
+        try:
+            reservations = ReservationRepository(session)
+            spot_by_reservation: Dict[int, int] = await reservations.get_spot_ids(reservation_ids)
+            spot_ids = set(spot_by_reservation.values())
+            still_held = await reservations.get_spots_with_active_reservations(spot_ids, datetime.utcnow())
+            released = await ParkingRepository(session).release_reserved_spots(sorted(spot_ids - still_held))
+        finally:
+            await session.close()
+
+        # Η κατάσταση άλλαξε εκτός MQTT: το επόμενο μήνυμα αισθητήρα δεν είναι no-op
+        await forget_spot_state(spot.id for spot in released)
+
+        await self._ack_script(keys=[EXPIRY_KEY], args=[lease_until, *ids])
+        self.expired += len(reservation_ids)
+        self.released += len(released)
+        if released:
+            logger.info(f"Expired {len(reservation_ids)} reservations, released {len(released)} spots")
+        return len(reservation_ids)
+
+    async def run(self, heartbeat: Optional[Callable[[], None]] = None):
+        """
+        ΤΙ ΚΑΝΕΙ: Ατέρμονος βρόχος: κάθε RESERVATION_EXPIRY_POLL_S εκτελεί
+                   όσες λήξεις έφτασαν (χωρίς αναμονή όσο γεμίζουν ομάδες).
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py ως supervised task σε κάθε API worker.
+        ΠΑΡΑΜΕΤΡΟΙ: heartbeat - καλείται σε κάθε γύρο (για το /health)
+        """
+        while True:
+            claimed = await self.expire_due()
+            if heartbeat:
+                heartbeat()
+            if claimed < self.batch_size:
+                await asyncio.sleep(settings.RESERVATION_EXPIRY_POLL_S)
+
+    async def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        try:
+            scheduled = await redis_client.zcard(EXPIRY_KEY)
+        except Exception:
+            scheduled = None
+        return {
+            "scheduled": scheduled,
+            "expired": self.expired,
+            "released": self.released,
+            "recovered": self.recovered,
+            "last_run_at": self.last_run_at,
+        }
+
+
+# Ένα instance ανά API process
+reservation_expiry = ReservationExpiryScheduler()
@@ -0,0 +1,108 @@
+"""
+=======================================================================
+ingest_router.py - HTTP Endpoint Μαζικής Λήψης Events Αισθητήρων
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Δέχεται χιλιάδες αλλαγές κατάστασης θέσεων σε ΕΝΑ HTTP request και
+    τις περνά στην ΙΔΙΑ ροή με τα MQTT μηνύματα (επαλήθευση, no-op,
+    debounce, batch αποθήκευση, WebSocket broadcast).
+
+ΤΕΛΙΚΑ URLs (με prefix /api):
+    POST /api/ingest/events               → NDJSON (ένα event ανά γραμμή)
+    POST /api/ingest/events?city=Athens   → packed binary (13 bytes/event)
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Κάποιοι δήμοι στέλνουν δεδομένα από δικά τους backend συστήματα, όχι
+    μέσω MQTT. Η επανάληψη μιας ημέρας events με ένα MQTT publish ανά
+    μήνυμα είναι πολύ αργή.
+
+ΜΟΡΦΕΣ ΣΩΜΑΤΟΣ (βλ. sensor_payloads.py):
+    Content-Type: application/x-ndjson (ή οτιδήποτε άλλο)
+        {"spot_id": 42, "city": "Athens", "status": "Occupied", "ts": 1700000000000}
+        {"spot_id": 43, "city": "Athens", "status": "Available"}
+    Content-Type: application/octet-stream + query ?city=<City>
+        εγγραφές uint32 spot_id | uint8 status | uint64 ts_ms (big-endian)
+
+ΑΠΑΙΤΕΙ ADMIN (όπως οι αλλαγές θέσεων στο parking_router.py).
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (ingest_readings), sensor_payloads.py, ingest_dto.py
+=======================================================================
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from app.core.config import settings
+from app.core.deps import get_current_admin_user
+from app.dtos.ingest_dto import IngestResponse
+from app.models import User
+from app.mqtt_consumer import get_consumer
+from app.sensor_payloads import parse_batch_payload_counted, parse_ndjson
+
+# Prefix /ingest
+router = APIRouter(prefix="/ingest", tags=["ingest"])
+
+BINARY_CONTENT_TYPE = "application/octet-stream"
+
+
+# =======================================================================
+# ENDPOINT: Μαζική Λήψη Events
+# =======================================================================
+@router.post("/events", response_model=IngestResponse)
+async def ingest_events(
+    request: Request,
+    city: Optional[str] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    ΤΙ ΚΑΝΕΙ: Αποκωδικοποιεί το σώμα και περνά τα έγκυρα events στη ροή
+               επεξεργασίας, σε κομμάτια των INGEST_HTTP_CHUNK_SIZE.
+    ΠΑΡΑΜΕΤΡΟΙ: city - υποχρεωτικό ΜΟΝΟ για binary σώμα (δεν έχει πόλη ανά event)
+    ΠΡΟΣΤΑΤΕΥΜΕΝΟ: Μόνο admin.
+    ΣΦΑΛΜΑ 400: Binary χωρίς city ή μη αναγνωρίσιμο binary σώμα.
+    ΣΦΑΛΜΑ 413: Σώμα μεγαλύτερο από INGEST_HTTP_MAX_BYTES.
+    ΣΦΑΛΜΑ 503: Η εφαρμογή τερματίζει.
+    """
+    # Ο consumer τερματίζει (graceful drain) - ο client ας ξαναδοκιμάσει
+    mqtt_consumer = get_consumer()
+    if not mqtt_consumer.accepting:
+        raise HTTPException(status_code=503, detail="Ingestion is shutting down")
+
+    body = await request.body()
+    if len(body) > settings.INGEST_HTTP_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Request body too large")
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == BINARY_CONTENT_TYPE:
+        if not city:
+            raise HTTPException(status_code=400, detail="Query parameter 'city' is required for binary payloads")
+        try:
+            readings, received = parse_batch_payload_counted(body, city)
+        except (ValueError, OverflowError, OSError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        rejected = received - len(readings)  # Άκυρες εγγραφές (κατάσταση, ts, δομή)
+        errors = []
+    else:
+        try:
+            readings, rejected, errors = parse_ndjson(body)
+        except (ValueError, OverflowError, OSError) as e:
+            # Οι άκυρες γραμμές απορρίπτονται μία-μία - εδώ φτάνει μόνο κάτι απρόβλεπτο
+            raise HTTPException(status_code=400, detail=f"Invalid NDJSON body: {e}")
+        received = len(readings) + rejected
+
+    # Τα tasks debounce/batch τρέχουν και όταν το API δεν έχει MQTT consumer
+    mqtt_consumer.ensure_pipeline()
+
+    accepted = invalid = 0
+    chunk_size = max(1, settings.INGEST_HTTP_CHUNK_SIZE)
+    for start in range(0, len(readings), chunk_size):
+        ok, bad = await mqtt_consumer.ingest_readings(readings[start:start + chunk_size])
+        accepted += ok
+        invalid += bad
+
+    if invalid:
+        errors.append(f"{invalid} events had an unknown city or status")
+
+    return IngestResponse(received=received, accepted=accepted, rejected=rejected + invalid, errors=errors)
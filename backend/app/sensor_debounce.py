@@ -0,0 +1,165 @@
+"""
+=======================================================================
+sensor_debounce.py - Debounce / Hysteresis για "Ασταθείς" Αισθητήρες
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Οι φθηνοί αισθητήρες (μαγνητόμετρα) "τρεμοπαίζουν" ανάμεσα σε
+    Occupied/Available πολλές φορές το δευτερόλεπτο όσο ένα αυτοκίνητο
+    κάνει μανούβρα. Κάθε τέτοια αλλαγή γινόταν εγγραφή στο log, θέση στο
+    batch και broadcast σε όλους τους browsers.
+
+    Εδώ μια νέα κατάσταση ΔΕΝ εφαρμόζεται αμέσως: γίνεται "υποψήφια" και
+    εφαρμόζεται μόνο αν μείνει σταθερή για SENSOR_DEBOUNCE_MS.
+    - Αν στο μεταξύ έρθει ΑΛΛΗ κατάσταση, το χρονόμετρο ξεκινά από την αρχή
+    - Αν ο αισθητήρας γυρίσει στην προηγούμενη (ήδη εφαρμοσμένη) κατάσταση,
+      η υποψήφια ακυρώνεται - δεν γράφεται τίποτα
+    - Η "Maintenance" εξαιρείται: εφαρμόζεται ΑΜΕΣΩΣ
+
+ΠΩΣ ΛΕΙΤΟΥΡΓΕΙ ΧΩΡΙΣ ΕΝΑ TIMER ΑΝΑ ΘΕΣΗ:
+    Κρατάμε ένα heap (ουρά προτεραιότητας) με τις προθεσμίες και ΕΝΑΝ
+    asyncio task που "ξυπνά" μόνο όταν λήγει η πλησιέστερη προθεσμία.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (offer/cancel και run), config.py (SENSOR_DEBOUNCE_MS)
+=======================================================================
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Καταστάσεις που εφαρμόζονται χωρίς debounce
+DEBOUNCE_EXEMPT_STATUSES = ("Maintenance",)
+
+
+class SpotDebouncer:
+    """
+    Κρατάει την υποψήφια κατάσταση ανά θέση και την "απελευθερώνει"
+    όταν μείνει σταθερή για όλο το παράθυρο debounce.
+    """
+
+    def __init__(self, window_ms: Optional[int] = None):
+        """
+        ΠΑΡΑΜΕΤΡΟΙ: window_ms - παράθυρο σταθερότητας (0 = χωρίς debounce,
+                    None = από config.py)
+        """
+        self.window = max(0, settings.SENSOR_DEBOUNCE_MS if window_ms is None else window_ms) / 1000.0
+
+        # candidates: spot_id → (status, city, deadline)
+        self.candidates: Dict[int, Tuple[str, str, float]] = {}
+
+        # heap: (deadline, spot_id) - μπορεί να περιέχει "παλιές" εγγραφές
+        # που αγνοούνται αν δεν ταιριάζουν πια με το candidates (lazy deletion)
+        self._heap: List[Tuple[float, int]] = []
+
+        # _wakeup: "ξυπνά" τον run() όταν μπει νέα (πιθανώς πλησιέστερη) προθεσμία
+        self._wakeup = asyncio.Event()
+
+        # Μετρικές
+        self.emitted = 0      # Μεταβάσεις που εφαρμόστηκαν μετά από debounce
+        self.discarded = 0    # Υποψήφιες που ακυρώθηκαν/αντικαταστάθηκαν (flapping)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def offer(self, spot_id: int, status: str, city: str) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Προτείνει νέα κατάσταση για μια θέση.
+        ΕΠΙΣΤΡΕΦΕΙ: True αν πρέπει να εφαρμοστεί ΑΜΕΣΩΣ (debounce ανενεργό
+                    ή εξαιρούμενη κατάσταση), False αν θα εφαρμοστεί αργότερα
+                    από τον run() (αν μείνει σταθερή).
+        """
+        if not self.enabled or status in DEBOUNCE_EXEMPT_STATUSES:
+            self.cancel(spot_id)
+            return True
+
+        current = self.candidates.get(spot_id)
+        if current and current[0] == status:
+            return False  # Ίδια υποψήφια - το χρονόμετρο συνεχίζει
+
+        if current:
+            self.discarded += 1  # Άλλαξε πριν σταθεροποιηθεί
+
+        deadline = time.monotonic() + self.window
+        self.candidates[spot_id] = (status, city, deadline)
+        heapq.heappush(self._heap, (deadline, spot_id))
+        self._wakeup.set()
+        return False
+
+    def cancel(self, spot_id: int):
+        """
+        ΤΙ ΚΑΝΕΙ: Ακυρώνει την υποψήφια κατάσταση μιας θέσης.
+        ΠΟΤΕ: Όταν ο αισθητήρας γύρισε στην ήδη εφαρμοσμένη κατάσταση.
+        """
+        if self.candidates.pop(spot_id, None) is not None:
+            self.discarded += 1
+
+    def drain(self) -> List[Tuple[int, str, str]]:
+        """
+        ΤΙ ΚΑΝΕΙ: Αδειάζει ΟΛΕΣ τις υποψήφιες καταστάσεις χωρίς να περιμένει.
+        ΕΠΙΣΤΡΕΦΕΙ: [(spot_id, status, city), ...] για άμεση εφαρμογή.
+        ΠΟΤΕ: Κατά τον τερματισμό - η τελευταία γνώση του αισθητήρα είναι
+              καλύτερη από το να χαθεί.
+        """
+        drained = [(spot_id, status, city) for spot_id, (status, city, _) in self.candidates.items()]
+        self.candidates.clear()
+        self._heap.clear()
+        return drained
+
+    def pending_count(self) -> int:
+        """ΤΙ ΚΑΝΕΙ: Πόσες θέσεις έχουν υποψήφια κατάσταση σε αναμονή."""
+        return len(self.candidates)
+
+    async def run(self, emit: Callable[[int, str, str], Awaitable[None]]):
+        """
+        ΤΙ ΚΑΝΕΙ: Ατέρμονος βρόχος που εφαρμόζει τις υποψήφιες καταστάσεις
+                   των οποίων έληξε το παράθυρο σταθερότητας.
+        ΠΑΡΑΜΕΤΡΟΙ: emit - async συνάρτηση (spot_id, status, city) που
+                    εφαρμόζει τη μετάβαση (log, batch, broadcast)
+        """
+        while True:
+            try:
+                self._wakeup.clear()
+                timeout = None
+                now = time.monotonic()
+
+                # Απελευθερώνουμε όσες προθεσμίες έχουν λήξει
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, spot_id = heapq.heappop(self._heap)
+                    candidate = self.candidates.get(spot_id)
+                    if not candidate or candidate[2] != deadline:
+                        continue  # Παλιά εγγραφή heap (αντικαταστάθηκε/ακυρώθηκε)
+                    del self.candidates[spot_id]
+                    self.emitted += 1
+                    await emit(spot_id, candidate[0], candidate[1])
+
+                if self._heap:
+                    timeout = max(0.0, self._heap[0][0] - time.monotonic())
+
+                # Περιμένουμε την πλησιέστερη προθεσμία ή νέα υποψήφια
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in debounce task: {e}")
+
+    def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        return {
+            "window_ms": int(self.window * 1000),
+            "pending": self.pending_count(),
+            "emitted": self.emitted,
+            "discarded": self.discarded,
+        }
@@ -0,0 +1,276 @@
+"""
+=======================================================================
+sensor_event_stream.py - Redis Stream Ανάμεσα σε Λήψη και Αποθήκευση
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Όταν INGEST_BUFFER=redis_stream, ο MQTT consumer ΔΕΝ αποθηκεύει ο
+    ίδιος τα μηνύματα. Τα γράφει (XADD) σε ένα Redis Stream και
+    "persistence workers" τα διαβάζουν από εκεί και τα αποθηκεύουν.
+
+ΤΙ ΕΙΝΑΙ ΕΝΑ REDIS STREAM:
+    Ένα append-only "ημερολόγιο" μέσα στο Redis. Με ένα consumer group:
+    - XREADGROUP: κάθε event παραδίδεται σε ΕΝΑΝ worker της ομάδας
+    - XACK: ο worker επιβεβαιώνει ότι το αποθήκευσε
+    - Όσα δεν έχουν XACK μένουν "pending" - αν ο worker πέσει, άλλος
+      τα αναλαμβάνει με XAUTOCLAIM (δεν χάνονται όπως το pending dict)
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    - Η λήψη MQTT δεν περιμένει την PostgreSQL (αποσύνδεση ταχυτήτων)
+    - Οι persistence workers κλιμακώνονται ανεξάρτητα
+    - Αν η βάση αργήσει, τα events μαζεύονται στο stream και οι workers
+      "προλαβαίνουν" αργότερα (catch up)
+
+ΣΕΙΡΑ ΚΑΙ ΕΠΑΝΑΛΗΨΕΙΣ:
+    Ένα event που αναλαμβάνεται με XAUTOCLAIM (ή που διάβασε ταυτόχρονα
+    άλλος worker) μπορεί να είναι ΠΑΛΑΙΟΤΕΡΟ από ό,τι έχει ήδη εφαρμοστεί.
+    Γι' αυτό κρατάμε στο Redis (WATERMARK_KEY) τον χρόνο αισθητήρα της
+    τελευταίας εφαρμοσμένης αλλαγής ανά θέση: παλαιότερα events γράφονται
+    μόνο στο ιστορικό, δεν "γυρίζουν πίσω" την κατάσταση.
+    Αν η αποθήκευση αποτύχει, το batch ΔΕΝ ξαναμπαίνει στη μνήμη - μένει
+    pending στο stream και η μόνη επανάληψη είναι το XAUTOCLAIM.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (XADD), persist_worker.py (entry point),
+    spot_batch_writer.py (αποθήκευση), spot_status_log_repository.py
+=======================================================================
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.database import get_session, redis_client
+from app.repositories.spot_status_log_repository import SpotStatusLogRepository
+from app.spot_batch_writer import SpotBatchWriter
+
+logger = logging.getLogger(__name__)
+
+# Ένα event όπως το διαβάζουμε: (stream id, πεδία)
+StreamEntry = Tuple[str, Dict[str, str]]
+
+# Hash: spot_id → χρόνος αισθητήρα (epoch ms) της τελευταίας εφαρμοσμένης αλλαγής
+WATERMARK_KEY = "spots:stream:applied_ts"
+
+# Ατομικό "κράτα όσες δεν είναι παλαιότερες από το watermark και προώθησέ το"
+# (ARGV = spot_id, ts, spot_id, ts, ...). Το ίσο περνά: μια επανάληψη μετά
+# από αποτυχημένη αποθήκευση πρέπει να ξαναεφαρμοστεί.
+_ADVANCE_WATERMARK_SCRIPT = """
+local fresh = {}
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current or tonumber(ARGV[i + 1]) >= tonumber(current) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        table.insert(fresh, ARGV[i])
+    end
+end
+return fresh
+"""
+
+
+class SensorEventStream:
+    """
+    Λεπτό "περιτύλιγμα" γύρω από τις εντολές Redis Streams που χρειαζόμαστε.
+    """
+
+    def __init__(self, key: Optional[str] = None, group: Optional[str] = None):
+        self.key = key or settings.INGEST_STREAM_KEY
+        self.group = group or settings.INGEST_STREAM_GROUP
+
+    async def append(self, spot_id: int, status: str, city: str, timestamp: datetime) -> str:
+        """
+        ΤΙ ΚΑΝΕΙ: Προσθέτει ένα έγκυρο event αισθητήρα στο stream (XADD).
+        ΕΠΙΣΤΡΕΦΕΙ: Το id του event (π.χ. "1700000000000-0").
+        ΣΗΜΕΙΩΣΗ: MAXLEN ~ → το Redis κόβει τα παλιά events χωρίς να
+                  το κάνει ακριβώς σε κάθε XADD (φθηνότερο).
+        """
+        return await redis_client.xadd(
+            self.key,
+            {"spot_id": str(spot_id), "status": status, "city": city, "ts": timestamp.isoformat()},
+            maxlen=settings.INGEST_STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    async def ensure_group(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Δημιουργεί το consumer group (και το stream, MKSTREAM).
+        Αν υπάρχει ήδη (BUSYGROUP), δεν κάνει τίποτα.
+        """
+        try:
+            await redis_client.xgroup_create(self.key, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def claim_stale(self, consumer: str, count: int) -> List[StreamEntry]:
+        """
+        ΤΙ ΚΑΝΕΙ: Αναλαμβάνει events που διάβασε άλλος worker αλλά δεν
+                   επιβεβαίωσε εδώ και INGEST_STREAM_CLAIM_IDLE_MS (XAUTOCLAIM).
+        ΕΠΙΣΤΡΕΦΕΙ: Λίστα events (μπορεί κενή).
+        """
+        res = await redis_client.xautoclaim(
+            self.key, self.group, consumer,
+            min_idle_time=settings.INGEST_STREAM_CLAIM_IDLE_MS,
+            start_id="0-0", count=count,
+        )
+        # Απάντηση: [next_start_id, [(id, fields), ...], (deleted ids - Redis 7)]
+        return [e for e in (res[1] if res and len(res) > 1 else []) if e and e[1]]
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> List[StreamEntry]:
+        """
+        ΤΙ ΚΑΝΕΙ: Διαβάζει ΝΕΑ events για αυτόν τον worker (XREADGROUP ">").
+        ΠΑΡΑΜΕΤΡΟΙ: block_ms - πόσο να περιμένει αν δεν υπάρχει τίποτα
+        """
+        res = await redis_client.xreadgroup(
+            self.group, consumer, streams={self.key: ">"}, count=count, block=max(1, block_ms),
+        )
+        entries: List[StreamEntry] = []
+        for _stream, stream_entries in res or []:
+            entries.extend(stream_entries)
+        return entries
+
+    async def ack(self, ids: List[str]):
+        """ΤΙ ΚΑΝΕΙ: Επιβεβαιώνει (XACK) ότι τα events αποθηκεύτηκαν."""
+        if ids:
+            await redis_client.xack(self.key, self.group, *ids)
+
+
+class StreamPersistenceWorker:
+    """
+    Worker που διαβάζει events από το stream και τα αποθηκεύει
+    (SpotStatusLog + θέσεις στη βάση/Redis), με την ίδια λογική
+    adaptive flush: N events Ή T ms από το πρώτο (ό,τι έρθει πρώτο).
+
+    XACK γίνεται ΜΟΝΟ αφού πετύχει η αποθήκευση: αν αποτύχει, τα events
+    μένουν pending και ξαναδοκιμάζονται (από εμάς ή άλλον worker).
+    """
+
+    def __init__(self, consumer_name: str, stream: Optional[SensorEventStream] = None):
+        self.consumer_name = consumer_name
+        self.stream = stream or SensorEventStream()
+        # Χωρίς requeue στη μνήμη: το stream (PEL) είναι ο μόνος δρόμος επανάληψης
+        self.batch_writer = SpotBatchWriter(requeue_on_failure=False)
+        self._watermark_script = redis_client.register_script(_ADVANCE_WATERMARK_SCRIPT)
+        # Μετρικές: events παλαιότερα από την ήδη εφαρμοσμένη κατάσταση
+        self.stale_skipped = 0
+        # _stopping: ο βρόχος τελειώνει μετά το τρέχον batch (βλ. stop())
+        self._stopping = False
+
+    def stop(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Ζητά από τον run() να σταματήσει ΜΕΤΑ το τρέχον batch
+                   (αποθήκευση + XACK), ώστε να μη μείνει μισοαποθηκευμένο.
+        """
+        self._stopping = True
+
+    async def run(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Βρόχος συλλογή batch → αποθήκευση → XACK, μέχρι το stop().
+        """
+        await self.stream.ensure_group()
+        logger.info(
+            f"Stream persister {self.consumer_name} reading {self.stream.key} "
+            f"(group={self.stream.group})"
+        )
+        while not self._stopping:
+            try:
+                entries = await self._collect_batch()
+                if entries:
+                    await self._persist(entries)
+                    await self.stream.ack([entry_id for entry_id, _ in entries])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in stream persistence worker: {e}")
+                await asyncio.sleep(1)  # Μικρή παύση για να μη "γυρίζει" σε σφάλμα
+
+    async def _collect_batch(self) -> List[StreamEntry]:
+        """
+        ΤΙ ΚΑΝΕΙ: Μαζεύει events μέχρι N (MQTT_BATCH_MAX_SIZE) ή μέχρι
+                   να περάσουν T ms από το πρώτο (MQTT_BATCH_MAX_DELAY_MS).
+        ΠΡΩΤΑ: αναλαμβάνει τυχόν "ορφανά" events άλλων workers.
+        """
+        max_size = self.batch_writer.max_batch_size
+        entries = await self.stream.claim_stale(self.consumer_name, max_size)
+
+        deadline: Optional[float] = time.monotonic() + self.batch_writer.max_delay if entries else None
+        while len(entries) < max_size:
+            if deadline is None:
+                # Δεν έχουμε τίποτα ακόμα: περιμένουμε μέχρι να έρθει το πρώτο
+                block_ms = int(self.batch_writer.max_delay * 1000) or 1000
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                block_ms = int(remaining * 1000)
+
+            new_entries = await self.stream.read(self.consumer_name, max_size - len(entries), block_ms)
+            if new_entries and deadline is None:
+                deadline = time.monotonic() + self.batch_writer.max_delay
+            entries.extend(new_entries)
+            if not new_entries and deadline is None:
+                return entries  # Τίποτα - ο run() θα ξαναπροσπαθήσει
+        return entries
+
+    async def _persist(self, entries: List[StreamEntry]):
+        """
+        ΤΙ ΚΑΝΕΙ: Αποθηκεύει ένα batch events:
+            1. Μόνο την πιο πρόσφατη κατάσταση ανά θέση στη βάση + Redis
+               (και μόνο αν δεν έχει ήδη εφαρμοστεί νεότερη - watermark)
+            2. ΟΛΑ τα events στο SpotStatusLog (ένα commit)
+        """
+        log_entries = []
+        # Η πιο πρόσφατη (κατά χρόνο αισθητήρα) αλλαγή ανά θέση στο batch
+        latest: Dict[int, Tuple[str, str, Optional[datetime]]] = {}
+        for _entry_id, fields in entries:
+            try:
+                spot_id = int(fields["spot_id"])
+                status = fields["status"]
+                city = fields.get("city", "")
+                ts = datetime.fromisoformat(fields["ts"]) if fields.get("ts") else None
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Skipping malformed stream event {fields}: {e}")
+                continue
+            log_entries.append((spot_id, status, ts))
+            current = latest.get(spot_id)
+            if current is None or ts is None or (current[2] is not None and ts >= current[2]):
+                latest[spot_id] = (status, city, ts)
+
+        fresh = await self._advance_watermarks(latest)
+        for spot_id, (status, city, ts) in latest.items():
+            if spot_id in fresh:
+                await self.batch_writer.add(spot_id, status, city, ts)
+
+        # Πρώτα η κατάσταση θέσεων (idempotent - ασφαλές αν ξαναγίνει),
+        # μετά το ιστορικό, ώστε μια αποτυχία να μη διπλογράφει logs
+        await self.batch_writer.flush("size" if len(entries) >= self.batch_writer.max_batch_size else "time")
+
+        session = await get_session()
+        try:
+            await SpotStatusLogRepository(session).create_logs(log_entries)
+        finally:
+            await session.close()
+
+    async def _advance_watermarks(self, latest: Dict[int, Tuple[str, str, Optional[datetime]]]) -> Set[int]:
+        """
+        ΤΙ ΚΑΝΕΙ: Κρατά τις θέσεις των οποίων η αλλαγή δεν είναι παλαιότερη
+                   από την ήδη εφαρμοσμένη, και προωθεί το watermark τους.
+        ΕΠΙΣΤΡΕΦΕΙ: Τα spot_id που πρέπει να εφαρμοστούν.
+        ΣΗΜΕΙΩΣΗ: Events χωρίς χρόνο αισθητήρα δεν συγκρίνονται (εφαρμόζονται).
+        """
+        fresh = {spot_id for spot_id, (_, _, ts) in latest.items() if ts is None}
+        args: List = []
+        for spot_id, (_, _, ts) in latest.items():
+            if ts is not None:
+                args.extend((spot_id, int(ts.timestamp() * 1000)))
+        if args:
+            accepted = await self._watermark_script(keys=[WATERMARK_KEY], args=args)
+            fresh.update(int(spot_id) for spot_id in accepted)
+        skipped = len(latest) - len(fresh)
+        if skipped:
+            self.stale_skipped += skipped
+            logger.info(f"Skipped {skipped} stream events older than the applied spot status")
+        return fresh
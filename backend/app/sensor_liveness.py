@@ -0,0 +1,163 @@
+"""
+=======================================================================
+sensor_liveness.py - Ανίχνευση Αισθητήρων που Σταμάτησαν να Στέλνουν
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Κρατάει πότε "ακούσαμε" τελευταία φορά κάθε αισθητήρα (heartbeat) και
+    βρίσκει όσους σιωπούν περισσότερο από SENSOR_STALE_AFTER_S. Ο MQTT
+    consumer γυρίζει τις θέσεις τους σε SENSOR_STALE_STATUS (π.χ.
+    "Maintenance"), αντί να μένει στον χάρτη η τελευταία κατάσταση για πάντα.
+
+ΓΙΑΤΙ REDIS SORTED SET (ΚΑΙ ΟΧΙ TIMER ΑΝΑ ΘΕΣΗ):
+    - Ένα ZSET "sensors:last_seen": member = spot_id, score = χρόνος λήψης.
+      Οι "σιωπηλοί" είναι απλά ένα εύρος: ZRANGEBYSCORE -inf (τώρα - timeout)
+      → κόστος ανάλογο με όσους έληξαν, όχι με το σύνολο (100k+ θέσεις).
+    - Με shared subscriptions τα μηνύματα μιας θέσης μοιράζονται σε
+      ΠΟΛΛΑ processes - ένας χάρτης στη μνήμη κάθε process δεν θα ήξερε
+      ότι ο αισθητήρας μίλησε σε άλλο. Το ZSET είναι κοινό για όλα.
+
+ΚΟΣΤΟΣ ΑΝΑ ΜΗΝΥΜΑ:
+    touch() γράφει μόνο σε dict στη μνήμη. Μία φορά το δευτερόλεπτο όλα
+    μαζί πάνε στο Redis με ΕΝΑ ZADD (η τελευταία τιμή ανά θέση).
+
+ΠΟΙΟΣ ΚΑΝΕΙ ΤΗ ΜΕΤΑΒΑΣΗ:
+    Το sweep διαβάζει ΚΑΙ αφαιρεί τους σιωπηλούς σε ένα ατομικό Lua script.
+    Αν τρέχουν πολλά processes, κάθε θέση "διεκδικείται" από ΕΝΑ μόνο.
+    Η θέση ξαναμπαίνει στο ZSET με το επόμενο μήνυμα του αισθητήρα.
+
+ΜΕΤΑ ΑΠΟ ΔΙΑΚΟΠΗ (ΕΠΑΝΕΚΚΙΝΗΣΗ):
+    Αν η λήψη ήταν κάτω περισσότερο από SENSOR_STALE_AFTER_S, ΟΛΑ τα
+    heartbeats στο ZSET είναι παλιά - ένα sweep αμέσως μετά την εκκίνηση
+    θα έκανε κάθε θέση "Maintenance". Γι' αυτό το πρώτο sweep γίνεται
+    αφού ακούσουμε για ένα ολόκληρο παράθυρο SENSOR_STALE_AFTER_S: όποιος
+    αισθητήρας στείλει στο μεταξύ έχει νέο heartbeat.
+    Η λειτουργία είναι ανενεργή εκτός αν οριστεί SENSOR_STALE_AFTER_S > 0.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (touch σε κάθε μέτρηση, mark_silent_sensors), config.py
+=======================================================================
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.constants import VALID_SPOT_STATUSES
+from app.database import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Κλειδί του ZSET (κοινό για όλα τα ingestion processes)
+LAST_SEEN_KEY = "sensors:last_seen"
+
+# Κάθε πόσα δευτερόλεπτα γράφονται τα heartbeats στο Redis
+HEARTBEAT_FLUSH_S = 1.0
+
+# Μέγιστες θέσεις ανά κλήση του sweep script (ώστε να μη "κολλάει" το Redis)
+SWEEP_BATCH_SIZE = 1000
+
+# Ατομικό "διάβασε και αφαίρεσε" των σιωπηλών (ARGV[1] = όριο, ARGV[2] = πλήθος)
+_CLAIM_SILENT_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(ids))
+end
+return ids
+"""
+
+
+class SensorLivenessMonitor:
+    """
+    Heartbeats αισθητήρων σε Redis ZSET + περιοδικό sweep για τους σιωπηλούς.
+    """
+
+    def __init__(self, stale_after_s: Optional[int] = None):
+        """ΠΑΡΑΜΕΤΡΟΙ: stale_after_s - όριο σιωπής σε s (None = από config.py, 0 = ανενεργό)"""
+        self.stale_after = settings.SENSOR_STALE_AFTER_S if stale_after_s is None else stale_after_s
+        self.status = settings.SENSOR_STALE_STATUS
+        if self.stale_after > 0 and self.status not in VALID_SPOT_STATUSES:
+            logger.error(f"SENSOR_STALE_STATUS={self.status!r} is not a valid spot status; "
+                         f"sensor staleness detection disabled")
+            self.stale_after = 0
+        self.enabled = self.stale_after > 0
+
+        # _seen: heartbeats που δεν έχουν γραφτεί ακόμα στο Redis (spot_id → χρόνος)
+        self._seen: Dict[int, float] = {}
+        self._claim_script = redis_client.register_script(_CLAIM_SILENT_SCRIPT)
+
+        # Μετρικές
+        self.silent_detected = 0   # Θέσεις που βρέθηκαν σιωπηλές (από αυτό το process)
+        self.last_sweep_at: Optional[float] = None
+
+    def touch(self, spot_id: int):
+        """ΤΙ ΚΑΝΕΙ: Σημειώνει ότι ο αισθητήρας της θέσης μόλις έστειλε μήνυμα."""
+        if self.enabled:
+            self._seen[spot_id] = time.time()
+
+    async def flush(self):
+        """ΤΙ ΚΑΝΕΙ: Γράφει τα heartbeats της μνήμης στο ZSET (ένα ZADD)."""
+        if not self._seen:
+            return
+        seen, self._seen = self._seen, {}
+        try:
+            await redis_client.zadd(LAST_SEEN_KEY, seen)
+        except Exception:
+            # Δεν χάνουμε τα heartbeats - νεότερα touch() έχουν προτεραιότητα
+            for spot_id, seen_at in seen.items():
+                self._seen.setdefault(spot_id, seen_at)
+            raise
+
+    async def sweep(self) -> List[int]:
+        """
+        ΤΙ ΚΑΝΕΙ: Βρίσκει (και αφαιρεί από το ZSET) τις θέσεις που σιωπούν
+                   περισσότερο από το όριο.
+        ΕΠΙΣΤΡΕΦΕΙ: Τα spot_id που "διεκδίκησε" αυτό το process.
+        """
+        cutoff = time.time() - self.stale_after
+        silent: List[int] = []
+        while True:
+            ids = await self._claim_script(keys=[LAST_SEEN_KEY], args=[cutoff, SWEEP_BATCH_SIZE])
+            silent.extend(int(spot_id) for spot_id in ids)
+            if len(ids) < SWEEP_BATCH_SIZE:
+                break
+        self.last_sweep_at = time.time()
+        self.silent_detected += len(silent)
+        return silent
+
+    async def run(self, on_silent: Callable[[List[int]], Awaitable], heartbeat: Optional[Callable[[], None]] = None):
+        """
+        ΤΙ ΚΑΝΕΙ: Ατέρμονος βρόχος: κάθε δευτερόλεπτο γράφει τα heartbeats,
+                   κάθε SENSOR_STALE_SWEEP_S κάνει sweep (το πρώτο μόνο αφού
+                   περάσει ένα ολόκληρο παράθυρο stale_after από την εκκίνηση).
+        ΠΑΡΑΜΕΤΡΟΙ:
+            on_silent: async συνάρτηση που δέχεται τα spot_id των σιωπηλών
+            heartbeat: καλείται σε κάθε γύρο (για το /health)
+        """
+        # Τα heartbeats πριν από την εκκίνηση μπορεί να είναι παλιά λόγω
+        # διακοπής της λήψης - δίνουμε σε κάθε αισθητήρα ένα παράθυρο να στείλει
+        next_sweep = time.monotonic() + max(settings.SENSOR_STALE_SWEEP_S, self.stale_after)
+        while True:
+            await asyncio.sleep(HEARTBEAT_FLUSH_S)
+            await self.flush()
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + settings.SENSOR_STALE_SWEEP_S
+                silent = await self.sweep()
+                if silent:
+                    logger.info(f"{len(silent)} sensors silent for more than {self.stale_after}s")
+                    await on_silent(silent)
+            if heartbeat:
+                heartbeat()
+
+    def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        return {
+            "enabled": self.enabled,
+            "stale_after_s": self.stale_after,
+            "stale_status": self.status,
+            "pending_heartbeats": len(self._seen),
+            "silent_detected": self.silent_detected,
+            "last_sweep_at": self.last_sweep_at,
+        }
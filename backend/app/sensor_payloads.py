@@ -0,0 +1,180 @@
+"""
+=======================================================================
+sensor_payloads.py - Αποκωδικοποίηση Payloads Πολλών Θέσεων (Gateways)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Ένα gateway που διαχειρίζεται 200 θέσεις θα έπρεπε να στείλει 200
+    μηνύματα στο "parking/<City>/<SpotId>/status". Αντί γι' αυτό, μπορεί
+    να στείλει ΕΝΑ μήνυμα στο "parking/<City>/batch" με όλες τις θέσεις.
+    Εδώ αποκωδικοποιούμε αυτό το payload σε λίστα SensorReading.
+
+ΥΠΟΣΤΗΡΙΖΟΜΕΝΕΣ ΜΟΡΦΕΣ:
+    1. JSON πίνακας αντικειμένων:
+       [{"spot_id": 42, "status": "Occupied", "ts": 1700000000000, "seq": 17}, ...]
+    2. JSON πίνακας πινάκων (πιο συμπαγές):
+       [[42, "Occupied", 1700000000000, 17], [43, "Available"], ...]
+    3. Packed binary: συνεχόμενες εγγραφές των 13 bytes (big-endian):
+       uint32 spot_id | uint8 status | uint64 timestamp σε ms (0 = κανένα)
+       όπου status = θέση στο VALID_SPOT_STATUSES (0=Available, 1=Occupied, ...)
+
+    Το "ts" είναι προαιρετικό: epoch σε ms ή ISO string. Επίσης προαιρετικό
+    είναι το "seq": αύξων αριθμός μηνύματος ανά αισθητήρα (4ο στοιχείο στη
+    μορφή πίνακα). Με αυτά ο consumer απορρίπτει μηνύματα που έφτασαν
+    καθυστερημένα και είναι παλαιότερα από ό,τι έχει ήδη δει (spot_state.py).
+
+    Για το HTTP bulk ingest (POST /api/ingest/events) υποστηρίζεται
+    επίσης NDJSON: ένα JSON αντικείμενο ανά γραμμή, με πεδίο "city":
+       {"spot_id": 42, "city": "Athens", "status": "Occupied", "ts": 1700000000000}
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (topic parking/<City>/batch), ingest_router.py (HTTP),
+    constants.py
+=======================================================================
+"""
+
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from app.constants import VALID_SPOT_STATUSES
+
+# Μία εγγραφή packed binary: ! = network byte order (big-endian), I = uint32,
+# B = uint8, Q = uint64 → 4 + 1 + 8 = 13 bytes
+BINARY_RECORD = struct.Struct("!IBQ")
+
+
+class SensorReading(NamedTuple):
+    """
+    Μία μέτρηση αισθητήρα: ποια θέση, ποια κατάσταση, πού και πότε.
+    timestamp/seq: από τον ίδιο τον αισθητήρα (None = δεν στάλθηκε).
+    """
+    spot_id: int
+    status: str
+    city: str
+    timestamp: Optional[datetime] = None
+    seq: Optional[int] = None
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """
+    ΤΙ ΚΑΝΕΙ: Μετατρέπει το "ts" ενός αισθητήρα σε datetime (τοπική ώρα,
+               naive - όπως το datetime.now() που χρησιμοποιεί ο consumer).
+    ΔΕΧΕΤΑΙ: epoch σε ms (int/float) ή ISO string. Κενό/0 → None.
+    ΠΕΤΑΕΙ ΣΦΑΛΜΑ: ValueError για άκυρη τιμή - και για αριθμούς εκτός ορίων
+                   (1e20, 2**63, NaN), όπου το datetime πετά OSError/OverflowError.
+    """
+    if value in (None, "", 0):
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc).astimezone().replace(tzinfo=None)
+        text = str(value)
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        parsed = datetime.fromisoformat(text)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        return parsed
+    except (OverflowError, OSError, ValueError):
+        raise ValueError(f"Invalid timestamp: {value!r}") from None
+
+
+def parse_seq(value: Any) -> Optional[int]:
+    """ΤΙ ΚΑΝΕΙ: Μετατρέπει το "seq" ενός αισθητήρα σε int (κενό → None)."""
+    if value in (None, ""):
+        return None
+    return int(value)
+
+
+def _reading_from_json(item: Any, city: str) -> Optional[SensorReading]:
+    """ΤΙ ΚΑΝΕΙ: Μετατρέπει ένα στοιχείο JSON (dict ή list) σε SensorReading."""
+    if isinstance(item, dict):
+        spot_id, status, ts = item.get("spot_id", item.get("id")), item.get("status"), item.get("ts")
+        seq = item.get("seq")
+    elif isinstance(item, (list, tuple)) and len(item) >= 2:
+        spot_id, status = item[0], item[1]
+        ts = item[2] if len(item) > 2 else None
+        seq = item[3] if len(item) > 3 else None
+    else:
+        return None
+    try:
+        return SensorReading(int(spot_id), str(status).strip(), city, parse_timestamp(ts),
+                             parse_seq(seq))
+    except (TypeError, ValueError, OverflowError):
+        # OverflowError: π.χ. int(1e999) - το JSON δίνει inf
+        return None
+
+
+def parse_batch_payload(payload: bytes, city: str) -> List[SensorReading]:
+    """
+    ΤΙ ΚΑΝΕΙ: Αποκωδικοποιεί ένα payload πολλών θέσεων σε μία κίνηση.
+    ΠΑΡΑΜΕΤΡΟΙ:
+        payload: τα raw bytes του MQTT μηνύματος
+        city: η πόλη από το topic
+    ΕΠΙΣΤΡΕΦΕΙ: Λίστα SensorReading. Εγγραφές με άκυρη δομή παραλείπονται -
+                η επαλήθευση status γίνεται από τον consumer.
+    ΠΕΤΑΕΙ ΣΦΑΛΜΑ: ValueError αν το payload δεν είναι καμία γνωστή μορφή.
+    """
+    readings, _ = parse_batch_payload_counted(payload, city)
+    return readings
+
+
+def parse_batch_payload_counted(payload: bytes, city: str) -> Tuple[List[SensorReading], int]:
+    """
+    ΤΙ ΚΑΝΕΙ: Όπως το parse_batch_payload, αλλά μετρά και τις εγγραφές.
+    ΕΠΙΣΤΡΕΦΕΙ: (readings, πλήθος εγγραφών του payload - έγκυρων ΚΑΙ άκυρων)
+    ΚΑΛΕΙΤΑΙ ΑΠΟ: ingest_router.py (received/rejected της απάντησης)
+    """
+    stripped = payload.lstrip()
+    if stripped.startswith(b"["):
+        items = json.loads(stripped.decode("utf-8"))
+        if not isinstance(items, list):
+            raise ValueError("Batch payload must be a JSON array")
+        readings = (_reading_from_json(item, city) for item in items)
+        return [r for r in readings if r is not None], len(items)
+
+    if payload and len(payload) % BINARY_RECORD.size == 0:
+        readings: List[SensorReading] = []
+        for spot_id, status_code, ts_ms in BINARY_RECORD.iter_unpack(payload):
+            # Όπως στο JSON: άκυρη εγγραφή → παραλείπεται μόνο αυτή, όχι όλη η ομάδα
+            if status_code >= len(VALID_SPOT_STATUSES):
+                continue
+            try:
+                timestamp = parse_timestamp(ts_ms)
+            except ValueError:
+                continue
+            readings.append(SensorReading(spot_id, VALID_SPOT_STATUSES[status_code], city, timestamp))
+        return readings, len(payload) // BINARY_RECORD.size
+
+    raise ValueError(f"Unrecognised batch payload ({len(payload)} bytes)")
+
+
+def parse_ndjson(body: bytes, max_errors: int = 20) -> Tuple[List[SensorReading], int, List[str]]:
+    """
+    ΤΙ ΚΑΝΕΙ: Αποκωδικοποιεί NDJSON (ένα event ανά γραμμή) σε SensorReading.
+    ΠΑΡΑΜΕΤΡΟΙ:
+        body: το σώμα του HTTP request
+        max_errors: πόσα μηνύματα σφάλματος να κρατήσουμε (για την απάντηση)
+    ΕΠΙΣΤΡΕΦΕΙ: (readings, πλήθος άκυρων γραμμών, πρώτα μηνύματα σφάλματος)
+    ΣΗΜΕΙΩΣΗ: Κενές γραμμές αγνοούνται. Κάθε γραμμή πρέπει να έχει "city".
+    """
+    readings: List[SensorReading] = []
+    rejected = 0
+    errors: List[str] = []
+    for line_no, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            reading = _reading_from_json(item, str(item.get("city", ""))) if isinstance(item, dict) else None
+        except ValueError:
+            reading = None
+        if reading is None:
+            rejected += 1
+            if len(errors) < max_errors:
+                errors.append(f"line {line_no}: malformed event")
+            continue
+        readings.append(reading)
+    return readings, rejected, errors
@@ -26,6 +26,7 @@ parking_service.py - Επιχειρησιακή Λογική Θέσεων Στά
 
 from app.repositories.parking_repository import ParkingRepository
 from app.models import ParkingSpot
+from app.mqtt_consumer import current_consumer, forget_spot_state
 import logging
 from typing import Optional
 
@@ -71,7 +72,12 @@ class ParkingService:
         ΕΠΙΣΤΡΕΦΕΙ: Το νέο ParkingSpot αντικείμενο.
         """
         # Αναπτύσσουμε το dictionary ως ορίσματα (π.χ. location="Ερμού", latitude=37.98...)
-        return await self.repo.create_spot(**spot_data)
+        spot = await self.repo.create_spot(**spot_data)
+        # Η νέα θέση γίνεται αμέσως δεκτή από τον MQTT consumer
+        consumer = current_consumer()
+        if consumer:
+            consumer.spot_registry.add(spot.id, spot.city, spot.latitude, spot.longitude, spot.area)
+        return spot
 
     async def update_spot(self, spot_id: int, **updates):
         """
@@ -85,6 +91,14 @@ class ParkingService:
         spot = await self.repo.update_spot(spot_id, **updates)
         if not spot:
             raise ValueError("Spot not found")
+        consumer = current_consumer()
+        if consumer and {"city", "area", "latitude", "longitude"} & updates.keys():
+            consumer.spot_registry.add(spot.id, spot.city, spot.latitude, spot.longitude, spot.area)
+        if updates.get("status") is not None:
+            # Αλλαγή κατάστασης από admin: "ξεχνάμε" την τελευταία κατάσταση
+            # αισθητήρα ώστε το επόμενο μήνυμα να μη θεωρηθεί no-op
+            await forget_spot_state([spot_id])
+            self.repo.publish_status_change(spot)
         return spot
 
     async def delete_spot(self, spot_id: int):
@@ -96,6 +110,11 @@ class ParkingService:
         spot = await self.repo.delete_spot(spot_id)
         if not spot:
             raise ValueError("Spot not found")
+        # Μηνύματα για τη διαγραμμένη θέση απορρίπτονται πριν φτάσουν στη βάση
+        consumer = current_consumer()
+        if consumer:
+            consumer.spot_registry.remove(spot_id)
+        await forget_spot_state([spot_id])
 
     async def get_spots_in_viewport(self, sw_lat, sw_lng, ne_lat, ne_lng, status, limit):
         """
@@ -8,32 +8,35 @@ reservation_service.py - Επιχειρησιακή Λογική Κρατήσε
     Εδώ βρίσκεται η λογική:
     - Έλεγχος διαθεσιμότητας πριν κράτηση
     - Αλλαγή κατάστασης θέσης σε "Reserved"
-    - Αυτόματη λήξη κράτησης μετά από 30 δευτερόλεπτα
-    - Επαναφορά θέσης σε "Available" μετά τη λήξη
+    - Προγραμματισμός της αυτόματης λήξης (end_time, default +30 δευτερόλεπτα)
 
 ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
     Η κράτηση αφορά ΔΥΟ entities (Reservation ΚΑΙ ParkingSpot).
     Αυτό το service συντονίζει και τα δύο repositories.
 
-ΣΗΜΑΝΤΙΚΟ - ASYNCIO.CREATE_TASK:
-    Η λήξη κράτησης γίνεται ασύγχρονα (async). Δηλαδή:
-    - Το create_reservation τελειώνει ΑΜΕΣΑ και επιστρέφει
-    - Ξεκινά ένα "background task" που θα τρέξει μετά από 30 δευτερόλεπτα
-    - Αυτό δεν κλειδώνει τον server
+ΣΗΜΑΝΤΙΚΟ - ΛΗΞΗ ΚΡΑΤΗΣΗΣ:
+    Το create_reservation τελειώνει ΑΜΕΣΑ. Η λήξη απλά καταγράφεται στο
+    Redis ZSET "reservations:expiry" και την εκτελεί ο κεντρικός βρόχος
+    του reservation_expiry.py (επιβιώνει από restarts, σε ομάδες).
 
 ΠΟΤΕ ΧΡΗΣΙΜΟΠΟΙΕΙΤΑΙ:
     Καλείται από reservation_router.py.
 
 ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
-    reservation_router.py, reservation_repository.py, parking_repository.py
+    reservation_router.py, reservation_repository.py, parking_repository.py,
+    reservation_expiry.py
 =======================================================================
 """
 
 from app.repositories.reservation_repository import ReservationRepository
 from app.repositories.parking_repository import ParkingRepository
+from app.mqtt_consumer import forget_spot_state
+from app.reservation_expiry import reservation_expiry
 from datetime import datetime, timedelta
 from typing import Optional
-import asyncio  # Για ασύγχρονες λειτουργίες και background tasks
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class ReservationService:
@@ -101,7 +104,7 @@ class ReservationService:
         3. Ορίζει χρόνους έναρξης/λήξης
         4. Δημιουργεί την εγγραφή κράτησης
         5. Αλλάζει κατάσταση θέσης σε "Reserved"
-        6. Ξεκινά background task για αυτόματη λήξη
+        6. Προγραμματίζει την αυτόματη λήξη (στο end_time)
         """
         # Βήμα 1: Ελέγχουμε αν η θέση υπάρχει
         spot = await self.parking_repo.get_spot_by_id(spot_id)
@@ -126,39 +129,20 @@ class ReservationService:
         # Βήμα 5: Αλλάζουμε κατάσταση θέσης → "Reserved"
         # Αυτό ενημερώνει βάση ΚΑΙ Redis (και θα φανεί αμέσως στον χάρτη)
         await self.parking_repo.update_spot_status(spot_id, "Reserved")
-
-        # Βήμα 6: Ξεκινάμε background task για αυτόματη λήξη μετά από 30 δευτερόλεπτα.
-        # asyncio.create_task: τρέχει ασύγχρονα χωρίς να κλειδώνει τον server.
-        # Το request τελειώνει ΤΩΡΑ, αλλά η λήξη θα εκτελεστεί αργότερα.
-        asyncio.create_task(self._expire_reservation(spot_id, 30))
+        # Η κατάσταση άλλαξε εκτός MQTT: το επόμενο μήνυμα αισθητήρα για
+        # αυτή τη θέση δεν πρέπει να θεωρηθεί επανάληψη (no-op)
+        await forget_spot_state([spot_id])
+
+        # Βήμα 6: Προγραμματίζουμε τη λήξη στο Redis ZSET - την εκτελεί ο
+        # βρόχος του reservation_expiry.py (σε όποιο worker, και μετά από restart).
+        # Αν το Redis δεν απαντά, η λήξη ξαναπρογραμματίζεται στην επόμενη εκκίνηση.
+        try:
+            await reservation_expiry.schedule(reservation.id, end_time)
+        except Exception as e:
+            logger.error(f"Failed to schedule expiry of reservation {reservation.id}: {e}")
 
         return reservation
 
-    async def _expire_reservation(self, spot_id: int, delay_seconds: int):
-        """
-        ΤΙ ΚΑΝΕΙ: Background task που εκτελείται μετά τη λήξη κράτησης.
-        ΠΑΡΑΜΕΤΡΟΙ:
-            spot_id: η θέση που θα ελευθερωθεί
-            delay_seconds: πόσα δευτερόλεπτα να περιμένει πριν εκτελεστεί
-
-        ΠΩΣ ΛΕΙΤΟΥΡΓΕΙ:
-        1. Περιμένει delay_seconds δευτερόλεπτα (χωρίς να κλειδώνει τίποτα)
-        2. Ελέγχει αν η θέση είναι ακόμα "Reserved" (μπορεί να άλλαξε εν τω μεταξύ)
-        3. Αν ναι, την επαναφέρει σε "Available"
-
-        ΣΗΜΕΙΩΣΗ: Αυτή η μέθοδος δεν καλείται άμεσα - είναι background task.
-        """
-        # Αναμένουμε για τον ορισμένο χρόνο
-        await asyncio.sleep(delay_seconds)
-
-        # Ελέγχουμε αν η θέση είναι ακόμα "Reserved"
-        # (μπορεί ο χρήστης να έχει φύγει και ο αισθητήρας να το έχει αλλάξει)
-        spot = await self.parking_repo.get_spot_by_id(spot_id)
-        if spot and spot.status == "Reserved":
-            # Επαναφέρουμε σε "Available" - η θέση είναι πλέον ελεύθερη
-            await self.parking_repo.update_spot_status(spot_id, "Available")
-            print(f"Reservation expired for spot {spot_id}, status reverted to Available")
-
     async def update_reservation(self, reservation_id: int, **updates):
         """
         ΤΙ ΚΑΝΕΙ: Ενημερώνει μια κράτηση.
@@ -167,6 +151,12 @@ class ReservationService:
         reservation = await self.repo.update_reservation(reservation_id, **updates)
         if not reservation:
             raise ValueError("Reservation not found")
+        # Νέο end_time → μεταθέτουμε και τη λήξη
+        if updates.get("end_time") is not None:
+            try:
+                await reservation_expiry.schedule(reservation.id, reservation.end_time)
+            except Exception as e:
+                logger.error(f"Failed to reschedule expiry of reservation {reservation.id}: {e}")
         return reservation
 
     async def delete_reservation(self, reservation_id: int):
@@ -181,11 +171,16 @@ class ReservationService:
         reservation = await self.repo.delete_reservation(reservation_id)
         if not reservation:
             raise ValueError("Reservation not found")
+        try:
+            await reservation_expiry.cancel(reservation_id)
+        except Exception as e:
+            logger.error(f"Failed to cancel expiry of reservation {reservation_id}: {e}")
 
         # Αν η θέση είναι ακόμα "Reserved", την ελευθερώνουμε
         if reservation.spot_id:
             spot = await self.parking_repo.get_spot_by_id(reservation.spot_id)
             if spot and spot.status == "Reserved":
                 await self.parking_repo.update_spot_status(reservation.spot_id, "Available")
+                await forget_spot_state([reservation.spot_id])
 
         return reservation
@@ -0,0 +1,392 @@
+"""
+=======================================================================
+spot_batch_writer.py - Ομαδική Αποθήκευση Αλλαγών Θέσεων (Adaptive Flush)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Μαζεύει τις αλλαγές κατάστασης που έρχονται από τους αισθητήρες
+    (pending updates) και τις αποθηκεύει ΟΜΑΔΙΚΑ στη βάση PostgreSQL
+    και στο Redis cache.
+
+ΠΟΤΕ ΓΙΝΕΤΑΙ Η ΑΠΟΘΗΚΕΥΣΗ (FLUSH):
+    Παλιότερα ο batch task "ξυπνούσε" σταθερά κάθε 5 δευτερόλεπτα:
+    - Σε χαμηλό φορτίο οι αλλαγές έφταναν στη βάση με άσκοπη καθυστέρηση
+    - Σε υψηλό φορτίο το batch μεγάλωνε χωρίς όριο
+    Τώρα εφαρμόζουμε "adaptive flush" - αποθηκεύουμε όταν συμβεί
+    ΟΠΟΙΟ από τα δύο έρθει πρώτο:
+    1. Μαζεύτηκαν N εκκρεμείς θέσεις (settings.MQTT_BATCH_MAX_SIZE)
+    2. Πέρασαν T ms από την ΠΡΩΤΗ εκκρεμή αλλαγή
+       (settings.MQTT_BATCH_MAX_DELAY_MS)
+    Όταν δεν υπάρχει τίποτα εκκρεμές, ο task "κοιμάται" (δεν κάνει polling).
+
+ΜΕΤΡΙΚΕΣ:
+    Για κάθε flush καταγράφουμε: μέγεθος batch, πόσο "περίμενε" η
+    παλαιότερη αλλαγή (wait), πόσο κράτησε η αποθήκευση (duration)
+    και τι το προκάλεσε ("size" ή "time"). Διαθέσιμες μέσω stats.snapshot().
+
+JOURNAL (ΠΡΟΑΙΡΕΤΙΚΟ):
+    Με INGEST_JOURNAL_DIR κάθε αλλαγή γράφεται πρώτα σε τοπικό journal
+    (update_journal.py) και ξαναπαίζεται μετά από crash (recover()).
+    Αν ένα flush αποτύχει, οι αλλαγές του ξαναμπαίνουν στις εκκρεμείς.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (προσθέτει αλλαγές), parking_repository.py (βάση),
+    database.py (Redis), config.py (όρια N και T), update_journal.py
+=======================================================================
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.database import get_session, redis_client
+from app.repositories.parking_repository import ParkingRepository
+from app.update_journal import UpdateJournal
+
+logger = logging.getLogger(__name__)
+
+
+class FlushStats:
+    """
+    Κρατάει στατιστικά για τα flush που έγιναν.
+    Τα πρόσφατα δείγματα φυλάσσονται σε deque με σταθερό μέγεθος
+    (δεν μεγαλώνει η μνήμη όσο τρέχει η εφαρμογή).
+    """
+
+    def __init__(self, max_samples: int = 200):
+        self.flushes = 0            # Πόσα flush έγιναν συνολικά
+        self.updates_flushed = 0    # Πόσες αλλαγές θέσεων αποθηκεύτηκαν
+        self.failures = 0           # Πόσα flush απέτυχαν
+        self.triggers: Dict[str, int] = {"size": 0, "time": 0, "manual": 0}
+        # Κάθε δείγμα: (batch_size, wait_ms, duration_ms)
+        self.samples: Deque = deque(maxlen=max_samples)
+
+    def record(self, batch_size: int, wait_ms: float, duration_ms: float, trigger: str):
+        """ΤΙ ΚΑΝΕΙ: Καταγράφει ένα ολοκληρωμένο flush."""
+        self.flushes += 1
+        self.updates_flushed += batch_size
+        self.triggers[trigger] = self.triggers.get(trigger, 0) + 1
+        self.samples.append((batch_size, wait_ms, duration_ms))
+
+    def snapshot(self) -> Dict:
+        """
+        ΤΙ ΚΑΝΕΙ: Επιστρέφει σύνοψη των στατιστικών (για logs/endpoint).
+        ΕΠΙΣΤΡΕΦΕΙ: dictionary με συνολικά + μέσους/μέγιστους όρους
+                    των πρόσφατων δειγμάτων.
+        """
+        sizes = [s[0] for s in self.samples]
+        waits = [s[1] for s in self.samples]
+        durations = [s[2] for s in self.samples]
+
+        def _summary(values):
+            if not values:
+                return {"avg": 0.0, "max": 0.0}
+            return {"avg": round(sum(values) / len(values), 2), "max": round(max(values), 2)}
+
+        return {
+            "flushes": self.flushes,
+            "updates_flushed": self.updates_flushed,
+            "failures": self.failures,
+            "triggers": dict(self.triggers),
+            "recent_batch_size": _summary(sizes),
+            "recent_wait_ms": _summary(waits),
+            "recent_flush_duration_ms": _summary(durations),
+        }
+
+
+class SpotBatchWriter:
+    """
+    Κλάση που κρατάει τις εκκρεμείς αλλαγές θέσεων και τις αποθηκεύει
+    ομαδικά με adaptive flush (μέγεθος Ή χρόνος - ό,τι έρθει πρώτο).
+
+    Κάθε process έχει το ΔΙΚΟ του instance (δεν υπάρχουν global dicts).
+    """
+
+    def __init__(self, max_batch_size: Optional[int] = None, max_delay_ms: Optional[int] = None,
+                 journal: Optional[UpdateJournal] = None, requeue_on_failure: bool = True):
+        """
+        ΤΙ ΚΑΝΕΙ: Αρχικοποίηση ορίων και εσωτερικής κατάστασης.
+        ΠΑΡΑΜΕΤΡΟΙ:
+            max_batch_size: N - flush όταν μαζευτούν τόσες θέσεις
+            max_delay_ms: T - flush όταν περάσουν τόσα ms από την πρώτη αλλαγή
+            (αν δεν δοθούν, διαβάζονται από το config.py)
+            journal: τοπικό journal για ανάκτηση μετά από crash (None = χωρίς)
+            requeue_on_failure: αν ένα αποτυχημένο flush ξαναβάζει τις αλλαγές
+                                στη μνήμη (False όταν την επανάληψη την κάνει
+                                ήδη κάποιος άλλος, π.χ. το Redis Stream)
+        """
+        self.journal = journal
+        self.requeue_on_failure = requeue_on_failure
+        self.max_batch_size = max(1, max_batch_size or settings.MQTT_BATCH_MAX_SIZE)
+        self.max_delay = max(0, max_delay_ms if max_delay_ms is not None
+                             else settings.MQTT_BATCH_MAX_DELAY_MS) / 1000.0
+
+        # pending: Κλειδί: spot_id (int), Τιμή: {"status": ..., "city": ..., "timestamp": ...}
+        # Αν ο ίδιος spot_id εμφανιστεί ξανά πριν το flush, κρατάμε μόνο την πιο πρόσφατη
+        self.pending: Dict[int, Dict] = {}
+
+        # lock: αποτρέπει ταυτόχρονη πρόσβαση στο pending (add vs flush)
+        self.lock = asyncio.Lock()
+
+        # _flush_lock: ένα flush τη φορά (ο βρόχος run() vs το τελικό flush)
+        self._flush_lock = asyncio.Lock()
+
+        # Πότε μπήκε η ΠΡΩΤΗ εκκρεμής αλλαγή (time.monotonic) - για το όριο T
+        self._first_pending_at: Optional[float] = None
+
+        # _has_pending: "ξυπνά" τον flush loop όταν μπει η πρώτη αλλαγή
+        # _size_reached: "ξυπνά" τον flush loop πρόωρα όταν φτάσουμε N
+        self._has_pending = asyncio.Event()
+        self._size_reached = asyncio.Event()
+
+        self.stats = FlushStats()
+
+        # last_flush_at: πότε (time.time) πέτυχε το τελευταίο flush - για το /health
+        self.last_flush_at: Optional[float] = None
+
+    async def add(self, spot_id: int, status: str, city: str, timestamp: Optional[datetime] = None):
+        """
+        ΤΙ ΚΑΝΕΙ: Προσθέτει (ή αντικαθιστά) μια εκκρεμή αλλαγή θέσης.
+        ΠΑΡΑΜΕΤΡΟΙ:
+            spot_id, status, city: η αλλαγή
+            timestamp: πότε συνέβη (default: τώρα)
+        ΣΕΙΡΑ: Αν η θέση έχει ήδη εκκρεμή αλλαγή με ΝΕΟΤΕΡΟ χρόνο αισθητήρα,
+               η παλαιότερη αγνοείται (δεν "πατάει" τη νεότερη).
+        """
+        async with self.lock:
+            current = self.pending.get(spot_id)
+            if (timestamp is not None and current is not None
+                    and current["source_ts"] and current["timestamp"] > timestamp):
+                return
+
+            # Πρώτα στο journal (αν υπάρχει), μετά στη μνήμη
+            if self.journal:
+                self.journal.append(spot_id, status, city, timestamp)
+            self._put(spot_id, {
+                "status": status,
+                "city": city,
+                "timestamp": timestamp or datetime.now(),
+                "source_ts": timestamp is not None,  # Χρόνος αισθητήρα (όχι λήψης)
+            })
+
+    def _put(self, spot_id: int, update: Dict):
+        """ΤΙ ΚΑΝΕΙ: Βάζει μια εκκρεμή αλλαγή και "ξυπνά" τον flush loop (καλείται με το lock)."""
+        if not self.pending:
+            # Πρώτη εκκρεμής αλλαγή: ξεκινά το "χρονόμετρο" T
+            self._first_pending_at = time.monotonic()
+            self._has_pending.set()
+
+        self.pending[spot_id] = update
+
+        if len(self.pending) >= self.max_batch_size:
+            self._size_reached.set()
+
+    def pending_count(self) -> int:
+        """ΤΙ ΚΑΝΕΙ: Επιστρέφει πόσες θέσεις περιμένουν αποθήκευση."""
+        return len(self.pending)
+
+    def oldest_pending_age(self) -> Optional[float]:
+        """ΤΙ ΚΑΝΕΙ: Πόσα δευτερόλεπτα περιμένει η παλαιότερη εκκρεμής αλλαγή (None = καμία)."""
+        if self._first_pending_at is None:
+            return None
+        return time.monotonic() - self._first_pending_at
+
+    async def run(self, heartbeat: Optional[Callable[[], None]] = None):
+        """
+        ΤΙ ΚΑΝΕΙ: Ατέρμονος βρόχος adaptive flush.
+        ΛΕΙΤΟΥΡΓΕΙ:
+            1. Περιμένει μέχρι να υπάρξει έστω μία εκκρεμής αλλαγή
+            2. Περιμένει ΕΙΤΕ να φτάσουμε N θέσεις ΕΙΤΕ να λήξει το T
+            3. Κάνει flush και ξαναρχίζει
+        ΠΑΡΑΜΕΤΡΟΙ: heartbeat - καλείται μετά από κάθε επιτυχές flush
+                    (task_supervisor.py - "τελευταία πρόοδος")
+        """
+        while True:
+            try:
+                await self._has_pending.wait()
+
+                trigger = "size"
+                if not self._size_reached.is_set():
+                    first = self._first_pending_at or time.monotonic()
+                    remaining = first + self.max_delay - time.monotonic()
+                    if remaining > 0:
+                        try:
+                            await asyncio.wait_for(self._size_reached.wait(), timeout=remaining)
+                        except asyncio.TimeoutError:
+                            trigger = "time"
+                    else:
+                        trigger = "time"
+
+                await self.flush(trigger)
+                if heartbeat:
+                    heartbeat()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in batch update task: {e}")
+
+    async def flush(self, trigger: str = "manual") -> int:
+        """
+        ΤΙ ΚΑΝΕΙ: Αδειάζει (atomic) τις εκκρεμείς αλλαγές και τις αποθηκεύει.
+        ΠΑΡΑΜΕΤΡΟΙ: trigger - "size", "time" ή "manual" (για τις μετρικές)
+        ΕΠΙΣΤΡΕΦΕΙ: Πόσες θέσεις αποθηκεύτηκαν.
+        """
+        # Ένα flush τη φορά: το τελικό flush του τερματισμού περιμένει
+        # πρώτα να ολοκληρωθεί όποιο βρίσκεται σε εξέλιξη
+        async with self._flush_lock:
+            async with self.lock:
+                first_pending_at = self._first_pending_at
+                updates_to_process = self.pending
+                self.pending = {}
+                self._first_pending_at = None
+                self._has_pending.clear()
+                self._size_reached.clear()
+                if not updates_to_process:
+                    return 0
+                # Οι επόμενες αλλαγές πάνε σε νέο segment του journal
+                segment = self.journal.rotate() if self.journal else None
+
+            started = time.monotonic()
+            try:
+                await self._persist(updates_to_process)
+            except Exception:
+                self.stats.failures += 1
+                if self.requeue_on_failure:
+                    await self._requeue(updates_to_process)
+                raise
+            finished = time.monotonic()
+
+            self.last_flush_at = time.time()
+
+            # Αποθηκεύτηκαν: τα segments τους δεν χρειάζονται πια
+            if segment is not None:
+                self.journal.discard_through(segment)
+
+            wait_ms = (started - (first_pending_at or started)) * 1000
+            duration_ms = (finished - started) * 1000
+            self.stats.record(len(updates_to_process), wait_ms, duration_ms, trigger)
+            logger.info(
+                f"Flushed {len(updates_to_process)} spot updates "
+                f"(trigger={trigger}, wait={wait_ms:.0f}ms, duration={duration_ms:.0f}ms)"
+            )
+            return len(updates_to_process)
+
+    async def _requeue(self, updates: Dict[int, Dict]):
+        """
+        ΤΙ ΚΑΝΕΙ: Ξαναβάζει στις εκκρεμείς τις αλλαγές ενός flush που απέτυχε
+                   (εκτός αν στο μεταξύ ήρθε νεότερη αλλαγή για την ίδια θέση).
+        """
+        async with self.lock:
+            for spot_id, update in updates.items():
+                if spot_id not in self.pending:
+                    self._put(spot_id, update)
+
+    async def recover(self) -> List[Tuple[int, str]]:
+        """
+        ΤΙ ΚΑΝΕΙ: Ξαναπαίζει το journal της προηγούμενης εκτέλεσης και
+                   αποθηκεύει τις αλλαγές του (flush με trigger "recovery").
+        ΕΠΙΣΤΡΕΦΕΙ: [(spot_id, status), ...] - η τελική κατάσταση ανά θέση,
+                    για να ενημερωθεί η τελευταία γνωστή κατάσταση του consumer.
+        ΚΑΛΕΙΤΑΙ: Μία φορά κατά την εκκίνηση, ΠΡΙΝ αρχίσει η λήψη μηνυμάτων.
+        """
+        if not self.journal:
+            return []
+        entries, _ = self.journal.replay()
+        if not entries:
+            return []
+
+        async with self.lock:
+            # Τα entries είναι με σειρά εγγραφής: η τελευταία ανά θέση κερδίζει
+            for spot_id, status, city, timestamp in entries:
+                self._put(spot_id, {"status": status, "city": city,
+                                    "timestamp": timestamp or datetime.now(),
+                                    "source_ts": timestamp is not None})
+            recovered = [(spot_id, update["status"]) for spot_id, update in self.pending.items()]
+
+        logger.info(f"Replaying {len(entries)} journaled updates ({len(recovered)} spots)")
+        await self.flush("recovery")
+        return recovered
+
+    async def _persist(self, updates_to_process: Dict[int, Dict]):
+        """
+        ΤΙ ΚΑΝΕΙ: Αποθηκεύει ένα batch στη βάση PostgreSQL ΚΑΙ στο Redis.
+
+        ΒΑΣΗ: Ένα SELECT ... WHERE id IN (...) για όλες τις θέσεις
+              και ΕΝΑ commit για ολόκληρο το batch.
+        REDIS: Όλες οι εντολές στέλνονται μαζί με pipeline (ένα round-trip).
+        Για κάθε αλλαγή:
+        1. Ενημέρωση του hash spot:{id} με τα νέα δεδομένα
+        2. Προσθήκη στο set spots:by_status:{new_status}
+        3. Αφαίρεση από το set spots:by_status:{old_status} (αν άλλαξε)
+        4. GEO upsert: ενημέρωση τοποθεσίας στο spots:geo:{new_status}
+        5. GEO removal: αφαίρεση από spots:geo:{old_status} (αν άλλαξε)
+        """
+        session = await get_session()
+        try:
+            parking_repo = ParkingRepository(session)
+            spots = await parking_repo.get_spots_by_ids(list(updates_to_process.keys()))
+
+            # Εφαρμόζουμε τις αλλαγές στα αντικείμενα και κρατάμε τις παλιές τιμές
+            old_statuses: Dict[int, str] = {}
+            for spot_id, update_data in updates_to_process.items():
+                spot = spots.get(spot_id)
+                if not spot:
+                    logger.warning(f"Spot {spot_id} not found")
+                    continue
+                old_statuses[spot_id] = spot.status
+                spot.status = update_data["status"]
+
+            # Ένα commit για όλο το batch
+            await session.commit()
+
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for spot_id, old_status in old_statuses.items():
+                    updated_spot = spots[spot_id]
+                    new_status = updated_spot.status
+                    # Ελέγχουμε αν η κατάσταση πράγματι άλλαξε
+                    # (αποφεύγουμε άσκοπες Redis λειτουργίες)
+                    status_changed = old_status is not None and new_status != old_status
+
+                    # --- Redis: Ενημέρωση hash με πλήρη δεδομένα ---
+                    pipe.hset(
+                        f"spot:{spot_id}",
+                        mapping={
+                            "id": str(spot_id),
+                            "latitude": "" if updated_spot.latitude is None else str(updated_spot.latitude),
+                            "longitude": "" if updated_spot.longitude is None else str(updated_spot.longitude),
+                            "location": updated_spot.location,
+                            "status": new_status,
+                            "last_updated": (
+                                updated_spot.last_updated.isoformat()
+                                if updated_spot.last_updated else ""
+                            ),
+                        },
+                    )
+
+                    # --- Redis: Ενημέρωση Sets κατάστασης ---
+                    pipe.sadd(f"spots:by_status:{new_status}", spot_id)
+                    if status_changed:
+                        pipe.srem(f"spots:by_status:{old_status}", spot_id)
+
+                    # --- Redis GEO: Ενημέρωση γεωγραφικής θέσης ---
+                    if updated_spot.longitude is not None and updated_spot.latitude is not None:
+                        pipe.execute_command(
+                            "GEOADD", f"spots:geo:{new_status}",
+                            float(updated_spot.longitude), float(updated_spot.latitude),
+                            f"spot_{spot_id}",
+                        )
+                        if status_changed:
+                            pipe.execute_command("ZREM", f"spots:geo:{old_status}", f"spot_{spot_id}")
+                    else:
+                        logger.warning(f"Spot {spot_id} missing coordinates; skipping GEO")
+
+                await pipe.execute()
+
+            logger.debug(f"Updated {len(old_statuses)} spots in DB; cache upserted")
+        finally:
+            await session.close()  # ΠΑΝΤΑ κλείνουμε τη σύνδεση
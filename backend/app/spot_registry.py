@@ -0,0 +1,130 @@
+"""
+=======================================================================
+spot_registry.py - Γνωστές Θέσεις Στάθμευσης (In-Memory)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Κρατάει στη μνήμη ΠΟΙΕΣ θέσεις υπάρχουν και σε ποια πόλη ανήκουν
+    (spot_id → city), ώστε ο MQTT consumer να απορρίπτει μηνύματα για
+    άγνωστες θέσεις ΠΡΙΝ ανοίξει οποιαδήποτε σύνδεση με τη βάση.
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Ο consumer ήλεγχε μόνο την πόλη και την κατάσταση. Ένα μήνυμα για
+    ανύπαρκτο (ή "πλαστό") spot_id κόστιζε ένα INSERT στο SpotStatusLog
+    που αποτύγχανε στο foreign key, μια θέση στο batch και ένα άσκοπο
+    SELECT κατά την αποθήκευση - και έσπαγε ΟΛΟ το commit του log.
+    Επίσης θέση της Αθήνας που έρχεται σε topic "parking/Patras/..."
+    είναι λάθος ρύθμιση αισθητήρα και πρέπει να αγνοείται.
+
+ΠΩΣ ΓΕΜΙΖΕΙ:
+    - Κατά την εκκίνηση, από την προφόρτωση του Redis cache / τη βάση
+    - Σε δημιουργία / διαγραφή θέσης (parking_service.py)
+    - Περιοδικά (SPOT_REGISTRY_REFRESH_S) - για τα ξεχωριστά ingestion
+      processes που δεν βλέπουν τις αλλαγές του API
+    Πριν φορτωθεί για πρώτη φορά ΔΕΝ απορρίπτει τίποτα (όπως πριν).
+
+ΣΥΝΤΕΤΑΓΜΕΝΕΣ:
+    Κρατάει και το (lat, lng) κάθε θέσης, ώστε το WebSocket broadcast να
+    στέλνει μια αλλαγή μόνο στους browsers που "βλέπουν" τη θέση στον
+    χάρτη τους (βλ. viewport_index.py). Η περιοχή (area) χρειάζεται για
+    τα κανάλια "area:<city>/<area>" του broadcast.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py, parking_service.py, main.py
+=======================================================================
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class SpotRegistry:
+    """
+    Χάρτης spot_id → city των θέσεων που υπάρχουν στη βάση,
+    με μετρητές για τα μηνύματα που απορρίφθηκαν.
+    """
+
+    def __init__(self):
+        # cities: spot_id → πόλη (None = η θέση δεν έχει πόλη - δεκτή από κάθε topic)
+        self.cities: Dict[int, Optional[str]] = {}
+
+        # locations: spot_id → (lat, lng) - μόνο για θέσεις με συντεταγμένες
+        self.locations: Dict[int, Tuple[float, float]] = {}
+
+        # areas: spot_id → περιοχή (π.χ. "Kolonaki") - μόνο για θέσεις με περιοχή
+        self.areas: Dict[int, str] = {}
+
+        # loaded: αν έχει γίνει έστω μία πλήρης φόρτωση
+        self.loaded = False
+
+        # Μετρικές
+        self.unknown = 0          # Μηνύματα για θέση που δεν υπάρχει
+        self.city_mismatch = 0    # Μηνύματα με λάθος πόλη για τη θέση
+
+    def load(self, spots: Iterable):
+        """
+        ΤΙ ΚΑΝΕΙ: Αντικαθιστά ΟΛΟ τον χάρτη με τις δοσμένες θέσεις.
+        ΠΑΡΑΜΕΤΡΟΙ: spots - ParkingSpot αντικείμενα (χρειάζονται id, city,
+                    latitude, longitude, area)
+        """
+        cities: Dict[int, Optional[str]] = {}
+        locations: Dict[int, Tuple[float, float]] = {}
+        areas: Dict[int, str] = {}
+        for spot in spots:
+            cities[spot.id] = spot.city
+            if spot.latitude is not None and spot.longitude is not None:
+                locations[spot.id] = (spot.latitude, spot.longitude)
+            if spot.area:
+                areas[spot.id] = spot.area
+        self.cities = cities
+        self.locations = locations
+        self.areas = areas
+        self.loaded = True
+
+    def add(self, spot_id: int, city: Optional[str],
+            latitude: Optional[float] = None, longitude: Optional[float] = None,
+            area: Optional[str] = None):
+        """ΤΙ ΚΑΝΕΙ: Καταχωρεί (ή ενημερώνει) μια θέση - π.χ. μετά από δημιουργία."""
+        self.cities[spot_id] = city
+        if latitude is not None and longitude is not None:
+            self.locations[spot_id] = (latitude, longitude)
+        else:
+            self.locations.pop(spot_id, None)
+        if area:
+            self.areas[spot_id] = area
+        else:
+            self.areas.pop(spot_id, None)
+
+    def remove(self, spot_id: int):
+        """ΤΙ ΚΑΝΕΙ: Αφαιρεί μια θέση - π.χ. μετά από διαγραφή."""
+        self.cities.pop(spot_id, None)
+        self.locations.pop(spot_id, None)
+        self.areas.pop(spot_id, None)
+
+    def location(self, spot_id: int) -> Optional[Tuple[float, float]]:
+        """ΕΠΙΣΤΡΕΦΕΙ: (lat, lng) της θέσης ή None αν δεν είναι γνωστό."""
+        return self.locations.get(spot_id)
+
+    def accepts(self, spot_id: int, city: str) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Ελέγχει αν η θέση υπάρχει και ανήκει στην πόλη του μηνύματος.
+        ΕΠΙΣΤΡΕΦΕΙ: False (και αυξάνει τον αντίστοιχο μετρητή) αν πρέπει να απορριφθεί.
+        """
+        if not self.loaded:
+            return True
+        if spot_id not in self.cities:
+            self.unknown += 1
+            return False
+        known_city = self.cities[spot_id]
+        if known_city is not None and known_city != city:
+            self.city_mismatch += 1
+            return False
+        return True
+
+    def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        return {
+            "known_spots": len(self.cities),
+            "located_spots": len(self.locations),
+            "rejected_unknown": self.unknown,
+            "rejected_city_mismatch": self.city_mismatch,
+        }
@@ -0,0 +1,118 @@
+"""
+=======================================================================
+spot_state.py - Τελευταία Γνωστή Κατάσταση Θέσεων (In-Memory)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Κρατάει στη μνήμη την τελευταία γνωστή κατάσταση κάθε θέσης
+    (spot_id → status), ώστε ο MQTT consumer να αγνοεί μηνύματα που
+    ΔΕΝ αλλάζουν τίποτα (no-op).
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Ο mock publisher επαναλαμβάνει την προηγούμενη κατάσταση στο 20%
+    των μηνυμάτων, και οι πραγματικοί αισθητήρες ξαναστέλνουν την
+    κατάστασή τους μετά από επανασύνδεση. Κάθε τέτοιο μήνυμα κόστιζε
+    μια εγγραφή στο SpotStatusLog, μια θέση στο batch και ένα broadcast
+    σε ΟΛΟΥΣ τους WebSocket clients - χωρίς καμία πραγματική αλλαγή.
+
+ΠΩΣ ΓΕΜΙΖΕΙ:
+    - Κατά την εκκίνηση από την προφόρτωση του Redis cache (seed)
+    - Από κάθε αποδεκτό μήνυμα αισθητήρα (remember)
+    - Όταν η κατάσταση αλλάξει από αλλού (κράτηση, admin), η θέση
+      "ξεχνιέται" (forget) ώστε το επόμενο μήνυμα να περάσει κανονικά
+
+ΚΑΘΥΣΤΕΡΗΜΕΝΑ ΜΗΝΥΜΑΤΑ (WATERMARK):
+    Αν ο αισθητήρας στέλνει "ts" ή/και "seq", κρατάμε ανά θέση το πιο
+    πρόσφατο που έχουμε δει. Ένα μήνυμα με ΜΙΚΡΟΤΕΡΟ seq (ή, χωρίς seq,
+    παλαιότερο ts) έφτασε καθυστερημένα (retry, buffering, παράλληλη
+    επεξεργασία) και απορρίπτεται - αλλιώς θα "πατούσε" νεότερη κατάσταση.
+    Μηνύματα χωρίς ts/seq δεν ελέγχονται (όπως πριν).
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py, parking_repository.py (seed), main.py
+=======================================================================
+"""
+
+from datetime import datetime
+from typing import Dict, Mapping, Optional
+
+
+class SpotStateTracker:
+    """
+    Χάρτης τελευταίας γνωστής κατάστασης ανά θέση + μετρητής
+    μηνυμάτων που αγνοήθηκαν επειδή δεν άλλαζαν τίποτα.
+    """
+
+    def __init__(self):
+        # last_status: spot_id → τελευταία αποδεκτή κατάσταση
+        self.last_status: Dict[int, str] = {}
+
+        # suppressed: πόσα μηνύματα αγνοήθηκαν ως no-op
+        self.suppressed = 0
+
+        # Watermark ανά θέση: το μεγαλύτερο seq / το πιο πρόσφατο ts που είδαμε
+        self.last_seq: Dict[int, int] = {}
+        self.last_ts: Dict[int, datetime] = {}
+
+        # stale: πόσα μηνύματα απορρίφθηκαν ως παλαιότερα του watermark
+        self.stale = 0
+
+    def seed(self, statuses: Mapping[int, str]):
+        """
+        ΤΙ ΚΑΝΕΙ: Γεμίζει τον χάρτη με τις καταστάσεις από τη βάση/cache.
+        ΠΑΡΑΜΕΤΡΟΙ: statuses - {spot_id: status}
+        """
+        self.last_status.update(statuses)
+
+    def is_noop(self, spot_id: int, status: str) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Ελέγχει αν το μήνυμα επαναλαμβάνει την ίδια κατάσταση.
+        ΕΠΙΣΤΡΕΦΕΙ: True (και αυξάνει τον μετρητή) αν δεν αλλάζει τίποτα.
+        """
+        if self.last_status.get(spot_id) == status:
+            self.suppressed += 1
+            return True
+        return False
+
+    def is_stale(self, spot_id: int, timestamp: Optional[datetime], seq: Optional[int]) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Ελέγχει αν ένα μήνυμα είναι παλαιότερο από ό,τι έχουμε ήδη
+                   δει για τη θέση. Αν ΔΕΝ είναι, προχωρά το watermark.
+        ΕΠΙΣΤΡΕΦΕΙ: True (και αυξάνει τον μετρητή) αν πρέπει να απορριφθεί.
+        ΣΗΜΕΙΩΣΗ: Το seq έχει προτεραιότητα - το ts συγκρίνεται μόνο όταν το
+                  μήνυμα δεν έχει seq (τα ρολόγια των αισθητήρων "ολισθαίνουν").
+                  Ίσο ts δεν θεωρείται παλιό (ανάλυση ms).
+        """
+        last_ts = self.last_ts.get(spot_id)
+        if seq is not None:
+            last = self.last_seq.get(spot_id)
+            # Μικρότερο seq με ΝΕΟΤΕΡΟ ts = ο αισθητήρας έκανε restart (μηδένισε)
+            rebooted = timestamp is not None and last_ts is not None and timestamp > last_ts
+            if last is not None and seq <= last and not rebooted:
+                self.stale += 1
+                return True
+        elif timestamp is not None:
+            if last_ts is not None and timestamp < last_ts:
+                self.stale += 1
+                return True
+
+        if seq is not None:
+            self.last_seq[spot_id] = seq
+        if timestamp is not None and (last_ts is None or timestamp > last_ts):
+            self.last_ts[spot_id] = timestamp
+        return False
+
+    def remember(self, spot_id: int, status: str):
+        """ΤΙ ΚΑΝΕΙ: Καταγράφει τη νέα αποδεκτή κατάσταση μιας θέσης."""
+        self.last_status[spot_id] = status
+
+    def forget(self, spot_id: int):
+        """
+        ΤΙ ΚΑΝΕΙ: Αφαιρεί μια θέση από τον χάρτη.
+        ΠΟΤΕ: Όταν η κατάσταση άλλαξε εκτός MQTT (κράτηση, admin) - έτσι
+              το επόμενο μήνυμα αισθητήρα δεν θεωρείται λανθασμένα no-op.
+              Καλείται μέσω forget_spot_state (mqtt_consumer.py), που το
+              στέλνει και στα άλλα processes (INGEST_MODE=external).
+              Το watermark μένει: αφορά τη σειρά μηνυμάτων του αισθητήρα.
+        """
+        self.last_status.pop(spot_id, None)
@@ -0,0 +1,93 @@
+"""
+=======================================================================
+sse_stream.py - Live Ενημερώσεις Θέσεων μέσω Server-Sent Events (SSE)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Εναλλακτική του /ws για browsers/δίκτυα που δεν κρατούν ανοιχτό
+    WebSocket (εταιρικοί proxies, kiosks). Το GET /sse (main.py) είναι
+    ένα απλό HTTP response που δεν τελειώνει ποτέ:
+
+        id: 1843
+        data: {"type":"spot_updates","updates":[...]}
+
+    Τα "data" είναι ΑΚΡΙΒΩΣ τα ίδια μηνύματα με του /ws (hello,
+    spot_update(s), ping, ...) - τα ίδια έτοιμα strings του
+    websocket_broadcaster, χωρίς δεύτερη κωδικοποίηση JSON.
+
+ΠΩΣ:
+    Ο SSE client καταχωρείται στον websocket_broadcaster σαν κάθε άλλη
+    σύνδεση (ίδια όρια, φίλτρα, ουρά με όριο), αλλά χωρίς writer task:
+    την ουρά του την αδειάζει το ίδιο το response (event_stream).
+
+ΣΥΝΕΧΙΣΗ (Last-Event-ID):
+    Το "id" κάθε event είναι το seq της τελευταίας αλλαγής του. Ο browser
+    (EventSource) το στέλνει αυτόματα ως header Last-Event-ID όταν
+    ξανασυνδεθεί → ο broadcaster στέλνει μόνο όσα χάθηκαν (βλ. resume).
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    websocket_broadcaster.py, main.py (GET /sse)
+=======================================================================
+"""
+
+from typing import AsyncIterator, Optional
+
+from app.websocket_broadcaster import ClientConnection, websocket_broadcaster
+
+# Μετά από πόσα ms ξανασυνδέεται το EventSource αν κοπεί η σύνδεση
+RETRY_MS = 3000
+
+
+class SSEClient:
+    """
+    Ο "socket" ενός SSE client για τον broadcaster: κλειδί στο μητρώο
+    συνδέσεων και close() όταν ο broadcaster τον αποσυνδέσει (π.χ. αργός).
+    """
+
+    def __init__(self, client):
+        self.client = client   # (host, port) - εμφανίζεται στα logs
+        self.connection: Optional[ClientConnection] = None
+
+    async def close(self, code: Optional[int] = None):
+        """
+        ΤΙ ΚΑΝΕΙ: Ξυπνά το event_stream ώστε να τελειώσει το response.
+                   Η σύνδεση είναι ήδη κλειστή → κανείς δεν γράφει πια στην ουρά.
+        """
+        queue = self.connection.queue if self.connection else None
+        if queue is None:
+            return
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait((None, None))
+
+
+def format_event(frame: str, seq: Optional[int] = None) -> str:
+    """ΤΙ ΚΑΝΕΙ: Ένα SSE event (τα frames είναι compact JSON → μία γραμμή)."""
+    if seq is None:
+        return f"data: {frame}\n\n"
+    return f"id: {seq}\ndata: {frame}\n\n"
+
+
+async def event_stream(sink: SSEClient) -> AsyncIterator[str]:
+    """
+    ΤΙ ΚΑΝΕΙ: Το σώμα του GET /sse: γράφει τα frames της ουράς του client.
+               Ό,τι έχει ήδη μαζευτεί στέλνεται μαζί (ένα write).
+    ΣΗΜΕΙΩΣΗ: Όταν ο browser κλείσει, το Starlette ακυρώνει το stream και
+              το finally αφαιρεί τη σύνδεση από τον broadcaster.
+    """
+    connection = sink.connection
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            frame, seq = await connection.queue.get()
+            if frame is None or connection.closed:
+                return
+            chunk = [format_event(frame, seq)]
+            while not connection.queue.empty():
+                frame, seq = connection.queue.get_nowait()
+                if frame is None:
+                    return
+                chunk.append(format_event(frame, seq))
+            yield "".join(chunk)
+    finally:
+        await websocket_broadcaster.unregister(sink)
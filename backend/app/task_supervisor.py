@@ -0,0 +1,193 @@
+"""
+=======================================================================
+task_supervisor.py - Επίβλεψη Background Tasks (Restart + Health)
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Τρέχει τα background asyncio tasks (ουρά MQTT, batch flush, debounce,
+    λήξη κρατήσεων κλπ.) κρατώντας αναφορές σε αυτά, και:
+    - Τα ΞΑΝΑΞΕΚΙΝΑ αν "σκάσουν" με exception (με αυξανόμενη αναμονή - backoff)
+    - Καταγράφει πότε έκαναν τελευταία πρόοδο (heartbeat) και το τελευταίο σφάλμα
+    - Τα ακυρώνει όλα σωστά στον τερματισμό
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Με σκέτο asyncio.create_task() χωρίς αναφορά:
+    - Αν ο flush loop έπεφτε, κανείς δεν το μάθαινε - η cache έμενε
+      παλιά για ώρες
+    - Ο garbage collector μπορεί να "μαζέψει" task χωρίς αναφορά
+    - Στον τερματισμό τα tasks δεν ακυρώνονταν ποτέ
+
+ΔΥΟ ΕΙΔΗ TASKS:
+    - spawn(): μακροχρόνιοι βρόχοι - ξαναξεκινούν σε σφάλμα
+    - spawn_once(): μία εκτέλεση (π.χ. εργασία ενός request) - κρατάμε αναφορά
+      μέχρι να τελειώσει, και μετράμε όσα απέτυχαν
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py, reservation_service.py, main.py (/health)
+=======================================================================
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Αναμονή πριν από restart: 1s, 2s, 4s ... έως 60s
+RESTART_BACKOFF_BASE_S = 1.0
+RESTART_BACKOFF_MAX_S = 60.0
+# Αν ένα task έτρεξε τόσο χωρίς σφάλμα, το backoff μηδενίζεται
+RESTART_BACKOFF_RESET_S = 60.0
+
+
+class SupervisedTask:
+    """Κατάσταση ενός επιβλεπόμενου task (για restart και health)."""
+
+    def __init__(self, name: str, factory: Callable[[], Awaitable], restart: bool):
+        self.name = name
+        self.factory = factory          # Δημιουργεί ΝΕΑ coroutine σε κάθε (re)start
+        self.restart = restart
+        self.task: Optional[asyncio.Task] = None
+        self.started_at: Optional[float] = None     # time.time() της τελευταίας εκκίνησης
+        self.last_progress: Optional[float] = None  # time.time() του τελευταίου heartbeat
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+
+    def snapshot(self) -> Dict:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "restarts": self.restarts,
+            "started_at": self.started_at,
+            "last_progress": self.last_progress,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+        }
+
+
+class TaskSupervisor:
+    """
+    Κρατάει τα background tasks ενός component και τα ξαναξεκινά σε σφάλμα.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.tasks: Dict[str, SupervisedTask] = {}
+        # Οι one-off εκτελέσεις (spawn_once) - αναφορές μέχρι να τελειώσουν
+        self._oneoffs: Set[asyncio.Task] = set()
+        self.oneoff_failures = 0
+
+    def spawn(self, name: str, factory: Callable[[], Awaitable], restart: bool = True) -> asyncio.Task:
+        """
+        ΤΙ ΚΑΝΕΙ: Εκκινεί μακροχρόνιο task υπό επίβλεψη.
+        ΠΑΡΑΜΕΤΡΟΙ:
+            name: μοναδικό όνομα (εμφανίζεται στο /health)
+            factory: συνάρτηση χωρίς ορίσματα που επιστρέφει τη coroutine
+                     (π.χ. self.process_queue) - καλείται ξανά σε κάθε restart
+            restart: αν πρέπει να ξαναξεκινήσει μετά από exception
+        """
+        supervised = SupervisedTask(name, factory, restart)
+        self.tasks[name] = supervised
+        supervised.task = asyncio.create_task(self._run(supervised), name=f"{self.name}.{name}")
+        return supervised.task
+
+    async def _run(self, supervised: SupervisedTask):
+        """ΤΙ ΚΑΝΕΙ: Τρέχει το task και το ξαναξεκινά σε σφάλμα (με backoff)."""
+        failures = 0
+        while True:
+            supervised.started_at = time.time()
+            try:
+                await supervised.factory()
+                logger.info(f"Task {self.name}.{supervised.name} finished")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                supervised.last_error = f"{type(e).__name__}: {e}"
+                supervised.last_error_at = time.time()
+                if not supervised.restart:
+                    logger.exception(f"Task {self.name}.{supervised.name} crashed")
+                    return
+
+                # Έτρεξε αρκετά χωρίς πρόβλημα: ξεκινάμε πάλι από μικρό backoff
+                if supervised.last_error_at - supervised.started_at >= RESTART_BACKOFF_RESET_S:
+                    failures = 0
+                delay = min(RESTART_BACKOFF_BASE_S * (2 ** failures), RESTART_BACKOFF_MAX_S)
+                failures += 1
+                supervised.restarts += 1
+                logger.exception(
+                    f"Task {self.name}.{supervised.name} crashed; restarting in {delay:.0f}s "
+                    f"(restart #{supervised.restarts})"
+                )
+                await asyncio.sleep(delay)
+
+    def spawn_once(self, coro: Awaitable, name: str = "oneoff") -> asyncio.Task:
+        """
+        ΤΙ ΚΑΝΕΙ: Τρέχει μία coroutine ΜΙΑ φορά, κρατώντας αναφορά μέχρι να
+                   τελειώσει. Σφάλματα καταγράφονται (δεν "χάνονται" σιωπηλά).
+        """
+        task = asyncio.create_task(coro, name=f"{self.name}.{name}")
+        self._oneoffs.add(task)
+        task.add_done_callback(self._oneoff_done)
+        return task
+
+    def _oneoff_done(self, task: asyncio.Task):
+        self._oneoffs.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.oneoff_failures += 1
+            logger.error(f"Background task {task.get_name()} failed: {error!r}")
+
+    def beat(self, name: str):
+        """ΤΙ ΚΑΝΕΙ: Heartbeat - σημειώνει ότι το task έκανε πρόοδο τώρα."""
+        supervised = self.tasks.get(name)
+        if supervised:
+            supervised.last_progress = time.time()
+
+    def is_running(self, name: str) -> bool:
+        supervised = self.tasks.get(name)
+        return bool(supervised and supervised.task and not supervised.task.done())
+
+    async def cancel(self, name: str):
+        """ΤΙ ΚΑΝΕΙ: Ακυρώνει ένα task (χωρίς restart) και περιμένει να τελειώσει."""
+        supervised = self.tasks.pop(name, None)
+        if supervised is None or supervised.task is None or supervised.task.done():
+            return
+        supervised.task.cancel()
+        try:
+            await supervised.task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    async def shutdown(self):
+        """ΤΙ ΚΑΝΕΙ: Ακυρώνει ΟΛΑ τα tasks (μακροχρόνια και one-off)."""
+        for name in list(self.tasks):
+            await self.cancel(name)
+        oneoffs = list(self._oneoffs)
+        for task in oneoffs:
+            task.cancel()
+        if oneoffs:
+            await asyncio.gather(*oneoffs, return_exceptions=True)
+
+    def health(self) -> Dict:
+        """
+        ΤΙ ΚΑΝΕΙ: Κατάσταση όλων των tasks για το /health endpoint.
+        ΕΠΙΣΤΡΕΦΕΙ: {"healthy": bool, "tasks": {...}, "oneoff_running": n, ...}
+                    healthy = False αν κάποιο task με restart δεν τρέχει.
+        """
+        tasks = {name: supervised.snapshot() for name, supervised in self.tasks.items()}
+        healthy = all(info["running"] for name, info in tasks.items() if self.tasks[name].restart)
+        return {
+            "healthy": healthy,
+            "tasks": tasks,
+            "oneoff_running": len(self._oneoffs),
+            "oneoff_failures": self.oneoff_failures,
+        }
+
+
+# Supervisor για tasks της εφαρμογής που δεν ανήκουν στον MQTT consumer
+# (π.χ. λήξη κρατήσεων) - ακυρώνεται στον τερματισμό από το main.py
+background_tasks = TaskSupervisor("app")
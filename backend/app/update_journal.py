@@ -0,0 +1,220 @@
+"""
+=======================================================================
+update_journal.py - Τοπικό Ημερολόγιο (Journal) Εκκρεμών Αλλαγών
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Οι εκκρεμείς αλλαγές (pending updates) ζουν μόνο στη μνήμη μέχρι το
+    επόμενο flush. Αν το process "πέσει", χάνονται - γι' αυτό κρατούσαμε
+    μικρό το παράθυρο batch.
+
+    Εδώ κάθε αποδεκτή αλλαγή γράφεται ΠΡΩΤΑ σε ένα append-only αρχείο
+    στον τοπικό δίσκο (μία γραμμή JSON). Κατά την εκκίνηση, ό,τι βρεθεί
+    στο journal ξαναπαίζεται (replay) και αποθηκεύεται.
+
+ΠΩΣ ΔΕΝ ΜΕΓΑΛΩΝΕΙ ΧΩΡΙΣ ΟΡΙΟ (SEGMENTS):
+    Το journal είναι σπασμένο σε αρχεία "segment-<n>.log". Σε κάθε flush
+    ξεκινά νέο segment (rotate) και, αφού πετύχει η αποθήκευση, τα
+    παλαιότερα segments διαγράφονται. Αν η αποθήκευση αποτύχει, μένουν
+    στον δίσκο και ξαναπαίζονται στην επόμενη εκκίνηση.
+    Τα segments μιας ΠΡΟΗΓΟΥΜΕΝΗΣ εκτέλεσης δεν διαγράφονται ποτέ πριν
+    διαβαστούν από το replay() - ακόμα κι αν ένα flush γίνει πρώτα.
+
+ΚΟΣΤΟΣ (FSYNC ΑΝΑ ΟΜΑΔΑ):
+    Κάθε εγγραφή γίνεται flush αμέσως στο λειτουργικό → ένα crash του
+    process δεν χάνει τίποτα. Για crash του μηχανήματος χρειάζεται fsync,
+    που ανά μήνυμα θα ήταν πολύ αργό: γίνεται το πολύ ένα ανά
+    INGEST_JOURNAL_FSYNC_MS, από timer (όχι "στο επόμενο append" - με
+    αραιή κίνηση η τελευταία αλλαγή θα περίμενε επ' αόριστον), σε thread
+    ώστε να μη σταματά το event loop. Πάντα fsync και πριν από κάθε rotate.
+
+ΣΗΜΑΝΤΙΚΟ:
+    Κάθε process χρειάζεται το ΔΙΚΟ του φάκελο (INGEST_JOURNAL_DIR) -
+    αλλιώς ένα process θα ξανάπαιζε το journal ενός άλλου που τρέχει.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    spot_batch_writer.py, mqtt_consumer.py, config.py
+=======================================================================
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Μία εγγραφή του journal: (spot_id, status, city, timestamp)
+JournalEntry = Tuple[int, str, str, Optional[datetime]]
+
+
+class UpdateJournal:
+    """
+    Append-only journal σε segments, με ομαδικό fsync.
+    """
+
+    def __init__(self, directory: str, fsync_ms: Optional[int] = None):
+        """
+        ΠΑΡΑΜΕΤΡΟΙ:
+            directory: ο φάκελος των segments (δημιουργείται αν λείπει)
+            fsync_ms: μέγιστο διάστημα χωρίς fsync (None = από config.py)
+        """
+        self.directory = directory
+        self.fsync_interval = max(0, settings.INGEST_JOURNAL_FSYNC_MS if fsync_ms is None else fsync_ms) / 1000.0
+        os.makedirs(directory, exist_ok=True)
+
+        # Συνεχίζουμε την αρίθμηση μετά το τελευταίο υπάρχον segment
+        existing = self._segments()
+        self.segment = (existing[-1] + 1) if existing else 1
+
+        # Segments ως και αυτό είναι από προηγούμενη εκτέλεση και ΔΕΝ έχουν
+        # ξαναπαιχτεί - το discard_through() δεν τα αγγίζει (0 = κανένα)
+        self.unreplayed_through = existing[-1] if existing else 0
+        # replayed_through: το τελευταίο segment που διάβασε το replay()
+        self.replayed_through = 0
+        self._file = open(self._path(self.segment), "a", encoding="utf-8")
+        self._last_sync = time.monotonic()
+
+        # Προγραμματισμένο fsync (loop.call_later) και το task που το εκτελεί
+        self._sync_timer: Optional[asyncio.TimerHandle] = None
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:010d}.log")
+
+    def _segments(self) -> List[int]:
+        """ΤΙ ΚΑΝΕΙ: Οι αριθμοί των segments στον φάκελο, σε αύξουσα σειρά."""
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".log"):
+                try:
+                    numbers.append(int(name[len("segment-"):-len(".log")]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    def append(self, spot_id: int, status: str, city: str, timestamp: Optional[datetime]):
+        """
+        ΤΙ ΚΑΝΕΙ: Γράφει μία αλλαγή στο τρέχον segment (flush αμέσως).
+        ΣΗΜΕΙΩΣΗ: Το fsync γίνεται από timer, το πολύ INGEST_JOURNAL_FSYNC_MS
+                  μετά - ακόμα κι αν δεν ακολουθήσει άλλη εγγραφή.
+        """
+        record = {"spot_id": spot_id, "status": status, "city": city,
+                  "ts": timestamp.isoformat() if timestamp else None}
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._schedule_sync()
+
+    def _schedule_sync(self):
+        """ΤΙ ΚΑΝΕΙ: Προγραμματίζει fsync (αν δεν υπάρχει ήδη) το αργότερο σε fsync_interval."""
+        if self._sync_timer is not None or (self._sync_task and not self._sync_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Εκτός event loop (π.χ. script): σύγχρονο fsync
+            self.sync()
+            return
+        delay = max(0.0, self._last_sync + self.fsync_interval - time.monotonic())
+        self._sync_timer = loop.call_later(delay, self._start_sync)
+
+    def _start_sync(self):
+        """ΤΙ ΚΑΝΕΙ: Callback του timer: ξεκινά το fsync σε thread."""
+        self._sync_timer = None
+        self._sync_task = asyncio.get_running_loop().create_task(self.sync_async())
+
+    async def sync_async(self):
+        """
+        ΤΙ ΚΑΝΕΙ: fsync σε thread (asyncio.to_thread) - δεν σταματά το event loop.
+        ΣΗΜΕΙΩΣΗ: Κάνει fsync σε αντίγραφο (dup) του fd, ώστε ένα rotate()
+                  στο μεταξύ να μπορεί να κλείσει το αρχείο με ασφάλεια.
+        """
+        started = time.monotonic()
+        try:
+            fd = os.dup(self._file.fileno())
+        except (OSError, ValueError):
+            return  # Το journal έκλεισε
+        try:
+            await asyncio.to_thread(os.fsync, fd)
+            self._last_sync = max(self._last_sync, started)
+        except OSError as e:
+            logger.error(f"Journal fsync failed: {e}")
+        finally:
+            os.close(fd)
+
+    def sync(self):
+        """ΤΙ ΚΑΝΕΙ: Γράφει τα buffers στον δίσκο (flush + fsync), σύγχρονα."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def rotate(self) -> int:
+        """
+        ΤΙ ΚΑΝΕΙ: Κλείνει το τρέχον segment και ανοίγει νέο.
+        ΕΠΙΣΤΡΕΦΕΙ: Τον αριθμό του segment που έκλεισε - μόλις αποθηκευτούν
+                    οι αλλαγές του, δίνεται στο discard_through().
+        """
+        self.sync()
+        self._file.close()
+        closed = self.segment
+        self.segment += 1
+        self._file = open(self._path(self.segment), "a", encoding="utf-8")
+        return closed
+
+    def discard_through(self, segment: int):
+        """
+        ΤΙ ΚΑΝΕΙ: Διαγράφει όλα τα segments μέχρι (και) το δοσμένο - είναι πια στη βάση.
+        ΕΚΤΟΣ: όσα είναι από προηγούμενη εκτέλεση και δεν έχουν ξαναπαιχτεί
+               (π.χ. απέτυχε το replay στην εκκίνηση) - αυτά ΔΕΝ είναι στη βάση.
+        """
+        for number in self._segments():
+            if number > segment:
+                break
+            if number <= self.unreplayed_through:
+                continue
+            try:
+                os.remove(self._path(number))
+            except OSError as e:
+                logger.warning(f"Failed to remove journal segment {number}: {e}")
+
+    def replay(self) -> Tuple[List[JournalEntry], int]:
+        """
+        ΤΙ ΚΑΝΕΙ: Διαβάζει όλες τις αλλαγές των κλειστών segments (από
+                   προηγούμενη εκτέλεση) και ξεκινά νέο segment.
+        ΕΠΙΣΤΡΕΦΕΙ: (εγγραφές με τη σειρά που γράφτηκαν, τελευταίο segment
+                    που διαβάστηκε - για το discard_through() μετά την αποθήκευση)
+        ΣΗΜΕΙΩΣΗ: Μια μισογραμμένη τελευταία γραμμή (crash κατά την εγγραφή)
+                  απλώς παραλείπεται.
+        """
+        last = self.rotate()
+        entries: List[JournalEntry] = []
+        for number in self._segments():
+            if number > last:
+                break
+            with open(self._path(number), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        ts = datetime.fromisoformat(record["ts"]) if record.get("ts") else None
+                        entries.append((int(record["spot_id"]), record["status"], record["city"], ts))
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning(f"Skipping corrupt journal line in segment {number}")
+        # Διαβάστηκαν όλα: από εδώ και πέρα το discard_through() μπορεί να τα σβήσει
+        self.replayed_through = last
+        self.unreplayed_through = 0
+        return entries, last
+
+    def close(self):
+        """ΤΙ ΚΑΝΕΙ: Κλείνει το journal (με τελικό fsync)."""
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        try:
+            self.sync()
+        finally:
+            self._file.close()
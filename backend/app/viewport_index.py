@@ -0,0 +1,123 @@
+"""
+=======================================================================
+viewport_index.py - Χωρικό Ευρετήριο των Viewports των WebSocket Clients
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Κάθε browser στέλνει στο /ws το ορατό τμήμα του χάρτη του (bbox).
+    Εδώ βρίσκουμε γρήγορα ΠΟΙΟΙ clients "βλέπουν" ένα σημείο (lat, lng),
+    ώστε μια αλλαγή θέσης να σταλεί μόνο σε αυτούς.
+
+ΠΩΣ (GRID):
+    Χωρίζουμε τον χάρτη σε κελιά WS_GRID_CELL_DEG x WS_GRID_CELL_DEG
+    μοιρών (0.02° ≈ 2 km). Κάθε viewport καταχωρείται σε όλα τα κελιά
+    που καλύπτει. Για ένα σημείο κοιτάμε ΜΟΝΟ το κελί του και ελέγχουμε
+    ακριβώς το bbox των υποψηφίων → κόστος ανάλογο με τους ενδιαφερόμενους
+    clients, όχι με όλους τους συνδεδεμένους.
+
+ΠΟΛΥ ΜΕΓΑΛΑ VIEWPORTS:
+    Ένας χάρτης σε μικρό zoom (π.χ. όλη η Ελλάδα) θα έπιανε χιλιάδες
+    κελιά. Πάνω από WS_VIEWPORT_MAX_CELLS μπαίνει σε ξεχωριστή λίστα
+    "wide" που ελέγχεται απευθείας - είναι λίγοι και θέλουν σχεδόν τα πάντα.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    websocket_broadcaster.py, spot_registry.py (συντεταγμένες θέσεων), config.py
+=======================================================================
+"""
+
+import math
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Set, Tuple
+
+from app.core.config import settings
+
+Cell = Tuple[int, int]
+
+
+class BBox(NamedTuple):
+    """Ορατό τμήμα χάρτη - ίδια ονόματα με το GET /api/parking/spots/in_viewport."""
+    sw_lat: float
+    sw_lng: float
+    ne_lat: float
+    ne_lng: float
+
+    def contains(self, lat: float, lng: float) -> bool:
+        return self.sw_lat <= lat <= self.ne_lat and self.sw_lng <= lng <= self.ne_lng
+
+
+def parse_bbox(data: Dict[str, Any]) -> Optional[BBox]:
+    """
+    ΤΙ ΚΑΝΕΙ: Διαβάζει bbox από μήνυμα client: {"swLat", "swLng", "neLat", "neLng"}.
+    ΕΠΙΣΤΡΕΦΕΙ: BBox ή None αν λείπει/είναι άκυρο (π.χ. sw βορειότερα από ne).
+    """
+    try:
+        bbox = BBox(float(data["swLat"]), float(data["swLng"]), float(data["neLat"]), float(data["neLng"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(math.isfinite(value) for value in bbox):
+        return None
+    if not (-90 <= bbox.sw_lat <= bbox.ne_lat <= 90 and -180 <= bbox.sw_lng <= bbox.ne_lng <= 180):
+        return None
+    return bbox
+
+
+class ViewportIndex:
+    """
+    Grid: κελί → subscribers που το καλύπτουν, και subscriber → (bbox, κελιά).
+    Ο subscriber είναι οποιοδήποτε hashable (εδώ: η ClientConnection).
+    """
+
+    def __init__(self, cell_deg: Optional[float] = None, max_cells: Optional[int] = None):
+        """
+        ΠΑΡΑΜΕΤΡΟΙ:
+            cell_deg: μέγεθος κελιού σε μοίρες (None = WS_GRID_CELL_DEG)
+            max_cells: πάνω από τόσα κελιά το viewport πάει στη λίστα "wide"
+        """
+        self.cell_deg = settings.WS_GRID_CELL_DEG if cell_deg is None else cell_deg
+        self.max_cells = settings.WS_VIEWPORT_MAX_CELLS if max_cells is None else max_cells
+        self.cells: Dict[Cell, Set[Hashable]] = {}
+        self.subscribers: Dict[Hashable, Tuple[BBox, Tuple[Cell, ...]]] = {}
+        self.wide: Set[Hashable] = set()
+
+    def _cell(self, lat: float, lng: float) -> Cell:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def subscribe(self, subscriber: Hashable, bbox: BBox):
+        """ΤΙ ΚΑΝΕΙ: Καταχωρεί (ή αντικαθιστά) το viewport ενός subscriber."""
+        self.unsubscribe(subscriber)
+        lat0, lng0 = self._cell(bbox.sw_lat, bbox.sw_lng)
+        lat1, lng1 = self._cell(bbox.ne_lat, bbox.ne_lng)
+        if (lat1 - lat0 + 1) * (lng1 - lng0 + 1) > self.max_cells:
+            self.wide.add(subscriber)
+            self.subscribers[subscriber] = (bbox, ())
+            return
+        cells = tuple((i, j) for i in range(lat0, lat1 + 1) for j in range(lng0, lng1 + 1))
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(subscriber)
+        self.subscribers[subscriber] = (bbox, cells)
+
+    def unsubscribe(self, subscriber: Hashable):
+        """ΤΙ ΚΑΝΕΙ: Αφαιρεί το viewport ενός subscriber (αν υπάρχει)."""
+        entry = self.subscribers.pop(subscriber, None)
+        if entry is None:
+            return
+        self.wide.discard(subscriber)
+        for cell in entry[1]:
+            members = self.cells.get(cell)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self.cells[cell]
+
+    def match(self, lat: float, lng: float) -> Set[Hashable]:
+        """ΕΠΙΣΤΡΕΦΕΙ: Οι subscribers των οποίων το viewport περιέχει το σημείο."""
+        found = {s for s in self.cells.get(self._cell(lat, lng), ()) if self.subscribers[s][0].contains(lat, lng)}
+        found.update(s for s in self.wide if self.subscribers[s][0].contains(lat, lng))
+        return found
+
+    def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        return {
+            "viewports": len(self.subscribers),
+            "wide_viewports": len(self.wide),
+            "cells": len(self.cells),
+        }
@@ -0,0 +1,609 @@
+"""
+=======================================================================
+websocket_broadcaster.py - Αποστολή Ενημερώσεων σε WebSocket Clients
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Στέλνει τις αλλαγές κατάστασης θέσεων σε όλους τους συνδεδεμένους
+    browsers. Κάθε σύνδεση έχει τη ΔΙΚΗ της ουρά εξερχόμενων μηνυμάτων
+    (με όριο) και τον ΔΙΚΟ της writer task.
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Πριν, το broadcast_to_websockets έκανε await send_json() σε κάθε
+    client με τη σειρά, μέσα στη ροή επεξεργασίας των MQTT μηνυμάτων.
+    Ένα αργό κινητό (κακό δίκτυο) καθυστερούσε ΟΛΟΥΣ τους επόμενους
+    clients ΚΑΙ το process_queue.
+
+    Τώρα η ροή επεξεργασίας απλά βάζει το μήνυμα στις ουρές (put_nowait,
+    χωρίς αναμονή). Οι writer tasks στέλνουν παράλληλα, με timeout.
+
+ΑΡΓΟΙ CLIENTS:
+    Αν η ουρά ενός client γεμίσει (WS_SEND_QUEUE_SIZE) ή μια αποστολή
+    αργήσει πάνω από WS_SEND_TIMEOUT_S, η σύνδεση κλείνει (κωδικός 1013
+    "try again later"). Ο browser ξανασυνδέεται και φορτώνει την τρέχουσα
+    κατάσταση - καλύτερο από έναν χάρτη που "χάνει" ενημερώσεις σιωπηλά.
+
+VIEWPORT:
+    Ένας client που έστειλε το ορατό τμήμα του χάρτη του (set_viewport)
+    λαμβάνει μόνο αλλαγές θέσεων μέσα σε αυτό (βλ. viewport_index.py).
+    Όσοι δεν έστειλαν viewport λαμβάνουν τα πάντα (όπως πριν).
+
+ΚΑΝΑΛΙΑ (CHANNELS):
+    Φθηνότερη εναλλακτική του viewport: ο client γράφεται σε κανάλια
+    "city:<πόλη>" ή "area:<πόλη>/<περιοχή>" (π.χ. "city:Larissa") και
+    λαμβάνει μόνο τις αλλαγές των θέσεων που ανήκουν σε αυτά.
+    Με viewport ΚΑΙ κανάλια, λαμβάνει την ένωση (ό,τι ταιριάζει σε ένα από τα δύο).
+
+ΚΩΔΙΚΟΠΟΙΗΣΗ ΜΙΑ ΦΟΡΑ + MICRO-BATCHING:
+    Κάθε αλλαγή γίνεται JSON ΜΙΑ φορά (όχι send_json ανά client). Οι
+    αλλαγές ενός παραθύρου WS_BATCH_WINDOW_MS μαζεύονται και κάθε client
+    λαμβάνει ΕΝΑ frame {"type": "spot_updates", "updates": [...]} με όσες
+    τον αφορούν. Clients με τις ίδιες αλλαγές (π.χ. όλοι χωρίς φίλτρο)
+    μοιράζονται το ΙΔΙΟ έτοιμο frame. Με WS_BATCH_WINDOW_MS=0 κάθε αλλαγή
+    στέλνεται αμέσως ως {"type": "spot_update", ...} (η παλιά μορφή).
+
+ΑΡΙΘΜΟΣ ΣΕΙΡΑΣ (seq) + ΣΥΝΕΧΙΣΗ (RESUME):
+    Κάθε αλλαγή έχει αύξοντα αριθμό "seq" (τον βάζει το broadcast_bus.py).
+    Οι τελευταίες WS_REPLAY_BUFFER_SIZE αλλαγές μένουν στη μνήμη (ήδη σε
+    JSON). Μόλις συνδεθεί, ο client λαμβάνει {"type": "hello", "seq": N}.
+    Όταν ξανασυνδεθεί στέλνει {"type": "resume", "seq": <τελευταίο seq>}:
+    - αν οι αλλαγές που έχασε είναι ακόμα στη μνήμη, τις λαμβάνει σε ένα
+      "spot_updates" frame (μόνο όσες ταιριάζουν στο viewport/κανάλια του)
+      και μετά {"type": "resumed", "seq": N, "missed": <πλήθος>}
+    - αλλιώς {"type": "snapshot_required", "seq": N}: ξαναφορτώνει την
+      τρέχουσα κατάσταση από το REST API (όπως πριν σε κάθε σύνδεση)
+
+HEARTBEAT + ΟΡΙΑ ΣΥΝΔΕΣΕΩΝ:
+    Ένα socket που "πέθανε" χωρίς close (κινητό έχασε σήμα, NAT timeout)
+    δεν το βλέπουμε μέχρι να αποτύχει μια αποστολή - και αν ο client έχει
+    viewport χωρίς αλλαγές, αυτό μπορεί να μην γίνει ποτέ. Κάθε
+    WS_PING_INTERVAL_S στέλνουμε {"type": "ping"} (ΕΝΑ frame για όλους) και
+    όποιος δεν έχει στείλει τίποτα (π.χ. {"type": "pong"}) για
+    WS_PING_TIMEOUT_S αποσυνδέεται. Νέες συνδέσεις απορρίπτονται πάνω από
+    WS_MAX_CONNECTIONS (ανά process), WS_MAX_CONNECTIONS_PER_IP ή
+    WS_MAX_CONNECTIONS_PER_USER (με ?token=<JWT> στο URL).
+
+SERVER-SENT EVENTS:
+    Ο ίδιος μηχανισμός εξυπηρετεί και το GET /sse (main.py): ο SSE client
+    καταχωρείται με register(..., writer=False) και το ίδιο το HTTP response
+    αδειάζει την ουρά του. Τα frames είναι τα ΙΔΙΑ έτοιμα strings - στην
+    ουρά μπαίνει (frame, seq) ώστε το SSE να γράφει "id: <seq>" χωρίς να
+    ξαναδιαβάσει το JSON.
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    mqtt_consumer.py (broadcast), main.py (/ws endpoint, τερματισμός),
+    viewport_index.py, config.py
+=======================================================================
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.viewport_index import BBox, ViewportIndex
+
+logger = logging.getLogger(__name__)
+
+# Κωδικός κλεισίματος για αργούς clients ("Try Again Later", RFC 6455)
+SLOW_CLIENT_CLOSE_CODE = 1013
+# Κωδικός κλεισίματος για clients που δεν απάντησαν στα ping ("Going Away")
+IDLE_CLIENT_CLOSE_CODE = 1001
+# Κωδικός απόρριψης νέας σύνδεσης λόγω ορίου ("Policy Violation")
+LIMIT_CLOSE_CODE = 1008
+
+# Έγκυρα προθέματα καναλιών και μέγιστα κανάλια ανά σύνδεση
+CHANNEL_PREFIXES = ("city:", "area:")
+MAX_CHANNELS_PER_CLIENT = 50
+
+
+def spot_channels(city: Optional[str], area: Optional[str]) -> List[str]:
+    """
+    ΤΙ ΚΑΝΕΙ: Τα κανάλια στα οποία ανήκει μια θέση.
+    ΠΑΡΑΔΕΙΓΜΑ: ("Athens", "Kolonaki") → ["city:Athens", "area:Athens/Kolonaki"]
+    """
+    if not city:
+        return []
+    channels = [f"city:{city}"]
+    if area:
+        channels.append(f"area:{city}/{area}")
+    return channels
+
+
+def valid_channel(channel: Any) -> bool:
+    """ΤΙ ΚΑΝΕΙ: Ελέγχει ότι το όνομα καναλιού έχει γνωστό πρόθεμα και λογικό μήκος."""
+    return (isinstance(channel, str) and channel.startswith(CHANNEL_PREFIXES)
+            and len(channel) <= 120 and channel.split(":", 1)[1] != "")
+
+
+def encode(message: Dict) -> str:
+    """ΤΙ ΚΑΝΕΙ: JSON χωρίς περιττά κενά (μικρότερα frames)."""
+    return json.dumps(message, separators=(",", ":"))
+
+
+class ClientConnection:
+    """Μία WebSocket σύνδεση: η ουρά έτοιμων (text) frames και ο writer της."""
+
+    # __slots__: χιλιάδες συνδέσεις ανά process → χωρίς __dict__ ανά αντικείμενο
+    __slots__ = ("websocket", "queue", "writer", "closed", "viewport", "channels", "batch",
+                 "ip", "user", "last_seen")
+
+    def __init__(self, websocket, queue_size: int, ip: Optional[str] = None, user: Optional[str] = None):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.viewport: Optional[BBox] = None   # Ορατό τμήμα χάρτη (None = χωρίς)
+        self.channels: Set[str] = set()         # Κανάλια "city:..." / "area:..."
+        self.batch: List[int] = []              # Θέσεις (index) των αλλαγών του τρέχοντος παραθύρου
+        self.ip = ip                            # Διεύθυνση client (όριο ανά IP)
+        self.user = user                        # user id από το token (όριο ανά χρήστη)
+        self.last_seen = time.monotonic()       # Τελευταίο μήνυμα ΑΠΟ τον client
+
+
+class WebSocketBroadcaster:
+    """
+    Κρατάει τις ενεργές συνδέσεις (websocket → ClientConnection) και
+    μοιράζει τα μηνύματα στις ουρές τους χωρίς να περιμένει το δίκτυο.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None, send_timeout_s: Optional[float] = None,
+                 batch_window_ms: Optional[int] = None, replay_size: Optional[int] = None):
+        """
+        ΠΑΡΑΜΕΤΡΟΙ:
+            queue_size: όριο ουράς ανά client (None = WS_SEND_QUEUE_SIZE)
+            send_timeout_s: timeout αποστολής (None = WS_SEND_TIMEOUT_S)
+            batch_window_ms: παράθυρο micro-batching (None = WS_BATCH_WINDOW_MS, 0 = χωρίς)
+            replay_size: αλλαγές που κρατιούνται για resume (None = WS_REPLAY_BUFFER_SIZE)
+        """
+        self.queue_size = settings.WS_SEND_QUEUE_SIZE if queue_size is None else queue_size
+        self.send_timeout = settings.WS_SEND_TIMEOUT_S if send_timeout_s is None else send_timeout_s
+        self.batch_window = max(0, settings.WS_BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms) / 1000.0
+
+        # Το τρέχον παράθυρο micro-batching: οι αλλαγές ήδη σε JSON και οι
+        # clients που περιμένουν frame (ο καθένας κρατά τα index που τον αφορούν)
+        self._batch_updates: List[str] = []
+        self._batch_seqs: List[Optional[int]] = []
+        self._batch_clients: Set[ClientConnection] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        # Οι τελευταίες αλλαγές για resume: (seq, JSON αλλαγής, location, channels)
+        # last_seq: το μεγαλύτερο seq που έχουμε δει
+        self.replay: Deque[Tuple[int, str, Optional[Tuple[float, float]], Tuple[str, ...]]] = deque(
+            maxlen=settings.WS_REPLAY_BUFFER_SIZE if replay_size is None else replay_size
+        )
+        self.last_seq = 0
+
+        # connections: dict αντί για λίστα → προσθήκη/αφαίρεση σε O(1)
+        self.connections: Dict[Any, ClientConnection] = {}
+
+        # viewports: ευρετήριο των clients που έστειλαν viewport
+        # channels: κανάλι → clients γραμμένοι σε αυτό
+        # unfiltered: οι clients χωρίς viewport και χωρίς κανάλια (λαμβάνουν τα πάντα)
+        self.viewports = ViewportIndex()
+        self.channels: Dict[str, Set[ClientConnection]] = {}
+        self.unfiltered: Set[ClientConnection] = set()
+
+        # Πλήθος ενεργών συνδέσεων ανά IP / χρήστη (για τα όρια)
+        self.per_ip: Dict[str, int] = {}
+        self.per_user: Dict[str, int] = {}
+
+        # _closing: αναφορές στα close() που τρέχουν στο παρασκήνιο
+        self._closing: Set[asyncio.Task] = set()
+
+        # Μετρικές
+        self.published = 0        # Αλλαγές που δόθηκαν στο publish()
+        self.frames_encoded = 0   # Frames που φτιάχτηκαν (μοιράζονται σε πολλούς clients)
+        self.frames_queued = 0    # Frames που μπήκαν σε ουρές clients
+        self.slow_dropped = 0     # Clients που αποσυνδέθηκαν επειδή ήταν αργοί
+        self.send_failures = 0    # Αποστολές που απέτυχαν (κλειστή σύνδεση κλπ.)
+        self.resumed = 0          # Επανασυνδέσεις που συνέχισαν από τη μνήμη
+        self.snapshots_required = 0  # Επανασυνδέσεις που χρειάστηκαν πλήρη φόρτωση
+        self.rejected = 0         # Νέες συνδέσεις που απορρίφθηκαν λόγω ορίου
+        self.idle_reaped = 0      # Συνδέσεις που έκλεισαν επειδή δεν απαντούσαν
+        self.dropped_messages = 0  # Frames που δεν στάλθηκαν ποτέ (έμειναν σε ουρά που έκλεισε)
+
+    def admit(self, ip: Optional[str], user: Optional[str] = None) -> Optional[str]:
+        """
+        ΤΙ ΚΑΝΕΙ: Ελέγχει τα όρια συνδέσεων ΠΡΙΝ το accept μιας νέας σύνδεσης.
+        ΕΠΙΣΤΡΕΦΕΙ: None αν επιτρέπεται, αλλιώς ο λόγος απόρριψης.
+        """
+        reason = None
+        if settings.WS_MAX_CONNECTIONS and len(self.connections) >= settings.WS_MAX_CONNECTIONS:
+            reason = "too many connections"
+        elif ip and settings.WS_MAX_CONNECTIONS_PER_IP and self.per_ip.get(ip, 0) >= settings.WS_MAX_CONNECTIONS_PER_IP:
+            reason = "too many connections from this address"
+        elif (user and settings.WS_MAX_CONNECTIONS_PER_USER
+              and self.per_user.get(user, 0) >= settings.WS_MAX_CONNECTIONS_PER_USER):
+            reason = "too many connections for this user"
+        if reason:
+            self.rejected += 1
+        return reason
+
+    def register(self, websocket, ip: Optional[str] = None, user: Optional[str] = None,
+                 writer: bool = True) -> ClientConnection:
+        """
+        ΤΙ ΚΑΝΕΙ: Προσθέτει νέα (ήδη accepted) σύνδεση, ξεκινά τον writer της
+                   και της στέλνει {"type": "hello", "seq": <τρέχον seq>}.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py όταν συνδέεται νέος browser (/ws ή /sse).
+        ΠΑΡΑΜΕΤΡΟΙ: writer - False όταν την ουρά την αδειάζει ο καλών (SSE)
+        """
+        connection = ClientConnection(websocket, self.queue_size, ip, user)
+        if writer:
+            connection.writer = asyncio.create_task(self._writer(connection), name="ws_writer")
+        self.connections[websocket] = connection
+        self.unfiltered.add(connection)
+        if ip:
+            self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+        if user:
+            self.per_user[user] = self.per_user.get(user, 0) + 1
+        self.send(connection, {"type": "hello", "seq": self.last_seq})
+        return connection
+
+    async def unregister(self, websocket):
+        """
+        ΤΙ ΚΑΝΕΙ: Αφαιρεί τη σύνδεση και σταματά τον writer της.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py όταν κλείσει ο browser (ασφαλές και δεύτερη φορά).
+        """
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        self._forget(connection)
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+            try:
+                await connection.writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def _forget(self, connection: ClientConnection):
+        """ΤΙ ΚΑΝΕΙ: Σημειώνει τη σύνδεση κλειστή και τη βγάζει από τα ευρετήρια."""
+        connection.closed = True
+        self.dropped_messages += connection.queue.qsize() + len(connection.batch)
+        self.unfiltered.discard(connection)
+        self.viewports.unsubscribe(connection)
+        self._leave_channels(connection, list(connection.channels))
+        self._release(self.per_ip, connection.ip)
+        self._release(self.per_user, connection.user)
+
+    @staticmethod
+    def _release(counts: Dict[str, int], key: Optional[str]):
+        """ΤΙ ΚΑΝΕΙ: Μειώνει τον μετρητή ανά IP/χρήστη (και τον σβήνει στο 0)."""
+        if key is None or key not in counts:
+            return
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
+
+    def touch(self, connection: ClientConnection):
+        """
+        ΤΙ ΚΑΝΕΙ: Σημειώνει ότι ο client είναι ζωντανός (έστειλε κάτι).
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py για κάθε μήνυμα του client (π.χ. "pong").
+        """
+        connection.last_seen = time.monotonic()
+
+    def _update_filtered(self, connection: ClientConnection):
+        """ΤΙ ΚΑΝΕΙ: Χωρίς viewport και κανάλια ο client λαμβάνει όλες τις αλλαγές."""
+        if connection.viewport is None and not connection.channels:
+            self.unfiltered.add(connection)
+        else:
+            self.unfiltered.discard(connection)
+
+    def set_viewport(self, connection: ClientConnection, bbox: Optional[BBox]):
+        """
+        ΤΙ ΚΑΝΕΙ: Ορίζει το ορατό τμήμα χάρτη ενός client (None = όλες οι αλλαγές).
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py όταν ο client στείλει {"type": "viewport", ...}.
+        """
+        if connection.closed:
+            return
+        connection.viewport = bbox
+        if bbox is None:
+            self.viewports.unsubscribe(connection)
+        else:
+            self.viewports.subscribe(connection, bbox)
+        self._update_filtered(connection)
+
+    def subscribe(self, connection: ClientConnection, channels: Iterable[str]) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Γράφει τον client στα δοσμένα κανάλια (π.χ. "city:Athens").
+        ΕΠΙΣΤΡΕΦΕΙ: False αν κάποιο κανάλι είναι άκυρο ή ξεπεράστηκε το όριο
+                    MAX_CHANNELS_PER_CLIENT (τότε δεν αλλάζει τίποτα).
+        """
+        channels = set(channels)
+        if connection.closed or not all(valid_channel(c) for c in channels):
+            return False
+        if len(connection.channels | channels) > MAX_CHANNELS_PER_CLIENT:
+            return False
+        for channel in channels - connection.channels:
+            self.channels.setdefault(channel, set()).add(connection)
+        connection.channels |= channels
+        self._update_filtered(connection)
+        return True
+
+    def unsubscribe(self, connection: ClientConnection, channels: Iterable[str]):
+        """ΤΙ ΚΑΝΕΙ: Αφαιρεί τον client από τα δοσμένα κανάλια."""
+        self._leave_channels(connection, channels)
+        if not connection.closed:
+            self._update_filtered(connection)
+
+    def _leave_channels(self, connection: ClientConnection, channels: Iterable[str]):
+        for channel in channels:
+            if channel not in connection.channels:
+                continue
+            connection.channels.discard(channel)
+            members = self.channels.get(channel)
+            if members is not None:
+                members.discard(connection)
+                if not members:
+                    del self.channels[channel]
+
+    def send(self, connection: ClientConnection, message: Dict) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Στέλνει ένα μήνυμα ελέγχου (π.χ. viewport_ack) σε ΕΝΑΝ client.
+        ΕΠΙΣΤΡΕΦΕΙ: False αν ο client ήταν πολύ αργός και αποσυνδέθηκε.
+        """
+        return self._enqueue(connection, encode(message))
+
+    def _wants(self, connection: ClientConnection, location: Optional[Tuple[float, float]],
+               channels: Iterable[str]) -> bool:
+        """ΤΙ ΚΑΝΕΙ: Ίδιος κανόνας με το publish() για ΕΝΑΝ client (χρήση στο resume)."""
+        if connection in self.unfiltered:
+            return True
+        if connection.viewport is not None and (location is None or connection.viewport.contains(*location)):
+            return True
+        return not connection.channels.isdisjoint(channels)
+
+    def resume(self, connection: ClientConnection, last_seq: int) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Στέλνει σε client που ξανασυνδέθηκε τις αλλαγές μετά το
+                   last_seq (όσες τον αφορούν) και {"type": "resumed", ...}.
+                   Αν δεν είναι όλες στη μνήμη: {"type": "snapshot_required"}.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py όταν ο client στείλει {"type": "resume", "seq": N}
+                      (ΜΕΤΑ το viewport/subscribe, ώστε να ισχύουν τα φίλτρα του).
+        ΕΠΙΣΤΡΕΦΕΙ: True αν συνέχισε από τη μνήμη.
+        """
+        latest = self.last_seq
+        oldest = self.replay[0][0] if self.replay else latest + 1
+        if last_seq > latest or (last_seq < latest and last_seq + 1 < oldest):
+            # Μεγαλύτερο seq από το δικό μας (π.χ. restart) ή κενό μεγαλύτερο από τη μνήμη
+            self.snapshots_required += 1
+            self.send(connection, {"type": "snapshot_required", "seq": latest})
+            return False
+        # Ό,τι μπήκε στην ουρά/στο παράθυρο ανάμεσα στο hello και το resume
+        # είναι ήδη στο replay (seq ≤ latest): αλλιώς θα έφτανε δύο φορές - και
+        # το δεύτερο αντίγραφο (στο επόμενο flush) ΜΕΤΑ από νεότερα δεδομένα
+        self._discard_pending_updates(connection, latest)
+        missed = [(seq, update) for seq, update, location, channels in self.replay
+                  if seq > last_seq and self._wants(connection, location, channels)]
+        if missed:
+            self.frames_encoded += 1
+            frame = '{"type":"spot_updates","updates":[' + ",".join(update for _, update in missed) + "]}"
+            if not self._enqueue(connection, frame, max(seq for seq, _ in missed)):
+                return False
+        self.resumed += 1
+        return self.send(connection, {"type": "resumed", "seq": latest, "missed": len(missed)})
+
+    def _discard_pending_updates(self, connection: ClientConnection, up_to_seq: int):
+        """
+        ΤΙ ΚΑΝΕΙ: Αφαιρεί από το τρέχον παράθυρο και από την ουρά του client
+                   τις αλλαγές με seq ≤ up_to_seq (τα μηνύματα ελέγχου μένουν).
+        """
+        seqs = self._batch_seqs
+        connection.batch = [i for i in connection.batch if seqs[i] is None or seqs[i] > up_to_seq]
+        kept = []
+        while not connection.queue.empty():
+            frame, seq = connection.queue.get_nowait()
+            if seq is None or seq > up_to_seq:
+                kept.append((frame, seq))
+        for item in kept:
+            connection.queue.put_nowait(item)
+
+    def _enqueue(self, connection: ClientConnection, frame: str, seq: Optional[int] = None) -> bool:
+        """
+        ΤΙ ΚΑΝΕΙ: Βάζει ένα έτοιμο frame στην ουρά ΕΝΟΣ client (χωρίς αναμονή).
+        ΠΑΡΑΜΕΤΡΟΙ: seq - το μεγαλύτερο seq που περιέχει το frame (None για
+                    μηνύματα ελέγχου) - το χρησιμοποιεί το SSE ως event id.
+        ΕΠΙΣΤΡΕΦΕΙ: False αν ο client ήταν πολύ αργός και αποσυνδέθηκε.
+        ΣΗΜΕΙΩΣΗ: ΟΛΕΣ οι αποστολές περνούν από τον writer - δύο tasks
+                  δεν γράφουν ποτέ ταυτόχρονα στο ίδιο socket.
+        """
+        if connection.closed:
+            return False
+        try:
+            connection.queue.put_nowait((frame, seq))
+            self.frames_queued += 1
+            return True
+        except asyncio.QueueFull:
+            self.slow_dropped += 1
+            logger.warning(f"Dropping slow WebSocket client {connection.websocket.client}: send queue full")
+            self._drop(connection)
+            return False
+
+    def publish(self, update: Dict, location: Optional[Tuple[float, float]] = None,
+                channels: Iterable[str] = ()) -> int:
+        """
+        ΤΙ ΚΑΝΕΙ: Μοιράζει μια αλλαγή θέσης στους ενδιαφερόμενους clients
+                   (μόνο ουρές - καμία αναμονή δικτύου στη ροή επεξεργασίας).
+        ΠΑΡΑΜΕΤΡΟΙ:
+            update: η αλλαγή {"spot_id", "status", "city", "timestamp", "seq"}
+            location: (lat, lng) της θέσης - στέλνεται σε όσους τη "βλέπουν".
+                      None = άγνωστη θέση → σε όλους όσους έχουν viewport.
+            channels: τα κανάλια της θέσης (βλ. spot_channels)
+        ΕΠΙΣΤΡΕΦΕΙ: Σε πόσους clients θα σταλεί.
+        ΣΗΜΕΙΩΣΗ: Οι clients χωρίς viewport/κανάλια λαμβάνουν πάντα την αλλαγή.
+        """
+        self.published += 1
+        channels = tuple(channels)
+        encoded = encode(update)
+        seq = update.get("seq")
+        if isinstance(seq, int):
+            self.replay.append((seq, encoded, location, channels))
+            self.last_seq = max(self.last_seq, seq)
+        else:
+            seq = None
+
+        recipients = set(self.unfiltered)
+        if location is None:
+            recipients.update(self.viewports.subscribers)
+        else:
+            recipients.update(self.viewports.match(*location))
+        for channel in channels:
+            recipients.update(self.channels.get(channel, ()))
+        if not recipients:
+            return 0
+
+        # Χωρίς παράθυρο: ένα frame, κωδικοποιημένο μία φορά, σε όλους
+        if self.batch_window <= 0:
+            frame = '{"type":"spot_update",' + encoded[1:]
+            self.frames_encoded += 1
+            for connection in recipients:
+                self._enqueue(connection, frame, seq)
+            return len(recipients)
+
+        # Micro-batching: η αλλαγή κωδικοποιείται τώρα, το frame στο flush
+        index = len(self._batch_updates)
+        self._batch_updates.append(encoded)
+        self._batch_seqs.append(seq)
+        for connection in recipients:
+            connection.batch.append(index)
+        self._batch_clients |= recipients
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush_batch)
+        return len(recipients)
+
+    def flush_batch(self):
+        """
+        ΤΙ ΚΑΝΕΙ: Κλείνει το τρέχον παράθυρο: ένα "spot_updates" frame ανά
+                   client. Clients με την ίδια λίστα αλλαγών παίρνουν το ΙΔΙΟ
+                   αντικείμενο frame (χτίζεται μία φορά από τα έτοιμα JSON).
+        """
+        self._flush_handle = None
+        updates, seqs, clients = self._batch_updates, self._batch_seqs, self._batch_clients
+        self._batch_updates, self._batch_seqs, self._batch_clients = [], [], set()
+        frames: Dict[Tuple[int, ...], Tuple[str, Optional[int]]] = {}
+        for connection in clients:
+            key = tuple(connection.batch)
+            connection.batch = []
+            if connection.closed or not key:
+                continue  # (κενό key: οι αλλαγές του αφαιρέθηκαν στο resume)
+            entry = frames.get(key)
+            if entry is None:
+                frame = '{"type":"spot_updates","updates":[' + ",".join(updates[i] for i in key) + "]}"
+                entry = (frame, max((seqs[i] for i in key if seqs[i] is not None), default=None))
+                frames[key] = entry
+                self.frames_encoded += 1
+            self._enqueue(connection, *entry)
+
+    async def _writer(self, connection: ClientConnection):
+        """ΤΙ ΚΑΝΕΙ: Στέλνει τα frames της ουράς ενός client, ένα-ένα, με timeout."""
+        websocket = connection.websocket
+        while True:
+            frame, _ = await connection.queue.get()
+            try:
+                await asyncio.wait_for(websocket.send_text(frame), timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                self.slow_dropped += 1
+                logger.warning(f"Dropping slow WebSocket client {websocket.client}: send timed out")
+                self._drop(connection)
+                return
+            except Exception as e:
+                # Ο client αποσυνδέθηκε - το /ws endpoint θα κάνει unregister
+                self.send_failures += 1
+                logger.debug(f"WebSocket send failed: {e}")
+                self._drop(connection)
+                return
+
+    def _drop(self, connection: ClientConnection, code: int = SLOW_CLIENT_CLOSE_CODE):
+        """
+        ΤΙ ΚΑΝΕΙ: Αφαιρεί έναν αργό/νεκρό client και κλείνει το socket στο
+                   παρασκήνιο (το close μπορεί κι αυτό να "κολλήσει").
+        """
+        if connection.closed:
+            return
+        self.connections.pop(connection.websocket, None)
+        self._forget(connection)
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        task = asyncio.create_task(self._close(connection.websocket, code), name="ws_close")
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    def ping_round(self) -> int:
+        """
+        ΤΙ ΚΑΝΕΙ: Ένας γύρος heartbeat: κλείνει όσους δεν έστειλαν τίποτα για
+                   WS_PING_TIMEOUT_S και στέλνει σε όλους τους άλλους το ΙΔΙΟ
+                   {"type": "ping"} frame.
+        ΕΠΙΣΤΡΕΦΕΙ: Πόσες συνδέσεις έκλεισαν.
+        """
+        now = time.monotonic()
+        frame = encode({"type": "ping", "ts": int(time.time() * 1000)})
+        reaped = 0
+        for connection in list(self.connections.values()):
+            # Οι SSE clients (χωρίς writer) δεν μπορούν να απαντήσουν - το
+            # ping τους κρατά απλά ανοιχτή τη σύνδεση μέσα από proxies
+            if connection.writer is not None and now - connection.last_seen > settings.WS_PING_TIMEOUT_S:
+                reaped += 1
+                self._drop(connection, IDLE_CLIENT_CLOSE_CODE)
+            else:
+                self._enqueue(connection, frame)
+        self.idle_reaped += reaped
+        return reaped
+
+    async def run_heartbeat(self, heartbeat: Optional[Callable[[], None]] = None):
+        """
+        ΤΙ ΚΑΝΕΙ: Ατέρμονος βρόχος: ένας ping_round() κάθε WS_PING_INTERVAL_S.
+        ΚΑΛΕΙΤΑΙ ΑΠΟ: main.py ως supervised task.
+        ΠΑΡΑΜΕΤΡΟΙ: heartbeat - καλείται σε κάθε γύρο (για το /health)
+        """
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL_S)
+            reaped = self.ping_round()
+            if reaped:
+                logger.info(f"Closed {reaped} unresponsive WebSocket clients")
+            if heartbeat:
+                heartbeat()
+
+    async def shutdown(self):
+        """ΤΙ ΚΑΝΕΙ: Σταματά όλους τους writers (τερματισμός εφαρμογής)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for websocket in list(self.connections):
+            await self.unregister(websocket)
+
+    def stats(self) -> Dict:
+        """ΤΙ ΚΑΝΕΙ: Μετρικές για το /metrics/ingestion endpoint."""
+        return {
+            "connected": len(self.connections),
+            "queued_messages": sum(c.queue.qsize() for c in self.connections.values()),
+            "unfiltered": len(self.unfiltered),
+            "channels": len(self.channels),
+            **self.viewports.stats(),
+            "published": self.published,
+            "frames_encoded": self.frames_encoded,
+            "frames_queued": self.frames_queued,
+            "batch_window_ms": int(self.batch_window * 1000),
+            "slow_dropped": self.slow_dropped,
+            "send_failures": self.send_failures,
+            "dropped_messages": self.dropped_messages,
+            "rejected": self.rejected,
+            "idle_reaped": self.idle_reaped,
+            "distinct_ips": len(self.per_ip),
+            "last_seq": self.last_seq,
+            "replay_buffered": len(self.replay),
+            "resumed": self.resumed,
+            "snapshots_required": self.snapshots_required,
+        }
+
+
+# Ένα instance ανά process - το χρησιμοποιούν ο MQTT consumer και το /ws endpoint
+websocket_broadcaster = WebSocketBroadcaster()
@@ -1,6 +1,7 @@
+import json
 import random
 import time
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import signal
 import sys
 import os
@@ -9,9 +10,15 @@ import paho.mqtt.client as mqtt
 # ---------- CONFIG ----------
 BROKER_HOST = os.getenv("MQTT_HOST", "localhost")
 BROKER_PORT = int(os.getenv("MQTT_PORT", "1883"))
-CITIES: List[str] = ["Athens", "Larissa"]
+# Each spot belongs to ONE city, as in the seed data (ops/ps-init.sql):
+# ids 1-40 are in Athens, 41-44 in Larissa. The backend rejects readings whose
+# topic city does not match the spot's registered city.
+SPOT_CITY_RANGES: List[Tuple[int, int, str]] = [(1, 40, "Athens"), (41, 44, "Larissa")]
+SPOT_CITIES: Dict[int, str] = {
+    spot_id: city for first, last, city in SPOT_CITY_RANGES for spot_id in range(first, last + 1)
+}
 SPOT_ID_MIN = 1
-SPOT_ID_MAX = 24
+SPOT_ID_MAX = 44
 
 # send 8 random spot updates every INTERVAL_SECONDS
 INTERVAL_SECONDS = 3
@@ -20,15 +27,20 @@ BATCH_SIZE = 3
 # Statuses the backend accepts
 STATUSES: List[str] = ["Available", "Occupied", "Reserved", "Maintenance"]
 
-# True => publish {"status":"Occupied"}; False => publish "Occupied"
+# True => publish {"status":"Occupied","ts":<ms>,"seq":<n>}; False => publish "Occupied"
 USE_JSON_PAYLOAD = False
 
+# True => one message per city on 'parking/<City>/batch' carrying a JSON array
+# [[spot_id, status, ts_ms], ...] (gateway mode); False => one message per spot
+USE_BATCH_TOPIC = False
+
 # QoS / retain options
 QOS = 0
 RETAIN = False
 
 rng = random.Random()
 last_status: Dict[int, str] = {}  # keep last status to prefer changes
+next_seq: Dict[int, int] = {}     # per-sensor sequence number (lets the backend drop late messages)
 
 def choose_new_status(spot_id: int) -> str:
     """Prefer a different status from the last one to exercise your cache path."""
@@ -39,12 +51,29 @@ def choose_new_status(spot_id: int) -> str:
         return prev
     return rng.choice(choices)
 
-def build_payload(status: str) -> str:
+def build_payload(spot_id: int, status: str) -> str:
     if USE_JSON_PAYLOAD:
         # The consumer already supports this shape
-        return f'{{"status":"{status}"}}'
+        seq = next_seq[spot_id] = next_seq.get(spot_id, 0) + 1
+        return json.dumps({"status": status, "ts": int(time.time() * 1000), "seq": seq})
     return status
 
+def publish_batches(client, spot_ids: List[int]) -> None:
+    """Gateway mode: group the updates per city and publish one array per city."""
+    by_city: Dict[str, list] = {}
+    now_ms = int(time.time() * 1000)
+    for spot_id in spot_ids:
+        status = choose_new_status(spot_id)
+        by_city.setdefault(SPOT_CITIES[spot_id], []).append([spot_id, status, now_ms])
+        last_status[spot_id] = status
+    for city, readings in by_city.items():
+        topic = f"parking/{city}/batch"
+        result = client.publish(topic, payload=json.dumps(readings), qos=QOS, retain=RETAIN)
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            print(f"[MQTT] Publish failed rc={result.rc} topic={topic}")
+        else:
+            print(f"[PUB] {topic} -> {len(readings)} readings")
+
 def on_connect(client, userdata, flags, rc):
     print(f"[MQTT] Connected (rc={rc})" if rc == 0 else f"[MQTT] Connect failed (rc={rc})")
 
@@ -95,10 +124,15 @@ def run():
             # pick unique spot IDs for this batch
             spot_ids = rng.sample(range(SPOT_ID_MIN, SPOT_ID_MAX + 1),
                                   k=min(BATCH_SIZE, SPOT_ID_MAX - SPOT_ID_MIN + 1))
+            if USE_BATCH_TOPIC:
+                publish_batches(client, spot_ids)
+                time.sleep(INTERVAL_SECONDS)
+                continue
+
             for spot_id in spot_ids:
-                city = rng.choice(CITIES)
+                city = SPOT_CITIES[spot_id]
                 status = choose_new_status(spot_id)
-                payload = build_payload(status)
+                payload = build_payload(spot_id, status)
                 topic = f"parking/{city}/{spot_id}/status"
 
                 # publish
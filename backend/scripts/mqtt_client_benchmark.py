@@ -0,0 +1,148 @@
+"""
+=======================================================================
+mqtt_client_benchmark.py - Σύγκριση των Δύο Τρόπων Λήψης MQTT
+=======================================================================
+
+ΤΙ ΚΑΝΕΙ ΑΥΤΟ ΤΟ ΑΡΧΕΙΟ:
+    Μετράει πόσα μηνύματα το δευτερόλεπτο φτάνουν από τον broker σε ένα
+    asyncio task, με τους δύο τρόπους που υποστηρίζει ο MQTTConsumer:
+    - paho (MQTT_CLIENT=paho): network thread + call_soon_threadsafe
+      ανά μήνυμα
+    - aiomqtt (MQTT_CLIENT=aiomqtt): λήψη μέσα στο event loop, με
+      "άδειασμα" της ουράς σε ομάδες (όπως στο mqtt_native_client.py)
+
+ΓΙΑΤΙ ΥΠΑΡΧΕΙ:
+    Μετράει ΜΟΝΟ τη μεταφορά (broker → asyncio task), χωρίς βάση ή Redis.
+    Έτσι φαίνεται το κόστος "γεφύρωσης" ανά μήνυμα που πληρώνει ο
+    consumer πριν καν ξεκινήσει το parsing.
+
+ΠΩΣ ΤΡΕΧΕΙ (χρειάζεται broker σε λειτουργία, από τον φάκελο backend/):
+    MQTT_HOST=localhost python scripts/mqtt_client_benchmark.py [μηνύματα]
+
+ΣΥΝΕΡΓΑΖΕΤΑΙ ΜΕ:
+    app/mqtt_consumer.py (paho), app/mqtt_native_client.py (aiomqtt)
+=======================================================================
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+
+import paho.mqtt.client as mqtt
+
+# ---------- CONFIG ----------
+BROKER_HOST = os.getenv("MQTT_HOST", "localhost")
+BROKER_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+QOS = int(os.getenv("MQTT_QOS", "0"))
+DRAIN_MAX = int(os.getenv("MQTT_NATIVE_DRAIN_MAX", "500"))
+
+
+def publish_all(topic: str) -> None:
+    """
+    ΤΙ ΚΑΝΕΙ: Στέλνει MESSAGES μικρά μηνύματα κατάστασης από ΞΕΧΩΡΙΣΤΟ
+              client (καλείται σε thread, ώστε να μη φορτώνει το event loop).
+    """
+    client = mqtt.Client()
+    client.connect(BROKER_HOST, BROKER_PORT, 60)
+    client.loop_start()
+    for i in range(MESSAGES):
+        info = client.publish(topic, payload=b"Occupied" if i % 2 else b"Available", qos=QOS)
+        if QOS:
+            info.wait_for_publish()
+    client.loop_stop()
+    client.disconnect()
+
+
+async def bench_paho(topic: str) -> float:
+    """
+    ΤΙ ΚΑΝΕΙ: Λήψη με paho - κάθε μήνυμα περνά από το network thread
+              στο event loop με call_soon_threadsafe.
+    ΕΠΙΣΤΡΕΦΕΙ: Δευτερόλεπτα από το πρώτο ως το τελευταίο μήνυμα.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    subscribed = threading.Event()
+
+    client = mqtt.Client()
+    client.on_connect = lambda c, u, f, rc: c.subscribe(topic, qos=QOS)
+    client.on_subscribe = lambda c, u, mid, granted: subscribed.set()
+    client.on_message = lambda c, u, msg: loop.call_soon_threadsafe(queue.put_nowait, msg)
+    client.connect(BROKER_HOST, BROKER_PORT, 60)
+    client.loop_start()
+    await loop.run_in_executor(None, subscribed.wait)
+
+    publisher = loop.run_in_executor(None, publish_all, topic)
+    received = 0
+    started = None
+    while received < MESSAGES:
+        await queue.get()
+        started = started or time.perf_counter()
+        received += 1
+    elapsed = time.perf_counter() - started
+    await publisher
+    client.loop_stop()
+    client.disconnect()
+    return elapsed
+
+
+async def bench_aiomqtt(topic: str) -> float:
+    """
+    ΤΙ ΚΑΝΕΙ: Λήψη με aiomqtt μέσα στο event loop, αδειάζοντας την ουρά
+              σε ομάδες έως DRAIN_MAX.
+    ΕΠΙΣΤΡΕΦΕΙ: Δευτερόλεπτα από το πρώτο ως το τελευταίο μήνυμα.
+    ΠΕΤΑΕΙ ΣΦΑΛΜΑ: ImportError αν δεν είναι εγκατεστημένο το aiomqtt.
+    """
+    import aiomqtt
+
+    captured = {}
+
+    class CapturedQueue(asyncio.Queue):
+        # Κρατάμε την ουρά του aiomqtt για να την αδειάζουμε με get_nowait()
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            captured["queue"] = self
+
+    loop = asyncio.get_running_loop()
+    async with aiomqtt.Client(BROKER_HOST, BROKER_PORT) as client:
+        async with client.messages(queue_class=CapturedQueue) as messages:
+            await client.subscribe(topic, qos=QOS)
+            publisher = loop.run_in_executor(None, publish_all, topic)
+            received = 0
+            started = None
+            async for _first in messages:
+                started = started or time.perf_counter()
+                received += 1
+                # Ίδιο "άδειασμα" σε ομάδες με το app/mqtt_native_client.py
+                drained = 1
+                while drained < DRAIN_MAX:
+                    try:
+                        captured["queue"].get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                    drained += 1
+                    received += 1
+                if received >= MESSAGES:
+                    break
+            elapsed = time.perf_counter() - started
+            await publisher
+    return elapsed
+
+
+async def main() -> None:
+    """ΤΙ ΚΑΝΕΙ: Τρέχει τις δύο μετρήσεις (κάθε μία σε δικό της topic) και τυπώνει msg/s."""
+    print(f"Broker: {BROKER_HOST}:{BROKER_PORT} | messages={MESSAGES} QoS={QOS} drain_max={DRAIN_MAX}")
+    for name, bench in (("paho (thread bridge)", bench_paho), ("aiomqtt (native)", bench_aiomqtt)):
+        topic = f"benchmark/{uuid.uuid4().hex}"
+        try:
+            elapsed = await bench(topic)
+        except ImportError as e:
+            print(f"{name:22s} skipped: {e}")
+            continue
+        print(f"{name:22s} {elapsed:7.3f}s  {MESSAGES / elapsed:10.0f} msg/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""
+Tests για το message_dedupe.py (DuplicateFilter).
+"""
+
+import time
+from datetime import datetime
+
+from app.message_dedupe import DuplicateFilter
+from app.sensor_payloads import SensorReading
+
+TOPIC = "parking/Athens/7/status"
+
+
+def test_plain_status_change_back_is_not_a_duplicate():
+    """Occupied → Available → Occupied χωρίς ts/seq: και τα τρία είναι νέα γεγονότα."""
+    dedupe = DuplicateFilter(capacity=100, ttl_s=60)
+    results = [
+        dedupe.is_redelivery(TOPIC, status.encode(), [SensorReading(7, status, "Athens")])
+        for status in ("Occupied", "Available", "Occupied")
+    ]
+    assert results == [False, False, False]
+
+
+def test_redelivery_with_identity_is_dropped():
+    dedupe = DuplicateFilter(capacity=100, ttl_s=60)
+    payload = b'{"status":"Occupied","seq":5}'
+    readings = [SensorReading(7, "Occupied", "Athens", seq=5)]
+    assert dedupe.is_redelivery(TOPIC, payload, readings) is False
+    assert dedupe.is_redelivery(TOPIC, payload, readings) is True
+    assert dedupe.duplicates == 1
+
+
+def test_same_payload_on_other_topic_is_not_a_duplicate():
+    dedupe = DuplicateFilter(capacity=100, ttl_s=60)
+    readings = [SensorReading(7, "Occupied", "Athens", timestamp=datetime(2024, 1, 1))]
+    assert dedupe.is_redelivery(TOPIC, b"x", readings) is False
+    assert dedupe.is_redelivery("parking/Athens/8/status", b"x", readings) is False
+
+
+def test_entries_expire_after_ttl():
+    dedupe = DuplicateFilter(capacity=100, ttl_s=0.01)
+    assert dedupe.seen("key") is False
+    time.sleep(0.02)
+    assert dedupe.seen("key") is False
+    assert len(dedupe) == 1
+
+
+def test_capacity_evicts_oldest():
+    dedupe = DuplicateFilter(capacity=2, ttl_s=60)
+    for key in ("a", "b", "c"):
+        dedupe.seen(key)
+    assert dedupe.seen("a") is False
+    assert dedupe.seen("c") is True
+
+
+def test_zero_capacity_disables():
+    dedupe = DuplicateFilter(capacity=0, ttl_s=60)
+    assert dedupe.seen("a") is False
+    assert dedupe.seen("a") is False
@@ -0,0 +1,70 @@
+"""
+Tests για το sensor_payloads.py (ts, JSON/binary batches, NDJSON).
+"""
+
+import json
+import math
+from datetime import datetime
+
+import pytest
+
+from app.sensor_payloads import (
+    BINARY_RECORD,
+    SensorReading,
+    parse_batch_payload,
+    parse_batch_payload_counted,
+    parse_ndjson,
+    parse_timestamp,
+)
+
+
+def test_parse_timestamp_accepts_iso_and_empty():
+    assert parse_timestamp("2024-01-01T12:00:00") == datetime(2024, 1, 1, 12, 0)
+    assert parse_timestamp(None) is None
+    assert parse_timestamp(0) is None
+
+
+@pytest.mark.parametrize("value", [1e20, 2 ** 63, math.nan, "not a date"])
+def test_parse_timestamp_rejects_out_of_range(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_json_batch_skips_invalid_items():
+    payload = json.dumps([
+        {"spot_id": 1, "status": "Occupied", "seq": 3},
+        [2, "Available"],
+        {"spot_id": 3, "status": "Occupied", "ts": 1e20},
+        "garbage",
+    ]).encode()
+    readings, received = parse_batch_payload_counted(payload, "Athens")
+    assert readings == [SensorReading(1, "Occupied", "Athens", None, 3),
+                        SensorReading(2, "Available", "Athens")]
+    assert received == 4
+
+
+def test_json_batch_must_be_an_array():
+    with pytest.raises(ValueError):
+        parse_batch_payload(b'{"spot_id": 1}', "Athens")
+
+
+def test_binary_batch_skips_bad_records_but_counts_them():
+    payload = (BINARY_RECORD.pack(1, 1, 0)          # Occupied
+               + BINARY_RECORD.pack(2, 9, 0)        # άγνωστο status
+               + BINARY_RECORD.pack(3, 0, 2 ** 63))  # ts εκτός ορίων
+    readings, received = parse_batch_payload_counted(payload, "Athens")
+    assert readings == [SensorReading(1, "Occupied", "Athens")]
+    assert received == 3
+
+
+def test_unknown_payload_raises():
+    with pytest.raises(ValueError):
+        parse_batch_payload(b"\x00\x01", "Athens")
+
+
+def test_ndjson_counts_malformed_lines():
+    body = b'{"spot_id": 1, "status": "Occupied", "city": "Athens"}\n\nnot json\n[1, "Occupied"]\n'
+    readings, rejected, errors = parse_ndjson(body)
+    assert readings == [SensorReading(1, "Occupied", "Athens")]
+    assert rejected == 2
+    assert errors == ["line 3: malformed event", "line 4: malformed event"]
@@ -0,0 +1,57 @@
+"""
+Tests για το spot_state.py (SpotStateTracker.is_stale και no-op).
+"""
+
+from datetime import datetime, timedelta
+
+from app.spot_state import SpotStateTracker
+
+T0 = datetime(2024, 1, 1, 12, 0)
+
+
+def test_lower_seq_is_stale():
+    tracker = SpotStateTracker()
+    assert tracker.is_stale(7, None, 5) is False
+    assert tracker.is_stale(7, None, 4) is True
+    assert tracker.is_stale(7, None, 5) is True
+    assert tracker.is_stale(7, None, 6) is False
+    assert tracker.stale == 2
+
+
+def test_seq_watermark_is_per_spot():
+    tracker = SpotStateTracker()
+    assert tracker.is_stale(7, None, 5) is False
+    assert tracker.is_stale(8, None, 1) is False
+
+
+def test_seq_reset_with_newer_ts_is_a_reboot():
+    """Ο αισθητήρας μηδένισε το seq μετά από restart - αλλά το ts προχώρησε."""
+    tracker = SpotStateTracker()
+    assert tracker.is_stale(7, T0, 100) is False
+    assert tracker.is_stale(7, T0 + timedelta(minutes=1), 1) is False
+    assert tracker.last_seq[7] == 1
+    assert tracker.is_stale(7, T0 + timedelta(seconds=30), 0) is True
+
+
+def test_older_ts_without_seq_is_stale():
+    tracker = SpotStateTracker()
+    assert tracker.is_stale(7, T0, None) is False
+    assert tracker.is_stale(7, T0 - timedelta(seconds=1), None) is True
+    assert tracker.is_stale(7, T0, None) is False  # ίσο ts δεν είναι παλιό
+
+
+def test_messages_without_ts_or_seq_are_never_stale():
+    tracker = SpotStateTracker()
+    assert tracker.is_stale(7, T0, 5) is False
+    assert tracker.is_stale(7, None, None) is False
+    assert tracker.stale == 0
+
+
+def test_noop_and_forget():
+    tracker = SpotStateTracker()
+    tracker.seed({7: "Occupied"})
+    assert tracker.is_noop(7, "Occupied") is True
+    assert tracker.is_noop(7, "Available") is False
+    tracker.forget(7)
+    assert tracker.is_noop(7, "Occupied") is False
+    assert tracker.suppressed == 1
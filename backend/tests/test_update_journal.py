@@ -0,0 +1,81 @@
+"""
+Tests για το update_journal.py (UpdateJournal) - σε προσωρινό φάκελο.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+
+from app.update_journal import UpdateJournal
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("segment-"))
+
+
+def test_replay_returns_entries_of_previous_run(tmp_path):
+    journal = UpdateJournal(str(tmp_path), fsync_ms=0)
+    journal.append(1, "Occupied", "Athens", datetime(2024, 1, 1, 12, 0))
+    journal.append(2, "Available", "Larissa", None)
+    journal.close()
+
+    restarted = UpdateJournal(str(tmp_path), fsync_ms=0)
+    entries, last = restarted.replay()
+    assert entries == [(1, "Occupied", "Athens", datetime(2024, 1, 1, 12, 0)),
+                       (2, "Available", "Larissa", None)]
+    restarted.discard_through(last)
+    assert len(segment_files(tmp_path)) == 1  # μόνο το νέο (κενό) segment
+    restarted.close()
+
+
+def test_rotate_and_discard_remove_persisted_segments(tmp_path):
+    journal = UpdateJournal(str(tmp_path), fsync_ms=0)
+    journal.append(1, "Occupied", "Athens", None)
+    closed = journal.rotate()
+    journal.append(2, "Occupied", "Athens", None)
+    journal.discard_through(closed)
+    journal.close()
+
+    entries, _ = UpdateJournal(str(tmp_path), fsync_ms=0).replay()
+    assert [entry[0] for entry in entries] == [2]
+
+
+def test_discard_keeps_unreplayed_segments_of_previous_run(tmp_path):
+    """Flush πριν (ή χωρίς) replay: τα segments της προηγούμενης εκτέλεσης δεν σβήνονται."""
+    journal = UpdateJournal(str(tmp_path), fsync_ms=0)
+    journal.append(1, "Occupied", "Athens", None)
+    journal.close()
+
+    restarted = UpdateJournal(str(tmp_path), fsync_ms=0)
+    restarted.append(2, "Available", "Athens", None)
+    restarted.discard_through(restarted.rotate())
+    restarted.close()
+
+    entries, _ = UpdateJournal(str(tmp_path), fsync_ms=0).replay()
+    assert [entry[0] for entry in entries] == [1]
+
+
+def test_corrupt_last_line_is_skipped(tmp_path):
+    journal = UpdateJournal(str(tmp_path), fsync_ms=0)
+    journal.append(1, "Occupied", "Athens", None)
+    journal._file.write('{"spot_id": 2, "sta')
+    journal.close()
+
+    entries, _ = UpdateJournal(str(tmp_path), fsync_ms=0).replay()
+    assert [entry[0] for entry in entries] == [1]
+
+
+def test_append_schedules_timer_fsync_inside_event_loop(tmp_path):
+    """Μέσα σε event loop το fsync γίνεται από timer - και χωρίς επόμενο append."""
+    async def scenario():
+        journal = UpdateJournal(str(tmp_path), fsync_ms=10)
+        journal._last_sync = 0.0
+        journal.append(1, "Occupied", "Athens", None)
+        assert journal._sync_timer is not None
+        await asyncio.sleep(0.05)
+        assert journal._sync_timer is None
+        assert journal._sync_task is not None and journal._sync_task.done()
+        assert journal._last_sync > 0.0
+        journal.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+"""
+Tests για το viewport_index.py (ViewportIndex, parse_bbox).
+"""
+
+from app.viewport_index import BBox, ViewportIndex, parse_bbox
+
+ATHENS = BBox(37.97, 23.72, 37.99, 23.75)
+
+
+def test_match_returns_only_viewports_containing_the_point():
+    index = ViewportIndex(cell_deg=0.02, max_cells=100)
+    index.subscribe("a", ATHENS)
+    index.subscribe("b", BBox(39.62, 22.40, 39.65, 22.43))
+    assert index.match(37.98, 23.73) == {"a"}
+    assert index.match(39.63, 22.41) == {"b"}
+    assert index.match(38.50, 23.00) == set()
+
+
+def test_point_in_same_cell_but_outside_bbox_is_not_matched():
+    index = ViewportIndex(cell_deg=1.0, max_cells=100)
+    index.subscribe("a", ATHENS)
+    assert index.match(37.50, 23.50) == set()
+
+
+def test_wide_viewport_bypasses_the_grid():
+    index = ViewportIndex(cell_deg=0.02, max_cells=4)
+    index.subscribe("greece", BBox(34.8, 19.3, 41.8, 29.7))
+    assert index.wide == {"greece"}
+    assert index.cells == {}
+    assert index.match(37.98, 23.73) == {"greece"}
+
+
+def test_resubscribe_and_unsubscribe_clean_up_cells():
+    index = ViewportIndex(cell_deg=0.02, max_cells=100)
+    index.subscribe("a", ATHENS)
+    index.subscribe("a", BBox(39.62, 22.40, 39.65, 22.43))
+    assert index.match(37.98, 23.73) == set()
+    index.unsubscribe("a")
+    assert index.stats() == {"viewports": 0, "wide_viewports": 0, "cells": 0}
+
+
+def test_parse_bbox_rejects_invalid():
+    assert parse_bbox({"swLat": 37.97, "swLng": 23.72, "neLat": 37.99, "neLng": 23.75}) == ATHENS
+    assert parse_bbox({"swLat": 38, "swLng": 23.72, "neLat": 37, "neLng": 23.75}) is None
+    assert parse_bbox({"swLat": "nan", "swLng": 0, "neLat": 1, "neLng": 1}) is None
+    assert parse_bbox({"swLat": 1}) is None
@@ -0,0 +1,106 @@
+"""
+Tests για το WebSocketBroadcaster.resume (websocket_broadcaster.py) με ψεύτικα sockets.
+
+Οι συνδέσεις καταχωρούνται με writer=False (όπως το SSE), ώστε τα frames
+να μένουν στην ουρά και να τα διαβάζει το test.
+"""
+
+import asyncio
+import json
+
+from app.websocket_broadcaster import WebSocketBroadcaster
+
+
+class FakeSocket:
+    client = ("127.0.0.1", 0)
+
+    async def send_text(self, frame):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+def drain(connection):
+    """ΕΠΙΣΤΡΕΦΕΙ: Τα μηνύματα της ουράς (ως dict) με τη σειρά που θα στέλνονταν."""
+    messages = []
+    while not connection.queue.empty():
+        frame, _ = connection.queue.get_nowait()
+        messages.append(json.loads(frame))
+    return messages
+
+
+def update(seq, spot_id=1):
+    return {"spot_id": spot_id, "status": "Occupied", "city": "Athens", "seq": seq}
+
+
+def spot_seqs(messages):
+    return [u["seq"] for m in messages if m["type"] == "spot_updates" for u in m["updates"]]
+
+
+def test_resume_replays_missed_updates():
+    broadcaster = WebSocketBroadcaster(batch_window_ms=0, replay_size=10)
+    for seq in (1, 2, 3):
+        broadcaster.publish(update(seq))
+    connection = broadcaster.register(FakeSocket(), writer=False)
+    drain(connection)
+
+    assert broadcaster.resume(connection, 1) is True
+    messages = drain(connection)
+    assert spot_seqs(messages) == [2, 3]
+    assert messages[-1] == {"type": "resumed", "seq": 3, "missed": 2}
+
+
+def test_resume_outside_buffer_requires_snapshot():
+    broadcaster = WebSocketBroadcaster(batch_window_ms=0, replay_size=2)
+    for seq in (1, 2, 3, 4):
+        broadcaster.publish(update(seq))
+    connection = broadcaster.register(FakeSocket(), writer=False)
+    drain(connection)
+
+    assert broadcaster.resume(connection, 1) is False
+    assert drain(connection) == [{"type": "snapshot_required", "seq": 4}]
+    # seq μεγαλύτερο από το δικό μας (π.χ. restart του server)
+    assert broadcaster.resume(connection, 9) is False
+
+
+def test_resume_filters_by_channel():
+    broadcaster = WebSocketBroadcaster(batch_window_ms=0, replay_size=10)
+    broadcaster.publish(update(1, spot_id=1), channels=["city:Athens"])
+    broadcaster.publish(update(2, spot_id=2), channels=["city:Larissa"])
+    connection = broadcaster.register(FakeSocket(), writer=False)
+    assert broadcaster.subscribe(connection, ["city:Larissa"])
+    drain(connection)
+
+    broadcaster.resume(connection, 0)
+    assert spot_seqs(drain(connection)) == [2]
+
+
+def test_updates_queued_before_resume_are_not_delivered_twice():
+    """Αλλαγή ανάμεσα στο hello και το resume: φτάνει ΜΙΑ φορά, μέσω του resume."""
+    broadcaster = WebSocketBroadcaster(batch_window_ms=0, replay_size=10)
+    broadcaster.publish(update(1))
+    connection = broadcaster.register(FakeSocket(), writer=False)
+    broadcaster.publish(update(2))
+
+    broadcaster.resume(connection, 0)
+    messages = drain(connection)
+    assert messages[0] == {"type": "hello", "seq": 1}
+    assert spot_seqs(messages) == [1, 2]
+    assert messages[-1]["type"] == "resumed"
+
+
+def test_batched_updates_before_resume_are_not_delivered_twice():
+    async def scenario():
+        broadcaster = WebSocketBroadcaster(batch_window_ms=1000, replay_size=10)
+        connection = broadcaster.register(FakeSocket(), writer=False)
+        broadcaster.publish(update(1))
+
+        broadcaster.resume(connection, 0)
+        broadcaster.publish(update(2))
+        broadcaster.flush_batch()
+        return drain(connection)
+
+    messages = asyncio.run(scenario())
+    assert spot_seqs(messages) == [1, 2]
+    assert [m["type"] for m in messages] == ["hello", "spot_updates", "resumed", "spot_updates"]
@@ -76,12 +76,13 @@ export default function MainLayout() {
         neLng: 23.9,  // Ανατολικό γεωγραφικό μήκος
     });
 
+    // Real-time updates από WebSocket (μόνο για θέσεις μέσα στα bounds)
+    // snapshotVersion: αυξάνεται όταν ο server ζητά πλήρη επαναφόρτωση
+    const { spots: liveSpots, snapshotVersion } = useLiveSpots(bounds);
+
     // Ανάκτηση θέσεων από REST API βάσει viewport
     // undefined status = παίρνουμε ΟΛΑ τα statuses (όχι μόνο Available)
-    const viewportSpots = useViewportSpots(API_BASE, bounds, undefined);
-
-    // Real-time updates από WebSocket
-    const { spots: liveSpots } = useLiveSpots();
+    const viewportSpots = useViewportSpots(API_BASE, bounds, undefined, 200, snapshotVersion);
 
     // --- MERGE LOGIC ---
     // Συγχώνευση: viewport (πλήρη δεδομένα) + live (νέα statuses)
@@ -20,8 +20,24 @@
  *   - Τρίτη: 2000ms ... μέχρι max 10 δευτερόλεπτα
  *   Αποφεύγει flood of reconnect requests αν ο server είναι down.
  *
+ * VIEWPORT:
+ *   Αν δοθούν bounds, στέλνονται στον server ({"type": "viewport", ...})
+ *   σε κάθε σύνδεση και σε κάθε κίνηση του χάρτη - ο server στέλνει
+ *   μόνο αλλαγές θέσεων που βρίσκονται μέσα στο ορατό τμήμα.
+ *
+ * HEARTBEAT:
+ *   Ο server στέλνει περιοδικά {"type": "ping"} και περιμένει {"type": "pong"}·
+ *   όποιος δεν απαντά θεωρείται νεκρός και αποσυνδέεται.
+ *
+ * ΣΥΝΕΧΙΣΗ ΜΕΤΑ ΑΠΟ ΕΠΑΝΑΣΥΝΔΕΣΗ (seq):
+ *   Κάθε αλλαγή έχει αύξοντα αριθμό "seq". Κρατάμε τον μεγαλύτερο που
+ *   είδαμε και μετά από επανασύνδεση στέλνουμε {"type": "resume", "seq"}:
+ *   ο server στέλνει μόνο όσες αλλαγές χάσαμε. Αν έχουμε χάσει πάρα
+ *   πολλές απαντά "snapshot_required" → αυξάνεται το snapshotVersion και
+ *   το useViewportSpots ξαναφορτώνει τις θέσεις από το REST API.
+ *
  * ΧΡΗΣΗ:
- *   const { spots, connected } = useLiveSpots();
+ *   const { spots, connected, snapshotVersion } = useLiveSpots(bounds);
  *   // spots = [{ id: 5, status: "Occupied" }, ...]
  *   // connected = true αν WebSocket είναι ανοιχτό
  *
@@ -36,6 +52,14 @@ import { useEffect, useRef, useState } from "react";
 /** LiveSpot - Ελάχιστα δεδομένα από WebSocket (id + νέα κατάσταση) */
 export type LiveSpot = { id: number; status: string };
 
+/** Bounds - Τα όρια του ορατού τμήματος χάρτη (ίδια με το in_viewport API) */
+type Bounds = { swLat: number; swLng: number; neLat: number; neLng: number };
+
+// Απαντήσεις του server σε εντολές του client - δεν είναι ενημερώσεις θέσεων
+const CONTROL_TYPES = new Set([
+    "viewport_ack", "subscribed", "echo", "error", "hello", "resumed", "snapshot_required", "ping",
+]);
+
 // URL του WebSocket endpoint
 // Αν υπάρχει VITE_WS_URL στο .env αρχείο, χρησιμοποιεί αυτό
 // Αλλιώς: ws://localhost:8000/ws (ws = WebSocket protocol, όχι http)
@@ -85,46 +109,91 @@ function coerceToLiveSpot(obj: any): LiveSpot | null {
     return null;  // Δεν αναγνωρίστηκε μορφή
 }
 
+/**
+ * coerceToLiveSpots - Όπως το coerceToLiveSpot, αλλά για ολόκληρο frame.
+ *
+ * Ο server μαζεύει τις αλλαγές ~100ms σε ΕΝΑ frame:
+ *   { type: "spot_updates", updates: [{ spot_id: 5, status: "Occupied" }, ...] }
+ * Τα υπόλοιπα μηνύματα περιέχουν μία θέση (βλ. coerceToLiveSpot).
+ */
+function coerceToLiveSpots(obj: any): LiveSpot[] {
+    if (obj && obj.type === "spot_updates" && Array.isArray(obj.updates)) {
+        return obj.updates
+            .map(coerceToLiveSpot)
+            .filter((s: LiveSpot | null): s is LiveSpot => s !== null);
+    }
+    const single = coerceToLiveSpot(obj);
+    return single ? [single] : [];
+}
+
+/**
+ * maxSeq - Ο μεγαλύτερος αριθμός "seq" ενός frame (μίας ή πολλών αλλαγών).
+ */
+function maxSeq(obj: any): number | null {
+    const items = obj?.type === "spot_updates" && Array.isArray(obj.updates) ? obj.updates : [obj];
+    let max: number | null = null;
+    for (const item of items) {
+        if (typeof item?.seq === "number" && (max === null || item.seq > max)) max = item.seq;
+    }
+    return max;
+}
+
+/** ParsedMessage - Οι θέσεις ενός frame + (για μηνύματα ελέγχου) το ίδιο το μήνυμα */
+type ParsedMessage = { spots: LiveSpot[]; seq: number | null; control?: any };
+
 /**
  * parseMessage - Αναλύει το raw WebSocket μήνυμα.
  *
  * ΤΙ ΚΑΝΕΙ: Το WebSocket μήνυμα έρχεται ως string (JSON) ή object.
- *           Το αναλύουμε και καλούμε coerceToLiveSpot.
+ *           Το αναλύουμε και καλούμε coerceToLiveSpots.
+ * ΕΠΙΣΤΡΕΦΕΙ: null για άγνωστη μορφή· για μηνύματα ελέγχου (π.χ.
+ *             viewport_ack) spots = [] και control = το μήνυμα.
  */
-function parseMessage(data: any): LiveSpot | null {
+function parseMessage(data: any): ParsedMessage | null {
+    let obj: any = data;
     if (typeof data === "string") {
         try {
             // String → JSON.parse → JavaScript object
-            const parsed = JSON.parse(data);
-            return coerceToLiveSpot(parsed);
+            obj = JSON.parse(data);
         } catch (e) {
             console.warn('Failed to parse JSON from string:', data, e);
             return null;
         }
     }
-    if (typeof data === "object" && data !== null) {
-        console.log('Processing object data:', data);
-        return coerceToLiveSpot(data);
+    if (typeof obj !== "object" || obj === null) {
+        console.warn('Unhandled message type:', typeof data, data);
+        return null;
     }
-    console.warn('Unhandled message type:', typeof data, data);
-    return null;
+    // Απαντήσεις σε εντολές - δεν είναι ενημερώσεις θέσεων
+    if (CONTROL_TYPES.has(obj.type)) {
+        return { spots: [], seq: null, control: obj };
+    }
+    const spots = coerceToLiveSpots(obj);
+    return spots.length ? { spots, seq: maxSeq(obj) } : null;
 }
 
 /**
  * useLiveSpots - Custom hook για real-time WebSocket updates.
  *
+ * ΠΑΡΑΜΕΤΡΟΙ:
+ *   bounds - (προαιρετικό) ορατό τμήμα χάρτη· χωρίς αυτό λαμβάνουμε όλες τις αλλαγές
+ *
  * ΕΠΙΣΤΡΕΦΕΙ:
  *   spots     - λίστα LiveSpot με τα πιο πρόσφατα statuses
  *   connected - true αν η WebSocket σύνδεση είναι ανοιχτή
+ *   snapshotVersion - αυξάνεται όταν πρέπει να ξαναφορτωθούν οι θέσεις από το REST API
  *   wsUrl     - το WebSocket URL (για debugging)
  */
-export function useLiveSpots() {
+export function useLiveSpots(bounds?: Bounds) {
     // spots: λίστα spot updates (ενημερώνεται όταν έρχονται νέα μηνύματα)
     const [spots, setSpots] = useState<LiveSpot[]>([]);
 
     // connected: κατάσταση WebSocket σύνδεσης
     const [connected, setConnected] = useState(false);
 
+    // snapshotVersion: αυξάνεται σε κάθε "snapshot_required" του server
+    const [snapshotVersion, setSnapshotVersion] = useState(0);
+
     // useRef: αποθηκεύει τιμές που ΔΕΝ επιφέρουν re-render όταν αλλάζουν
     // (σε αντίθεση με useState που κάνει re-render)
 
@@ -143,6 +212,21 @@ export function useLiveSpots() {
     // isMountedRef: αν το component είναι ακόμα mounted (αποτρέπει memory leaks)
     const isMountedRef = useRef(true);
 
+    // boundsRef: τα τρέχοντα bounds - στέλνονται και μετά από επανασύνδεση
+    const boundsRef = useRef<Bounds | undefined>(bounds);
+    boundsRef.current = bounds;
+
+    // lastSeqRef: ο μεγαλύτερος αριθμός seq που έχουμε λάβει (null = ποτέ δεν συνδεθήκαμε)
+    const lastSeqRef = useRef<number | null>(null);
+
+    /** sendViewport - Στέλνει τα τρέχοντα bounds στον server (αν είναι ανοιχτή η σύνδεση) */
+    const sendViewport = () => {
+        const ws = wsRef.current;
+        const b = boundsRef.current;
+        if (!ws || ws.readyState !== WebSocket.OPEN || !b) return;
+        ws.send(JSON.stringify({ type: "viewport", ...b }));
+    };
+
     // Ρύθμιση/καθαρισμός isMountedRef
     useEffect(() => {
         isMountedRef.current = true;
@@ -174,23 +258,54 @@ export function useLiveSpots() {
                 if (!isMountedRef.current) return;
                 setConnected(true);
                 backoffRef.current = 500;  // Reset backoff - ξεκινάμε πάλι από 500ms
+                sendViewport();            // Ο server "ξεχνά" το viewport σε κάθε νέα σύνδεση
             };
 
             // Όταν λάβουμε μήνυμα
             ws.onmessage = (evt) => {
                 if (!isMountedRef.current) return;
 
-                // Αναλύουμε το μήνυμα
+                // Αναλύουμε το μήνυμα (ένα frame μπορεί να έχει πολλές θέσεις)
                 const parsed = parseMessage(evt.data);
                 if (!parsed) {
                     console.warn('Failed to parse WebSocket message:', evt.data);
                     return;
                 }
+                const control = parsed.control;
+                if (control?.type === "ping") {
+                    // Heartbeat: χωρίς απάντηση ο server κλείνει τη σύνδεση ως "νεκρή"
+                    ws.send(JSON.stringify({ type: "pong" }));
+                    return;
+                }
+                if (control?.type === "hello") {
+                    // Πρώτη σύνδεση: ξεκινάμε από το τρέχον seq του server.
+                    // Επανασύνδεση: ζητάμε όσες αλλαγές χάσαμε (μετά το viewport)
+                    if (lastSeqRef.current === null) {
+                        lastSeqRef.current = Number(control.seq) || 0;
+                    } else {
+                        ws.send(JSON.stringify({ type: "resume", seq: lastSeqRef.current }));
+                    }
+                    return;
+                }
+                if (control?.type === "snapshot_required") {
+                    // Χάσαμε πάρα πολλές αλλαγές: πετάμε τα live statuses και
+                    // ξαναφορτώνουμε την τρέχουσα κατάσταση από το REST API
+                    lastSeqRef.current = Number(control.seq) || 0;
+                    byIdRef.current = new Map();
+                    setSpots([]);
+                    setSnapshotVersion((v) => v + 1);
+                    return;
+                }
+                if (!parsed.spots.length) return;  // Άλλο μήνυμα ελέγχου
 
-                // Ενημερώνουμε τον Map (id → latest status)
+                if (parsed.seq !== null && parsed.seq > (lastSeqRef.current ?? 0)) {
+                    lastSeqRef.current = parsed.seq;
+                }
+
+                // Ενημερώνουμε τον Map (id → latest status) - ΕΝΑ re-render ανά frame
                 // Αν το ίδιο spot στείλει πολλά updates, κρατάμε μόνο το τελευταίο
                 const next = new Map(byIdRef.current);
-                next.set(parsed.id, parsed);
+                for (const spot of parsed.spots) next.set(spot.id, spot);
                 byIdRef.current = next;
 
                 // Μετατρέπουμε Map → Array και ενημερώνουμε React state
@@ -239,5 +354,10 @@ export function useLiveSpots() {
         };
     }, []);  // [] = τρέχει μία φορά
 
-    return { spots, connected, wsUrl: WS_ENDPOINT };
+    // Κάθε φορά που κουνιέται ο χάρτης, ενημερώνουμε τον server
+    useEffect(() => {
+        sendViewport();
+    }, [bounds?.swLat, bounds?.swLng, bounds?.neLat, bounds?.neLng]);
+
+    return { spots, connected, snapshotVersion, wsUrl: WS_ENDPOINT };
 }
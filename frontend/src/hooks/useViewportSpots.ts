@@ -43,6 +43,8 @@ type Bounds = { swLat: number; swLng: number; neLat: number; neLng: number };
  *   bounds  - τα όρια του ορατού χάρτη
  *   status  - φίλτρο κατάστασης (προαιρετικό)
  *   limit   - μέγιστος αριθμός θέσεων (default: 200)
+ *   refreshKey - όταν αλλάζει, οι θέσεις ξαναφορτώνονται (π.χ. μετά από
+ *                "snapshot_required" του WebSocket)
  *
  * ΕΠΙΣΤΡΕΦΕΙ: Λίστα ParkingSpot εντός των bounds
  */
@@ -50,7 +52,8 @@ export function useViewportSpots(
     apiBase = "http://localhost:8000/api",
     bounds: Bounds,
     status: "Available" | "Occupied" | "Reserved" | "Maintenance" | undefined = undefined,
-    limit = 200
+    limit = 200,
+    refreshKey = 0
 ) {
     // spots: οι θέσεις που φαίνονται τώρα στον χάρτη
     const [spots, setSpots] = useState<ParkingSpot[]>([]);
@@ -101,7 +104,7 @@ export function useViewportSpots(
 
         // Cleanup: αν έρθει νέο request πριν τελειώσει αυτό, το "ακυρώνουμε"
         return () => { cancelled = true; };
-    }, [apiBase, qs]);  // Τρέχει ξανά όταν αλλάζει qs (= νέα bounds)
+    }, [apiBase, qs, refreshKey]);  // Τρέχει ξανά όταν αλλάζει qs (= νέα bounds) ή refreshKey
 
     return spots;
 }